@@ -23,6 +23,19 @@ NUM_PRODUCTS_STD = EXTREME_STD
 MAX_NUM_PRODUCTS = 25
 FLOAT_CLOSE_TOLERANCE = 0.1
 SHOW_LIVE_RATE = False
+MERCHANT_DAY_VIEWS_CACHE_SIZE = 8
+TASK_CHUNKS_PER_WORKER = 4
+MAX_RANDOM_SEED = 2 ** 62
+CALIBRATION_SAMPLE_SIZE = 200
+CALIBRATION_STREAM_KEY = 2 ** 31
+STRATUM_STREAM_KEY = CALIBRATION_STREAM_KEY + 1
+CALIBRATION_BOOTSTRAP_SIZE = 10000
+CALIBRATION_PRIOR_WEIGHT = 1
+MAX_MERCHANT_ATTEMPTS = 10 ** 5
+POOL_STREAM_KEY = CALIBRATION_STREAM_KEY + 2
+POOL_CANDIDATES_PER_TASK = 8
+BASELINE_CACHE_SIZE = 256
+COMPILED_SCORERS_CACHE_SIZE = 16
 
 # Inventory
 SHIPPING_DURATION_AVG = MONTH
@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import random
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Optional, Mapping, Any
+from statistics import NormalDist
+from typing import Optional, Mapping, Any, Union
 
-from numpy.random import mtrand
+from numpy.random import mtrand, SeedSequence, Generator, default_rng
 
 from common import constants
-from common.local_enum import LoanReferenceType
+from common.local_enum import LoanReferenceType, LoanRetention
 from common.local_numbers import Float, Percent, Ratio, ONE, Int, Duration
+from common.util import fingerprint
+
+RANDOM_STREAM = threading.local()
 
 VOLATILE_FIELDS = [
     'account_suspension_chance',
@@ -18,10 +25,24 @@ VOLATILE_FIELDS = [
     'shipping_duration_std'
 ]
 
+EXECUTION_FIELDS = [
+    'loan_retention',
+    'forked_simulation',
+    'baseline_cache'
+]
+
 
 @dataclass(unsafe_hash=True)
 class DataGenerator:
     randomness = True
+    seed: Optional[int] = None
+    native_numbers = False
+    lazy_batches = False
+    stratified_sampling = False
+    pooled_sampling = False
+    merchant_pool_dir: Optional[str] = None
+    calibration_sample_size = constants.CALIBRATION_SAMPLE_SIZE
+    max_merchant_attempts = constants.MAX_MERCHANT_ATTEMPTS
     simulated_duration: Duration = constants.SIMULATION_DURATION
     num_merchants = constants.NUM_SIMULATED_MERCHANTS
     num_products = constants.NUM_PRODUCTS
@@ -87,23 +108,72 @@ class DataGenerator:
                     value = getattr(data_generator, key)
                     setattr(data_generator, key, Float(value * 2))
 
+    @contextmanager
+    def random_stream(self, *stream_key: int):
+        entropy = int(self.seed) if self.seed is not None else None
+        with self.use_random_stream(default_rng(SeedSequence(entropy, spawn_key=tuple(stream_key)))) as generator:
+            yield generator
+
+    @staticmethod
+    @contextmanager
+    def use_random_stream(generator: Generator):
+        previous_stream = getattr(RANDOM_STREAM, 'generator', None)
+        RANDOM_STREAM.generator = generator
+        try:
+            yield generator
+        finally:
+            RANDOM_STREAM.generator = previous_stream
+
+    @staticmethod
+    def random_source() -> Union[Generator, mtrand]:
+        return getattr(RANDOM_STREAM, 'generator', None) or mtrand
+
     def random(self) -> Percent:
         if self.randomness:
-            return Float(mtrand.random())
+            return Float(self.random_source().random())
         return Float(constants.NO_VOLATILITY)
 
+    def spawn_seed(self) -> int:
+        return self.randint(0, constants.MAX_RANDOM_SEED)
+
+    def randint(self, low: int, high: int) -> int:
+        stream = getattr(RANDOM_STREAM, 'generator', None)
+        if stream is None:
+            return random.randint(low, high)
+        return int(stream.integers(low, high, endpoint=True))
+
     def normal_ratio(self, std: float = 0.5, chance_positive: float = 0.5, max_ratio: float = 3) -> Ratio:
         if self.randomness:
-            positive = mtrand.random() < chance_positive
-            random_value = abs(mtrand.normal(scale=std))
+            random_source = self.random_source()
+            positive = random_source.random() < chance_positive
+            random_value = abs(random_source.normal(scale=std))
             random_value = Float.min(max_ratio * std, random_value)
             ratio = ONE + random_value
             return ratio if positive else ONE / ratio
         return constants.NO_VOLATILITY
 
+    def normal_ratio_cdf(
+            self, ratio: float, std: float = 0.5, chance_positive: float = 0.5, max_ratio: float = 3) -> float:
+        if not self.randomness:
+            return float(ratio >= constants.NO_VOLATILITY)
+        if ratio <= 0:
+            return 0
+        max_value = max_ratio * std
+        if ratio < 1:
+            min_value = 1 / ratio - 1
+            if min_value > max_value:
+                return 0
+            return (1 - chance_positive) * 2 * (1 - NormalDist().cdf(min_value / std))
+        if ratio - 1 >= max_value:
+            return 1
+        return (1 - chance_positive) + chance_positive * (2 * NormalDist().cdf((ratio - 1) / std) - 1)
+
     def remove_randomness(self):
         self.randomness = False
 
+    def fingerprint(self) -> str:
+        return fingerprint(self)
+
 
 @dataclass(unsafe_hash=True)
 class RiskConfiguration:
@@ -161,6 +231,10 @@ class SimulationContext:
     marketplace_payment_cycle = constants.MARKETPLACE_PAYMENT_CYCLE
     loan_reference_type: Optional[LoanReferenceType] = None
     snapshot_cycle = None
+    event_driven_simulation = False
+    forked_simulation = False
+    baseline_cache = False
+    loan_retention = LoanRetention.FULL
     history_duration_for_amount_calculation = constants.HISTORY_DURATION_FOR_AMOUNT_CALCULATION
 
     # Lender
@@ -180,8 +254,12 @@ class SimulationContext:
     roas_benchmark = constants.ROAS_BENCHMARK_MAX
     min_risk_score = constants.MIN_RISK_SCORE
 
+    def fingerprint(self) -> str:
+        return fingerprint(self)
+
     def to_dict(self) -> Mapping[str, Any]:
-        result = self.__dict__
+        result = dict(self.__dict__)
         result['risk_context'] = self.risk_context.to_dict()
         result['loan_reference_type'] = self.loan_reference_type.name if self.loan_reference_type else 'None'
+        result['loan_retention'] = self.loan_retention.name
         return result
@@ -38,3 +38,9 @@ class LoanReferenceType(ExtendedEnum):
     ANNUAL_REVENUE = 2
     DAILY_REVENUE = 3
     REVENUE_CAGR = 4
+
+
+class LoanRetention(ExtendedEnum):
+    FULL = 'Full'
+    SUMMARY = 'Summary'
+    RESULTS = 'Results'
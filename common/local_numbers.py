@@ -8,6 +8,17 @@ from common import constants
 
 
 class Float(float):
+    __slots__ = ()
+
+    def __reduce__(self):
+        return self.__class__, (float(self),)
+
+    def __copy__(self) -> Float:
+        return self
+
+    def __deepcopy__(self, memo) -> Float:
+        return self
+
     def __eq__(self, other):
         if other is None:
             return False
@@ -51,7 +62,8 @@ class Float(float):
         return Float(super(Float, self).__truediv__(other))
 
     def __pow__(self, power, modulo=None) -> Float:
-        return Float(super(Float, self).__pow__(power, modulo))
+        result = super(Float, self).__pow__(power, modulo)
+        return result if result is NotImplemented else Float(result)
 
     def __index__(self) -> int:
         return int(self)
@@ -109,6 +121,17 @@ class Float(float):
 
 
 class Int(int):
+    __slots__ = ()
+
+    def __reduce__(self):
+        return self.__class__, (int(self),)
+
+    def __copy__(self) -> Int:
+        return self
+
+    def __deepcopy__(self, memo) -> Int:
+        return self
+
     def __add__(self, other) -> Union[Int, Float]:
         if Int.is_true_float(other):
             return Float(self) + other
@@ -167,6 +190,8 @@ class Int(int):
 
 
 class Duration(Int):
+    __slots__ = ()
+
     def __add__(self, other) -> Union[Duration, Float]:
         if Int.is_true_float(other):
             return Float(self) + other
@@ -218,6 +243,10 @@ class Duration(Int):
         return Duration(Int.min(*args, **kwargs))
 
 
+def float_equals(value: float, other: float) -> bool:
+    return math.isclose(value, other, abs_tol=constants.FLOAT_EQUALITY_TOLERANCE)
+
+
 def human_format_duration(days: int) -> str:
     if days < 0:
         return f'-({human_format_duration(-days)})'
@@ -1,20 +1,33 @@
 from __future__ import annotations
 
+from copy import deepcopy
 from dataclasses import is_dataclass
 from enum import Enum
-from typing import Any, Tuple
+from functools import wraps, lru_cache
+from typing import Any, Callable, Type, Mapping, Tuple, Optional, MutableMapping
 
 from common.context import DataGenerator
-from common.local_numbers import Float, Int
+from common.local_numbers import Float, Int, Duration
 
 NEXT_ID = {}
+IMMUTABLE_TYPES = {Float, Int, Duration, float, int, str, bool, type(None)}
 
 
-def generate_id(obj) -> Tuple[str, int]:
+@lru_cache(maxsize=None)
+def slot_names(cls: Type) -> Tuple[str, ...]:
+    names = []
+    for klass in cls.__mro__:
+        for name in klass.__dict__.get('__slots__', ()):
+            if name not in ('__dict__', '__weakref__') and name not in names:
+                names.append(name)
+    return tuple(names)
+
+
+def generate_id(obj) -> int:
     class_name = obj.__class__.__name__
     id_count = NEXT_ID[class_name] if class_name in NEXT_ID else 1
     NEXT_ID[class_name] = id_count + 1
-    return id_name(obj, id_count), id_count
+    return id_count
 
 
 def id_name(obj, int_id: int) -> str:
@@ -22,21 +35,83 @@ def id_name(obj, int_id: int) -> str:
     return f'{class_name}_{int_id}'
 
 
+def typed_number(number_type: Type) -> Callable:
+    def decorator(method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(self: Primitive, *args, **kwargs):
+            value = method(self, *args, **kwargs)
+            if self.native_numbers or value is None:
+                return value
+            return number_type(value)
+
+        return wrapper
+
+    return decorator
+
+
+class VersionCounter:
+    __slots__ = ('value',)
+
+    def __init__(self, value: int = 0):
+        self.value = value
+
+    def increment(self):
+        self.value += 1
+
+
 class Primitive:
-    def __init__(self, data_generator: DataGenerator):
-        self.id, self.int_id = generate_id(self)
-        self.data_generator = data_generator
+    __slots__ = ('int_id',)
+    data_generator: DataGenerator
+
+    def __init__(self):
+        self.int_id = generate_id(self)
+
+    @property
+    def native_numbers(self) -> bool:
+        return self.data_generator.native_numbers
+
+    @property
+    def id(self) -> str:
+        return id_name(self, self.int_id)
+
+    @id.setter
+    def id(self, value: str):
+        self.int_id = int(value.split('_')[-1])
 
     def set_id(self, int_id: int):
         self.int_id = int_id
-        self.id = id_name(self, int_id)
 
     def reset_id(self):
-        self.id, self.int_id = generate_id(self)
+        self.int_id = generate_id(self)
 
     def copy_id(self, source: Primitive):
         self.set_id(source.int_id)
 
+    def instance_state(self) -> Tuple[Optional[Mapping[str, Any]], Optional[Mapping[str, Any]]]:
+        slots_state = {name: getattr(self, name) for name in slot_names(type(self)) if hasattr(self, name)}
+        return getattr(self, '__dict__', None) or None, slots_state or None
+
+    def attributes(self) -> Mapping[str, Any]:
+        attributes = {'id': self.id}
+        for state in reversed(self.instance_state()):
+            attributes.update(state or {})
+        return attributes
+
+    def shallow_copy(self) -> Primitive:
+        clone = object.__new__(self.__class__)
+        for state in self.instance_state():
+            for name, value in (state or {}).items():
+                setattr(clone, name, value)
+        return clone
+
+    def __deepcopy__(self, memo: MutableMapping[int, Any]) -> Primitive:
+        clone = object.__new__(self.__class__)
+        memo[id(self)] = clone
+        for state in self.instance_state():
+            for name, value in (state or {}).items():
+                setattr(clone, name, value if type(value) in IMMUTABLE_TYPES else deepcopy(value, memo))
+        return clone
+
     def str_type_encoder(self, value: Any) -> str:
         if (isinstance(value, str) or isinstance(value, int) or isinstance(value, Float) or isinstance(
                 value, Int) or is_dataclass(value) or isinstance(value, bool) or isinstance(value, Enum)):
@@ -52,7 +127,7 @@ class Primitive:
 
     def __str__(self):
         s = ''
-        for name, value in vars(self).items():
+        for name, value in self.attributes().items():
             s += f' {name}={self.str_type_encoder(value)}'
         return s
 
@@ -60,10 +135,10 @@ class Primitive:
         return self.__str__()
 
     def __hash__(self):
-        return hash(self.id)
+        return hash(self.int_id)
 
     def __eq__(self, other: Primitive):
         if isinstance(other, Primitive):
-            if self.id == other.id:
+            if self.int_id == other.int_id and self.__class__.__name__ == other.__class__.__name__:
                 return True
         return False
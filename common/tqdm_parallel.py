@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import multiprocessing
+import time
 from random import random
 
 from joblib import Parallel
@@ -18,13 +19,19 @@ class LiveRate:
     def reset(self):
         self.positive = 0
         self.total = 0
+        self.start_time = time.time()
+
+    def per_second(self) -> Float:
+        elapsed = time.time() - self.start_time
+        return Float(self.total / elapsed if elapsed > 0 else 0)
 
     def __hash__(self):
         return self.id
 
     def __str__(self):
         # return f'{self.name}: {round(self.positive / self.total if self.total > 0 else 0, 2)}'
-        return f'{self.name}: {Float(100 * self.positive / self.total if self.total > 0 else 0)}%'
+        return f'{self.name}: {Float(100 * self.positive / self.total if self.total > 0 else 0)}% ' \
+               f'({self.per_second()}/s)'
 
 
 LIVE_RATE = LiveRate()
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import hashlib
 import inspect
+from enum import Enum
 from typing import Union, List, Optional, TypeVar, Mapping
 
+import numpy as np
+
 from common import constants
 from common.local_numbers import Float, Percent, Duration, O, ONE, Int
 
@@ -28,16 +32,20 @@ def calculate_cagr(first_value: Float, last_value: Float, duration: Duration) ->
     return (last_value / first_value) ** (constants.YEAR / duration) - ONE
 
 
-def inverse_cagr(cagr: Percent, duration: Duration) -> Optional[Percent]:
+def inverse_cagr(cagr: Percent, duration: Union[Duration, np.ndarray]) -> Union[Percent, np.ndarray]:
     if cagr <= O:
-        return Float(-1)
+        return Float(-1) if np.isscalar(duration) else np.full(np.shape(duration), -1.0)
     return (1 + cagr) ** (duration / constants.YEAR) - 1
 
 
 NUMERIC_TYPES = Union[float, int, Int, Duration, Float]
 
 
-def min_max(value: NUMERIC_TYPES, min_value: NUMERIC_TYPES, max_value: NUMERIC_TYPES) -> NUMERIC_TYPES:
+def min_max(
+        value: Union[NUMERIC_TYPES, np.ndarray], min_value: NUMERIC_TYPES, max_value: NUMERIC_TYPES) -> Union[
+    NUMERIC_TYPES, np.ndarray]:
+    if isinstance(value, np.ndarray):
+        return np.clip(value, float(min_value), float(max_value))
     if isinstance(value, int):
         value = Int.max(min_value, value)
         value = Int.min(max_value, value)
@@ -81,3 +89,24 @@ def inherits_from(child, parent_name):
 def intersection(list1: List, list2: List) -> List:
     intersection_list = [value for value in list1 if value in list2]
     return intersection_list
+
+
+def fingerprint_values(obj) -> List[str]:
+    if obj is None or isinstance(obj, (bool, str)):
+        return [repr(obj)]
+    if isinstance(obj, Enum):
+        return [obj.name]
+    if isinstance(obj, (int, float)):
+        return [float.__repr__(float(obj))]
+    values = []
+    for key in sorted(dir(obj)):
+        if not key.startswith('_'):
+            value = getattr(obj, key)
+            if not callable(value):
+                values.append(key)
+                values.extend(fingerprint_values(value))
+    return values
+
+
+def fingerprint(obj) -> str:
+    return hashlib.sha1(' '.join(fingerprint_values(obj)).encode()).hexdigest()
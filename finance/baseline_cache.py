@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from copy import copy
+from dataclasses import dataclass
+from typing import Tuple, Optional, MutableMapping, Hashable, Iterable
+
+from common import constants
+from common.context import EXECUTION_FIELDS
+from common.local_numbers import Percent, O
+from finance.loan_simulation import LoanSimulation, SIMULATION_STATE
+from seller.merchant import Merchant
+
+BASELINE_INDEPENDENT_FIELDS = ['loan_reference_type'] + EXECUTION_FIELDS
+BASELINE_STATE = SIMULATION_STATE + ['current_repayment_rate', 'snapshots', 'simulation_results']
+
+
+@dataclass
+class BaselineCacheStatistics:
+    hits: int = 0
+    misses: int = 0
+
+    @classmethod
+    def generate_from_hits(cls, hits: Iterable[Optional[bool]]) -> BaselineCacheStatistics:
+        statistics = cls()
+        for hit in hits:
+            if hit is not None:
+                statistics.record(hit)
+        return statistics
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    def hit_rate(self) -> Percent:
+        return Percent(self.hits / self.lookups()) if self.lookups() else O
+
+    def __str__(self):
+        return f'baseline cache: {self.hits} hits, {self.misses} misses ({self.hit_rate()})'
+
+
+class BaselineCache:
+    def __init__(self, max_size: int = constants.BASELINE_CACHE_SIZE):
+        self.max_size = max_size
+        self.baselines: MutableMapping[Hashable, LoanSimulation] = OrderedDict()
+
+    @staticmethod
+    def merchant_key(merchant: Merchant) -> Tuple:
+        assert merchant.stream_key is not None
+        return merchant.stream_key, merchant.num_products_stratum, merchant.stream_fingerprint
+
+    @staticmethod
+    def key(loan: LoanSimulation) -> Tuple:
+        context = copy(loan.context)
+        for field in BASELINE_INDEPENDENT_FIELDS:
+            setattr(context, field, None)
+        return BaselineCache.merchant_key(loan.merchant), context.fingerprint(), loan.data_generator.fingerprint()
+
+    @staticmethod
+    def is_cacheable(loan: LoanSimulation) -> bool:
+        return loan.context.baseline_cache and loan.reference_loan is None and \
+               loan.today == loan.data_generator.start_date and \
+               loan.merchant.matches_stream(loan.data_generator.fingerprint())
+
+    def get(self, key: Hashable) -> Optional[LoanSimulation]:
+        if key not in self.baselines:
+            return None
+        self.baselines.move_to_end(key)
+        return self.baselines[key]
+
+    def store(self, key: Hashable, loan: LoanSimulation):
+        baseline = loan.shallow_copy()
+        baseline.copy_state(loan, BASELINE_STATE)
+        self.baselines[key] = baseline
+        while len(self.baselines) > self.max_size:
+            self.baselines.popitem(last=False)
+
+    def restore(self, key: Hashable, loan: LoanSimulation) -> bool:
+        baseline = self.get(key)
+        if baseline is None:
+            return False
+        loan.copy_state(baseline, BASELINE_STATE)
+        return True
+
+    def clear(self):
+        self.baselines.clear()
+
+
+BASELINE_CACHE = BaselineCache()
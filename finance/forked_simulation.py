@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from typing import List, Type, Mapping
+
+from common.context import SimulationContext, DataGenerator
+from common.local_numbers import O
+from finance.loan_simulation import LoanSimulation
+from finance.loan_simulation_childs import NoCapitalLoanSimulation
+from seller.merchant import Merchant
+
+
+class TrunkSimulation(NoCapitalLoanSimulation):
+    def __init__(
+            self, context: SimulationContext, data_generator: DataGenerator, merchant: Merchant,
+            loans: List[LoanSimulation]):
+        super(TrunkSimulation, self).__init__(context, data_generator, merchant)
+        self.pending_loans = list(loans)
+        self.branches: Mapping[Type[LoanSimulation], LoanSimulation] = {
+            type(loan): type(loan).from_trunk(self) for loan in loans}
+
+    def branch(self, loan_type: Type[LoanSimulation]) -> LoanSimulation:
+        branch = self.branches[loan_type]
+        branch.share_state(self)
+        return branch
+
+    def diverges(self, loan: LoanSimulation) -> bool:
+        branch = self.branch(type(loan))
+        return branch.primary_approval_conditions() and branch.calculate_amount() > O
+
+    def take_snapshot(self):
+        if self.context.snapshot_cycle and self.today % self.context.snapshot_cycle == 0:
+            for loan in self.pending_loans:
+                loan.snapshots[self.today] = self.branch(type(loan)).current_simulation_results()
+
+    def fork(self, loan: LoanSimulation):
+        loan.copy_state(self)
+        self.pending_loans.remove(loan)
+        loan.finish_simulation()
+
+    def fork_diverged_loans(self, _: LoanSimulation = None) -> bool:
+        for loan in [loan for loan in self.pending_loans if self.diverges(loan)]:
+            self.fork(loan)
+        return not self.pending_loans
+
+    def simulate_forks(self):
+        with self.merchant.memoized_day_views():
+            if not self.fork_diverged_loans():
+                self.simulate_until(self.fork_diverged_loans)
+        for loan in list(self.pending_loans):
+            self.fork(loan)
+
+
+class ForkedSimulation:
+    def __init__(self, context: SimulationContext, data_generator: DataGenerator, loans: List[LoanSimulation]):
+        assert ForkedSimulation.is_supported(context, loans)
+        self.context = context
+        self.data_generator = data_generator
+        self.loans = loans
+        self.trunk = TrunkSimulation(context, data_generator, loans[0].merchant.clone(), loans)
+
+    @staticmethod
+    def is_supported_context(context: SimulationContext) -> bool:
+        return context.loan_reference_type is None and not context.event_driven_simulation
+
+    @staticmethod
+    def is_supported(context: SimulationContext, loans: List[LoanSimulation]) -> bool:
+        if len(loans) == 0 or not ForkedSimulation.is_supported_context(context):
+            return False
+        return all([loan.merchant.id == loans[0].merchant.id and loan.today == loan.data_generator.start_date for
+            loan in loans])
+
+    def simulate(self):
+        self.trunk.simulate_forks()
@@ -1,16 +1,20 @@
 from __future__ import annotations
 
-from copy import deepcopy
+from array import array
 from dataclasses import dataclass
-from typing import List, MutableMapping, Optional
+from typing import List, MutableMapping, Optional, Any, Tuple
 
+import numpy as np
+
+from common import constants
 from common.context import DataGenerator, SimulationContext
-from common.local_numbers import Dollar, Date, Duration, Float, O_INT, O, Int
-from common.primitive import Primitive
+from common.local_numbers import Dollar, Date, Duration, Float, O_INT, O, Int, ONE_INT
+from common.primitive import Primitive, VersionCounter
 
 
 @dataclass(unsafe_hash=True)
 class Loan:
+    __slots__ = ('amount', 'outstanding_balance', 'start_date')
     amount: Dollar
     outstanding_balance: Dollar
     start_date: Date
@@ -22,6 +26,7 @@ class Loan:
 
 @dataclass(unsafe_hash=True)
 class Repayment:
+    __slots__ = ('day', 'amount', 'duration')
     day: Date
     amount: Dollar
     duration: Duration
@@ -40,39 +45,103 @@ class Repayment:
 
 
 class Ledger(Primitive):
+    __slots__ = (
+        'data_generator', 'context', 'loan_amounts', 'loan_debts', 'loan_balances', 'loan_start_dates',
+        'first_active_loan', 'credit', 'balance', 'repayments', 'cash_days', 'cash_amounts', 'views', 'paid_balance',
+        'version_counter')
+
     def __init__(self, data_generator: DataGenerator, context: SimulationContext):
-        super(Ledger, self).__init__(data_generator)
+        super(Ledger, self).__init__()
+        self.data_generator = data_generator
         self.context = context
-        self.active_loans: List[Loan] = []
-        self.loans_history: List[Loan] = []
+        self.loan_amounts = array('d')
+        self.loan_debts = array('d')
+        self.loan_balances = array('d')
+        self.loan_start_dates = array('q')
+        self.first_active_loan = 0
+        self.credit = 0.0
+        self.balance = 0.0
         self.repayments: List[Repayment] = []
-        self.cash_history: MutableMapping[Date, Dollar] = {}
+        self.cash_days = array('q')
+        self.cash_amounts = array('d')
+        self.views: MutableMapping[str, Any] = {}
         self.paid_balance = O
+        self.version_counter = VersionCounter()
+
+    @property
+    def active_loans(self) -> List[Loan]:
+        return [self.active_loan(i) for i in range(self.first_active_loan, len(self.loan_amounts))]
+
+    @property
+    def loans_history(self) -> List[Loan]:
+        if 'loans_history' not in self.views:
+            self.views['loans_history'] = [self.history_loan(i) for i in range(len(self.loan_amounts))]
+        return self.views['loans_history']
+
+    @property
+    def cash_history(self) -> MutableMapping[Date, Dollar]:
+        if 'cash_history' not in self.views:
+            self.views['cash_history'] = {Date(day): Float(amount) for day, amount in
+                zip(self.cash_days, self.cash_amounts)}
+        return self.views['cash_history']
+
+    def active_loan(self, i: int) -> Loan:
+        return Loan(Float(self.loan_amounts[i]), Float(self.loan_balances[i]), Date(self.loan_start_dates[i]))
+
+    def history_loan(self, i: int) -> Loan:
+        return Loan(Float(self.loan_amounts[i]), Float(self.loan_debts[i]), Date(self.loan_start_dates[i]))
+
+    def has_active_loans(self) -> bool:
+        return self.first_active_loan < len(self.loan_amounts)
 
     def total_credit(self) -> Dollar:
-        return Float.sum([loan.amount for loan in self.loans_history])
+        return Float(self.credit)
 
     def num_loans(self) -> Int:
-        return Int(len(self.loans_history))
+        return Int(len(self.loan_amounts))
+
+    def repaid_loans(self) -> List[Loan]:
+        return [self.history_loan(i) for i in range(self.first_active_loan)]
+
+    def partially_repaid_loans(self) -> List[Loan]:
+        return [self.active_loan(i) for i in range(self.first_active_loan, len(self.loan_amounts)) if
+            Float(self.loan_balances[i]) < self.loan_debts[i]]
 
     def get_current_loan(self) -> Loan:
-        return Loan.current_loan(self.active_loans)
+        return self.active_loan(self.first_active_loan)
 
     def new_loan(self, loan: Loan):
-        self.active_loans.append(loan)
-        self.loans_history.append(deepcopy(loan))
+        self.loan_amounts.append(loan.amount)
+        self.loan_debts.append(loan.outstanding_balance)
+        self.loan_balances.append(loan.outstanding_balance)
+        self.loan_start_dates.append(loan.start_date)
+        self.credit += loan.amount
+        self.update_balance()
+        self.views.pop('loans_history', None)
+
+    def update_balance(self):
+        self.balance = sum(self.loan_balances[self.first_active_loan:])
+        self.version_counter.increment()
 
     def record_cash(self, day: Date, amount: Dollar):
-        self.cash_history[day] = amount
+        if self.cash_days and self.cash_days[-1] == day:
+            self.cash_amounts[-1] = amount
+        else:
+            assert not self.cash_days or day > self.cash_days[-1]
+            self.cash_days.append(day)
+            self.cash_amounts.append(amount)
+        self.views.pop('cash_history', None)
+        self.version_counter.increment()
 
     def outstanding_balance(self, loans: Optional[List[Loan]] = None) -> Dollar:
         if loans is None:
-            return self.outstanding_balance(self.active_loans) if self.active_loans else O
+            return Float(self.balance) if self.has_active_loans() else O
         return Float.sum([loan.outstanding_balance for loan in loans])
 
     def repayments_from_amount(self, repayment_date: Date, total_amount: Dollar, loans: Optional[List[Loan]] = None) \
             -> List[Repayment]:
-        loans = loans or self.active_loans
+        if not loans:
+            return self.repay_active_loans(repayment_date, total_amount)
         remaining_amount = total_amount
         repayments: List[Repayment] = []
         while remaining_amount > O and loans:
@@ -83,29 +152,58 @@ class Ledger(Primitive):
             repayment.repay(loans)
         return repayments
 
+    def repay_active_loans(self, repayment_date: Date, total_amount: Dollar) -> List[Repayment]:
+        remaining_amount = total_amount
+        repayments: List[Repayment] = []
+        while remaining_amount > O and self.has_active_loans():
+            i = self.first_active_loan
+            current_loan = self.active_loan(i)
+            repayment_amount = Float.min(current_loan.outstanding_balance, remaining_amount)
+            remaining_amount -= repayment_amount
+            repayments.append(Repayment.generate_from_loan(repayment_date, current_loan, repayment_amount))
+            outstanding_balance = current_loan.outstanding_balance - repayment_amount
+            self.loan_balances[i] = outstanding_balance
+            if outstanding_balance == O:
+                self.first_active_loan += 1
+        if repayments:
+            self.update_balance()
+        return repayments
+
     def initiate_loan_repayment(self, today: Date, max_amount: Dollar):
         actual_amount = Float.min(self.outstanding_balance(), max_amount)
         new_repayments = self.repayments_from_amount(today, actual_amount)
         self.repayments.extend(new_repayments)
         self.paid_balance += actual_amount
+        self.version_counter.increment()
+
+    def projected_repayment_schedule(
+            self, projected_remaining_debt: Dollar, today: Date, projected_amount_per_repayment: Dollar) -> Tuple[
+        np.ndarray, np.ndarray, np.ndarray]:
+        projected_total_repaid_amount = self.outstanding_balance() - projected_remaining_debt
+        if projected_amount_per_repayment == O or projected_total_repaid_amount == O:
+            return np.array([], dtype=np.int64), np.array([]), np.array([], dtype=np.int64)
+        cycle = self.context.marketplace_payment_cycle
+        dates = np.arange(today + cycle - 1, today + self.context.loan_duration, cycle, dtype=np.int64)
+        cycle_ends = np.minimum(
+            float(projected_amount_per_repayment) * np.arange(1, len(dates) + 1), float(projected_total_repaid_amount))
+        cycle_starts = np.concatenate([[0.0], cycle_ends[:-1]])
+        balances = np.array(self.loan_balances[self.first_active_loan:])
+        loan_ends = np.cumsum(balances)
+        loan_starts = loan_ends - balances
+        overlaps = np.minimum(cycle_ends[:, None], loan_ends[None, :]) - np.maximum(
+            cycle_starts[:, None], loan_starts[None, :])
+        cycle_indices, loan_indices = np.nonzero(overlaps > constants.FLOAT_EQUALITY_TOLERANCE)
+        start_dates = np.array(self.loan_start_dates[self.first_active_loan:], dtype=np.int64)
+        repayment_dates = dates[cycle_indices]
+        return repayment_dates, overlaps[cycle_indices, loan_indices], repayment_dates - start_dates[loan_indices] + 1
 
     def projected_repayments(
             self, projected_remaining_debt: Dollar, today: Date, projected_amount_per_repayment: Dollar) -> List[
         Repayment]:
-        projected_total_repaid_amount = self.outstanding_balance() - projected_remaining_debt
-        repayments: List[Repayment] = []
-        if projected_amount_per_repayment == O or projected_total_repaid_amount == O:
-            return repayments
-        remaining_amount = projected_total_repaid_amount
-        projected_loans = deepcopy(self.active_loans)
-        date = today + self.context.marketplace_payment_cycle - 1
-        while remaining_amount > O and projected_loans and date - today < self.context.loan_duration:
-            actual_amount = Float.min(
-                [self.outstanding_balance(projected_loans), remaining_amount, projected_amount_per_repayment])
-            repayments.extend(self.repayments_from_amount(date, actual_amount, projected_loans))
-            remaining_amount -= actual_amount
-            date += self.context.marketplace_payment_cycle
-        return repayments
+        dates, amounts, durations = self.projected_repayment_schedule(
+            projected_remaining_debt, today, projected_amount_per_repayment)
+        return [Repayment(Date(day), Float(amount), Duration(duration)) for day, amount, duration in
+            zip(dates, amounts, durations)]
 
     def remaining_loan_duration(self, today: Date, loan: Loan) -> Duration:
         duration = loan.start_date + self.context.loan_duration - today
@@ -115,15 +213,50 @@ class Ledger(Primitive):
         return [self.remaining_loan_duration(today, loan) for loan in self.active_loans]
 
     def undo_active_loans(self):
-        adjustment = 0
-        for i in range(len(self.active_loans)):
-            history_index = -1 - i + adjustment
-            if self.active_loans[-1].outstanding_balance == self.loans_history[history_index].outstanding_balance:
-                adjustment += 1
-                self.loans_history.pop()
+        for i in reversed(range(self.first_active_loan, len(self.loan_amounts))):
+            if Float(self.loan_balances[i]) == self.loan_debts[i]:
+                for column in [self.loan_amounts, self.loan_debts, self.loan_balances, self.loan_start_dates]:
+                    column.pop()
             else:
-                remaining_rate = 1 - self.active_loans[-1].outstanding_balance / self.loans_history[
-                    history_index].outstanding_balance
-                self.loans_history[history_index].outstanding_balance = self.active_loans[-1].outstanding_balance
-                self.loans_history[history_index].amount -= remaining_rate * self.active_loans[-1].amount
-            self.active_loans.pop()
+                remaining_rate = 1 - self.loan_balances[i] / self.loan_debts[i]
+                self.loan_debts[i] = self.loan_balances[i]
+                self.loan_amounts[i] -= remaining_rate * self.loan_amounts[i]
+        self.first_active_loan = len(self.loan_amounts)
+        self.credit = sum(self.loan_amounts)
+        self.update_balance()
+        self.views.pop('loans_history', None)
+
+
+class SalesLedger:
+    def __init__(self, start_date: Date):
+        self.start_date = start_date
+        self.cumulative_revenue = array('d', [0])
+        self.cumulative_gp = array('d', [0])
+
+    def last_date(self) -> Date:
+        return self.start_date + len(self.cumulative_revenue) - 2
+
+    def record_sales(self, day: Date, revenue: Dollar, gp: Dollar, duration: Duration = ONE_INT):
+        assert day > self.last_date()
+        unrecorded_duration = day - self.last_date() - 1
+        self.cumulative_revenue.extend([self.cumulative_revenue[-1]] * unrecorded_duration)
+        self.cumulative_gp.extend([self.cumulative_gp[-1]] * unrecorded_duration)
+        for _ in range(duration):
+            self.cumulative_revenue.append(self.cumulative_revenue[-1] + revenue)
+            self.cumulative_gp.append(self.cumulative_gp[-1] + gp)
+
+    def cumulative_index(self, day: Date) -> int:
+        return min(max(day - self.start_date + 1, 0), len(self.cumulative_revenue) - 1)
+
+    def revenue(self, start_date: Date, last_date: Date) -> Dollar:
+        return Float(
+            self.cumulative_revenue[self.cumulative_index(last_date)] - self.cumulative_revenue[
+                self.cumulative_index(start_date - 1)])
+
+    def gp(self, start_date: Date, last_date: Date) -> Dollar:
+        return Float(
+            self.cumulative_gp[self.cumulative_index(last_date)] - self.cumulative_gp[
+                self.cumulative_index(start_date - 1)])
+
+    def revenue_in_window(self, day: Date, window: Duration) -> Dollar:
+        return self.revenue(day - window + 1, day)
@@ -1,21 +1,26 @@
 from __future__ import annotations
 
 import math
+import multiprocessing
 from copy import deepcopy
 from dataclasses import fields
-from typing import List, MutableMapping, Optional, Mapping
+from typing import List, MutableMapping, Optional, Mapping, Union
 
 import numpy as np
 from joblib import delayed
 
+from common import constants
 from common.context import SimulationContext, DataGenerator
-from common.local_enum import LoanSimulationType
+from common.local_enum import LoanSimulationType, LoanRetention
 from common.local_numbers import Percent, O, Int, Date, Dollar, FloatRange, Float
 from common.primitive import Primitive
 from common.tqdm_parallel import TqdmParallel
-from common.util import get_key_from_value, intersection
+from common.util import get_key_from_value, intersection, flatten
+from finance.baseline_cache import BaselineCacheStatistics
+from finance.forked_simulation import ForkedSimulation
 from finance.line_of_credit import LineOfCreditSimulation, DynamicLineOfCreditSimulation, InvoiceFinancingSimulation
 from finance.loan_simulation import LoanSimulation
+from finance.loan_simulation_record import LoanSimulationRecord, MerchantSimulationTask
 from finance.loan_simulation_results import LoanSimulationResults
 from finance.risk_order import RiskOrder
 from lender_simulation_results import LenderSimulationResults
@@ -33,21 +38,52 @@ LOAN_TYPES_MAPPING = {
 }
 
 
+def simulate_merchant_tasks(
+        context: SimulationContext, data_generator: DataGenerator, tasks: List[MerchantSimulationTask],
+        retention: LoanRetention) -> List[Union[LoanSimulation, LoanSimulationRecord]]:
+    data_generator_fingerprint = data_generator.fingerprint()
+    context_fingerprint = context.fingerprint()
+    results = []
+    for task in tasks:
+        assert task.data_generator_fingerprint == data_generator_fingerprint
+        assert task.context_fingerprint == context_fingerprint
+        merchant = Merchant.generate_from_stream(
+            data_generator, *task.stream_key, num_products_stratum=task.num_products_stratum)
+        loan = Lender.generate_loan(merchant, context, data_generator, task.loan_type, None)
+        loan.simulate()
+        results.append(LoanSimulationRecord.retain(loan, retention, task.stream_key))
+    return results
+
+
+def simulate_merchant_forks(
+        context: SimulationContext, data_generator: DataGenerator, merchant: Merchant,
+        loan_types: List[LoanSimulationType], retention: LoanRetention) -> List[
+    Union[LoanSimulation, LoanSimulationRecord]]:
+    loans = [Lender.generate_loan(merchant.clone(), context, data_generator, loan_type, None) for loan_type in
+        loan_types]
+    ForkedSimulation(context, data_generator, loans).simulate()
+    return [LoanSimulationRecord.retain(loan, retention) for loan in loans]
+
+
 class Lender(Primitive):
     def __init__(
             self, context: SimulationContext, data_generator: DataGenerator, merchants: List[Merchant],
             loan_type: LoanSimulationType = LoanSimulationType.DEFAULT,
             reference_lender: Optional[Lender] = None):
-        super(Lender, self).__init__(data_generator)
+        super(Lender, self).__init__()
+        self.data_generator = data_generator
         self.merchants = merchants
         self.context = context
         self.simulation_results: Optional[LenderSimulationResults] = None
-        self.loans: MutableMapping[Merchant, LoanSimulation] = {}
+        self.loans: MutableMapping[Merchant, Union[LoanSimulation, LoanSimulationRecord]] = {}
         self.risk_correlation: MutableMapping[str, MutableMapping[str, Percent]] = {}
         self.loan_type = loan_type
         self.reference = reference_lender
         self.risk_order = RiskOrder()
         self.snapshots: MutableMapping[Date, AggregatedLoanSimulationResults] = {}
+        self.retention = context.loan_retention
+        assert not context.loan_reference_type or self.retention == LoanRetention.FULL, \
+            f'{context.loan_reference_type.name} reference requires {LoanRetention.FULL.name} loan retention'
 
     @classmethod
     def generate_from_simulated_loans(cls, loans: List[LoanSimulation], reference: Optional[Lender] = None) -> Lender:
@@ -66,6 +102,30 @@ class Lender(Primitive):
             loan_type: LoanSimulationType, reference_loan: Optional[LoanSimulation]) -> LoanSimulation:
         return LOAN_TYPES_MAPPING[loan_type](context, data_generator, merchant, reference_loan)
 
+    @staticmethod
+    def can_simulate_forked(lenders: List[Lender]) -> bool:
+        if not lenders or not lenders[0].context.forked_simulation:
+            return False
+        if not ForkedSimulation.is_supported_context(lenders[0].context):
+            return False
+        return all([not lender.loans and len(lender.merchants) == len(lenders[0].merchants) for lender in lenders])
+
+    @staticmethod
+    def simulate_forked(lenders: List[Lender]):
+        assert Lender.can_simulate_forked(lenders)
+        reference = lenders[0]
+        loan_types = [lender.loan_type for lender in lenders]
+        forked_loans = TqdmParallel(desc='Forked simulation', total=len(reference.merchants))(
+            delayed(simulate_merchant_forks)(
+                reference.context, reference.data_generator, merchant, loan_types, reference.retention) for merchant in
+            reference.merchants)
+        for i, loans in enumerate(forked_loans):
+            for lender, loan in zip(lenders, loans):
+                lender.store_loan(lender.merchants[i], loan)
+
+    def is_presimulated(self) -> bool:
+        return len(self.merchants) > 0 and all([merchant in self.loans for merchant in self.merchants])
+
     def set_reference(self, reference: Lender):
         self.reference = reference
         self.risk_order = reference.risk_order
@@ -88,7 +148,7 @@ class Lender(Primitive):
     def agg_compare(self, lender: Optional[Lender] = None) -> AggregatedLoanSimulationResults:
         lender = lender or self.reference
         diff_lsr = [self.lsr_or_zero(merchant) - lender.lsr_or_zero(merchant) for merchant in self.merchants]
-        return self.aggregate_results(diff_lsr)
+        return self.aggregate_results(diff_lsr, self.merchants)
 
     def risk_order_counts(self) -> List[Int]:
         if not self.reference:
@@ -117,12 +177,24 @@ class Lender(Primitive):
     def get_risk_order_counts_for_list(self, lsr_list: List[LoanSimulationResults]) -> List[Int]:
         return self.risk_order.count_per_order([lsr.revenue_cagr for lsr in lsr_list])
 
+    def get_reference_loan(self, merchant: Merchant) -> Optional[LoanSimulation]:
+        if not self.reference or not self.context.loan_reference_type:
+            return None
+        reference_loan = self.reference.loans[merchant]
+        assert isinstance(reference_loan, LoanSimulation), \
+            f'{self.reference.id} retains {reference_loan.retention.name} records, not full reference loans'
+        return reference_loan
+
     def generate_loan_from_merchant(self, merchant: Merchant) -> LoanSimulation:
-        reference_loan = self.reference.loans[merchant] if self.reference else None
-        return Lender.generate_loan(merchant, self.context, self.data_generator, self.loan_type, reference_loan)
+        return Lender.generate_loan(
+            merchant, self.context, self.data_generator, self.loan_type, self.get_reference_loan(merchant))
 
-    def aggregate_results(self, simulations_results: List[LoanSimulationResults]) -> AggregatedLoanSimulationResults:
-        return AggregatedLoanSimulationResults.generate_from_list(simulations_results, len(self.merchants))
+    def aggregate_results(
+            self, simulations_results: List[LoanSimulationResults],
+            merchants: Optional[List[Merchant]] = None) -> AggregatedLoanSimulationResults:
+        sampling_weights = [merchant.sampling_weight for merchant in merchants] if merchants is not None else None
+        return AggregatedLoanSimulationResults.generate_from_list(
+            simulations_results, sum([merchant.sampling_weight for merchant in self.merchants]), sampling_weights)
 
     def calculate_correlation(self, simulation_result_field_name: str) -> MutableMapping[str, Percent]:
         correlations = {}
@@ -142,9 +214,9 @@ class Lender(Primitive):
             self.risk_correlation[field.name] = self.calculate_correlation(field.name)
 
     def calculate_results(self):
-        all_merchants = self.aggregate_results(self.all_merchants_simulation_results())
+        all_merchants = self.aggregate_results(self.all_merchants_simulation_results(), list(self.loans.keys()))
         portfolio_results = self.funded_merchants_simulation_results()
-        portfolio_merchants_agg_results = self.aggregate_results(portfolio_results)
+        portfolio_merchants_agg_results = self.aggregate_results(portfolio_results, self.funded_merchants())
         self.simulation_results = LenderSimulationResults(all_merchants, portfolio_merchants_agg_results)
         self.underwriting_correlation()
         if self.reference:
@@ -153,24 +225,30 @@ class Lender(Primitive):
         #     self.risk_order = RiskOrder([lsr.revenue_cagr for lsr in portfolio_results])
         self.prepare_snapshots()
 
+    def baseline_cache_statistics(self) -> BaselineCacheStatistics:
+        return BaselineCacheStatistics.generate_from_hits(loan.baseline_cache_hit for loan in self.loans.values())
+
     def snapshot_dates(self) -> List[Date]:
         return [Date(day) for day in
             range(self.context.snapshot_cycle, self.data_generator.simulated_duration, self.context.snapshot_cycle)]
 
     def prepare_snapshots(self):
-        if not self.context.snapshot_cycle:
+        if not self.context.snapshot_cycle or self.retention == LoanRetention.RESULTS:
             return
         for day in self.snapshot_dates():
-            day_snapshots = self.get_snapshots_for_day(day)
-            self.snapshots[day] = self.aggregate_results(day_snapshots)
+            day_snapshots = self.get_merchant_snapshots_for_day(day)
+            self.snapshots[day] = self.aggregate_results(list(day_snapshots.values()), list(day_snapshots.keys()))
 
     def get_snapshots_for_day(self, day: Date) -> List[LoanSimulationResults]:
-        day_snapshots = []
-        for loan in self.loans.values():
+        return list(self.get_merchant_snapshots_for_day(day).values())
+
+    def get_merchant_snapshots_for_day(self, day: Date) -> MutableMapping[Merchant, LoanSimulationResults]:
+        day_snapshots = {}
+        for merchant, loan in self.loans.items():
             if day in loan.snapshots:
-                day_snapshots.append(loan.snapshots[day])
+                day_snapshots[merchant] = loan.snapshots[day]
             elif day > loan.today and loan.snapshots:
-                day_snapshots.append(loan.snapshots[list(loan.snapshots)[-1]])
+                day_snapshots[merchant] = loan.snapshots[list(loan.snapshots)[-1]]
         return day_snapshots
 
     def all_merchants_simulation_results(self) -> List[LoanSimulationResults]:
@@ -182,16 +260,55 @@ class Lender(Primitive):
     def funded_merchants_loans(self) -> List[LoanSimulation]:
         return [loan for loan in self.loans.values() if loan.ledger.total_credit() > O]
 
+    def funded_merchants(self) -> List[Merchant]:
+        return [merchant for merchant, loan in self.loans.items() if loan.ledger.total_credit() > O]
+
     def simulate(self):
         if self.simulation_results:
             return
+        if self.is_presimulated():
+            self.calculate_results()
+            return
+        if self.can_simulate_from_streams():
+            self.simulate_from_streams()
+            self.calculate_results()
+            return
         simulated_loans = TqdmParallel(desc=f'{self.id}({self.loan_type.value})', total=len(self.merchants))(
             delayed(self.simulate_merchant)(merchant) for merchant in self.merchants)
-        for loan in simulated_loans:
-            self.loans[loan.merchant] = loan
+        for merchant, loan in zip(self.merchants, simulated_loans):
+            self.store_loan(merchant, loan)
         self.calculate_results()
 
-    def simulate_merchant(self, merchant: Merchant) -> LoanSimulation:
+    def can_simulate_from_streams(self) -> bool:
+        if self.data_generator.seed is None or self.context.loan_reference_type or not self.merchants:
+            return False
+        data_generator_fingerprint = self.data_generator.fingerprint()
+        return all(merchant.matches_stream(data_generator_fingerprint) for merchant in self.merchants)
+
+    def stream_tasks(self) -> List[List[MerchantSimulationTask]]:
+        data_generator_fingerprint = self.data_generator.fingerprint()
+        context_fingerprint = self.context.fingerprint()
+        tasks = [MerchantSimulationTask(merchant.stream_key, self.loan_type, data_generator_fingerprint,
+            context_fingerprint, merchant.num_products_stratum) for merchant in self.merchants]
+        chunk_size = math.ceil(len(tasks) / (multiprocessing.cpu_count() * constants.TASK_CHUNKS_PER_WORKER))
+        return [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+    def simulate_from_streams(self):
+        chunks = self.stream_tasks()
+        chunk_results = TqdmParallel(desc=f'{self.id}({self.loan_type.value})', total=len(chunks))(
+            delayed(simulate_merchant_tasks)(self.context, self.data_generator, chunk, self.retention) for
+            chunk in chunks)
+        for merchant, result in zip(self.merchants, flatten(chunk_results)):
+            self.store_loan(merchant, result)
+
+    def store_loan(self, merchant: Merchant, loan: Union[LoanSimulation, LoanSimulationRecord]):
+        if isinstance(loan, LoanSimulation):
+            loan.merchant.copy_id(merchant)
+        else:
+            loan.merchant = merchant
+        self.loans[merchant] = loan
+
+    def simulate_merchant(self, merchant: Merchant) -> Union[LoanSimulation, LoanSimulationRecord]:
         loan = self.generate_loan_from_merchant(merchant)
         loan.simulate()
-        return loan
+        return LoanSimulationRecord.retain(loan, self.retention)
@@ -15,8 +15,8 @@ class LineOfCreditSimulation(LoanSimulation):
 
 class DynamicLineOfCreditSimulation(LineOfCreditSimulation):
     def update_repayment_rate(self):
-        if self.underwriting.approved(self.merchant, self.today):
-            risk_context = self.underwriting.calculate_score(self.merchant, self.today)
+        if self.approved(self.merchant):
+            risk_context = self.risk_context(self.merchant)
             repayment_ratio = self.context.agg_score_benchmark / Underwriting.aggregated_score(risk_context)
             new_rate = (repayment_ratio ** self.context.repayment_factor) * self.default_repayment_rate()
             new_rate = min_max(new_rate, self.context.min_repayment_rate, self.context.max_repayment_rate)
@@ -33,11 +33,14 @@ class InvoiceFinancingSimulation(LineOfCreditSimulation):
         return amount
 
     def approved_amount(self) -> Dollar:
+        return self.memoized('approved_amount', self.approved_batches_amount)
+
+    def approved_batches_amount(self) -> Dollar:
         # TODO: risk-based-pricing
         batches = self.merchant.batches_with_orders(self.today)
         approved_batches_cost = O
         for batch in batches:
-            if self.underwriting.approved(batch, self.today):
+            if self.approved(batch):
                 approved_batches_cost += batch.max_cash_needed(self.today)
         approved_amount = Float.min(approved_batches_cost, self.loan_amount())
         return approved_amount
@@ -1,25 +1,56 @@
 from __future__ import annotations
 
-from typing import Optional, Mapping, MutableMapping
+from copy import deepcopy
+from typing import Optional, Mapping, MutableMapping, Callable, List, Tuple, Any, TypeVar, Union
+
+import numpy as np
 
 from common import constants
-from common.context import SimulationContext, DataGenerator
+from common.context import SimulationContext, DataGenerator, RiskContext
 from common.local_enum import LoanReferenceType
 from common.local_numbers import Float, Percent, Date, Duration, Dollar, O, ONE, O_INT
-from common.primitive import Primitive
-from common.util import min_max, calculate_cagr, weighted_average, inverse_cagr
-from finance.ledger import Ledger, Loan
+from common.primitive import Primitive, VersionCounter
+from common.util import min_max, calculate_cagr, inverse_cagr
+from finance.ledger import Ledger, Loan, SalesLedger
 from finance.loan_simulation_results import LoanSimulationResults
+from finance.risk_entity import RiskEntity
 from finance.simulation_dff import LoanSimulationDiff, LoanDataContainer
 from finance.underwriting import Underwriting
 from seller.merchant import Merchant
 
+T = TypeVar('T')
+
+SIMULATION_STATE = [
+    'marketplace_balance',
+    'today',
+    'current_cash',
+    'bankruptcy_date',
+    'last_year_revenue',
+    'recent_history_revenue',
+    'ledger',
+    'sales_ledger',
+    'duration_in_debt',
+    'simulation_stopped'
+]
+RESULTS_STATE = frozenset([
+    'merchant',
+    'today',
+    'current_cash',
+    'bankruptcy_date',
+    'last_year_revenue',
+    'recent_history_revenue',
+    'current_repayment_rate',
+    'ledger'
+])
+
 
 class LoanSimulation(Primitive):
     def __init__(
             self, context: SimulationContext, data_generator: DataGenerator, merchant: Merchant,
             reference_loan: Optional[LoanSimulation] = None):
-        super(LoanSimulation, self).__init__(data_generator)
+        super(LoanSimulation, self).__init__()
+        self.version_counter = VersionCounter()
+        self.data_generator = data_generator
         self.context = context
         self.merchant = merchant
         self.simulation_results: Optional[LoanSimulationResults] = None
@@ -35,15 +66,57 @@ class LoanSimulation(Primitive):
         self.current_repayment_rate = self.default_repayment_rate()
         self.ledger = Ledger(self.data_generator, self.context)
         self.ledger.record_cash(self.today, self.initial_cash)
+        self.sales_ledger = SalesLedger(self.today)
         self.set_reference_loan(reference_loan)
         self.duration_in_debt = Duration(O_INT)
         self.snapshots: MutableMapping[Date, LoanSimulationResults] = {}
+        self.simulation_stopped = False
+        self.baseline_cache_hit: Optional[bool] = None
+        self.results_memo: MutableMapping[str, Any] = {}
+        self.results_memo_version: Optional[Tuple[int, int, int]] = None
+
+    def __setattr__(self, name: str, value: Any):
+        if name in RESULTS_STATE:
+            self.version_counter.increment()
+        super(LoanSimulation, self).__setattr__(name, value)
+
+    def results_version(self) -> Tuple[int, int, int]:
+        return self.version_counter.value, self.ledger.version_counter.value, self.merchant.state_version
+
+    def memoized(self, key: str, calculate: Callable[[], T]) -> T:
+        if not self.merchant.memoize_day_views:
+            return calculate()
+        version = self.results_version()
+        if version != self.results_memo_version:
+            self.results_memo = {}
+            self.results_memo_version = version
+        if key not in self.results_memo:
+            self.results_memo[key] = calculate()
+        return self.results_memo[key]
 
     def reset_id(self):
         super(LoanSimulation, self).reset_id()
         self.ledger.reset_id()
         self.merchant.reset_id()
 
+    @classmethod
+    def from_trunk(cls, trunk: LoanSimulation) -> LoanSimulation:
+        loan = cls(trunk.context, trunk.data_generator, trunk.merchant)
+        loan.share_state(trunk)
+        return loan
+
+    def share_state(self, source: LoanSimulation):
+        for name in SIMULATION_STATE:
+            setattr(self, name, getattr(source, name))
+
+    def copy_state(self, source: LoanSimulation, state_fields: List[str] = SIMULATION_STATE):
+        memo = {id(self.context): self.context, id(self.data_generator): self.data_generator}
+        for name in state_fields:
+            setattr(self, name, deepcopy(getattr(source, name), memo))
+        merchant = source.merchant.clone()
+        merchant.copy_id(self.merchant)
+        self.merchant = merchant
+
     def set_reference_loan(self, reference_loan: LoanSimulation):
         self.reference_loan = reference_loan
         self.init_loan_reference_diff()
@@ -90,12 +163,24 @@ class LoanSimulation(Primitive):
     def max_debt(self) -> Dollar:
         return self.amount_to_debt(self.loan_amount())
 
+    def risk_context(self, entity: RiskEntity) -> RiskContext:
+        return self.merchant.memoized(
+            self.today, ('risk_context', id(entity)), lambda: self.underwriting.calculate_score(entity, self.today))
+
+    def approved(self, entity: RiskEntity) -> bool:
+        return self.merchant.memoized(
+            self.today, ('approved', id(entity)),
+            lambda: self.underwriting.approved(entity, self.today, self.risk_context(entity)))
+
     def approved_amount(self) -> Dollar:
-        if not self.underwriting.approved(self.merchant, self.today):
-            return O
-        return self.loan_amount()
+        return self.memoized(
+            'approved_amount',
+            lambda: self.loan_amount() if self.approved(self.merchant) else O)
 
     def loan_amount(self) -> Dollar:
+        return self.memoized('loan_amount', self.calculate_loan_amount)
+
+    def calculate_loan_amount(self) -> Dollar:
         recent_monthly_revenue = self.recent_revenue() * constants.MONTH / \
                                  self.context.history_duration_for_amount_calculation
         amount = recent_monthly_revenue * self.context.loan_amount_per_monthly_income
@@ -103,6 +188,9 @@ class LoanSimulation(Primitive):
         return amount
 
     def credit_needed(self) -> Dollar:
+        return self.memoized('credit_needed', self.calculate_credit_needed)
+
+    def calculate_credit_needed(self) -> Dollar:
         buffer = self.merchant.committed_purchase_orders(self.today)
         max_cost_for_growth = self.merchant.max_cash_needed(self.today)
         cash_gap = buffer + max_cost_for_growth - self.current_cash
@@ -200,14 +288,18 @@ class LoanSimulation(Primitive):
         self.ledger.record_cash(self.today, self.current_cash)
 
     def simulate_sales(self):
-        self.last_year_revenue += self.merchant.revenue_per_day(self.today)
-        self.recent_history_revenue += self.merchant.revenue_per_day(self.today)
-        if self.today > constants.YEAR:
-            self.last_year_revenue -= self.merchant.revenue_per_day(self.today - constants.YEAR + 1)
-        if self.today > self.context.history_duration_for_amount_calculation:
-            self.recent_history_revenue -= self.merchant.revenue_per_day(
-                self.today - self.context.history_duration_for_amount_calculation + 1)
-        self.marketplace_balance += self.merchant.gp_per_day(self.today)
+        gp = self.merchant.gp_per_day(self.today)
+        self.sales_ledger.record_sales(self.today, self.merchant.revenue_per_day(self.today), gp)
+        self.update_revenue_history(self.today)
+        self.marketplace_balance += gp
+
+    def revenue_over_period(self, start_date: Date, last_date: Date) -> Dollar:
+        return self.sales_ledger.revenue(start_date, last_date)
+
+    def update_revenue_history(self, day: Date):
+        self.last_year_revenue = self.revenue_over_period(day - constants.YEAR + 1, day)
+        self.recent_history_revenue = self.revenue_over_period(
+            day - self.context.history_duration_for_amount_calculation + 1, day)
 
     def marketplace_payout(self):
         if self.today % self.context.marketplace_payment_cycle == 0:
@@ -234,16 +326,75 @@ class LoanSimulation(Primitive):
             return True
         return False
 
-    def simulate(self):
+    def simulate(self, is_decided: Optional[Callable[[LoanSimulation], bool]] = None) -> bool:
         assert self.today == self.data_generator.start_date
-        for i in range(self.data_generator.simulated_duration):
-            self.simulate_day()
-            if self.should_stop_simulation():
-                break
-            self.today += Duration(1)
-        self.today = Duration.min(self.data_generator.simulated_duration, self.today)
-        self.end_simulation()
-        self.calculate_results()
+        if not self.simulate_until(is_decided):
+            return False
+        self.finish_simulation()
+        return True
+
+    def simulate_until(self, is_decided: Optional[Callable[[LoanSimulation], bool]] = None) -> bool:
+        last_date = self.data_generator.start_date + self.data_generator.simulated_duration - 1
+        with self.merchant.memoized_day_views():
+            while not self.simulation_stopped and self.today <= last_date:
+                self.simulate_day()
+                if self.should_stop_simulation():
+                    self.simulation_stopped = True
+                    break
+                self.today += Duration(1)
+                if self.context.event_driven_simulation:
+                    self.skip_quiet_days(last_date)
+                if is_decided is not None and is_decided(self):
+                    return False
+        return True
+
+    def finish_simulation(self):
+        self.simulate_until()
+        with self.merchant.memoized_day_views():
+            self.today = Duration.min(self.data_generator.simulated_duration, self.today)
+            self.end_simulation()
+            self.calculate_results()
+
+    def skip_quiet_days(self, last_date: Date):
+        if self.today >= last_date or not self.is_quiet_day():
+            return
+        next_event_date = Duration.min(self.next_event_date(), last_date)
+        self.simulate_quiet_days(next_event_date - self.today)
+
+    def is_quiet_day(self) -> bool:
+        if self.reference_loan and self.context.loan_reference_type:
+            return False
+        if self.today % self.context.marketplace_payment_cycle == 0:
+            return False
+        if self.context.snapshot_cycle and self.today % self.context.snapshot_cycle == 0:
+            return False
+        if not self.credit_frozen():
+            return False
+        if self.merchant.annual_top_line(self.today) > self.context.max_merchant_top_line:
+            return False
+        return self.merchant.is_idle(self.today, self.current_cash)
+
+    def credit_frozen(self) -> bool:
+        return self.merchant.is_suspended(self.today) or not self.secondary_approval_conditions()
+
+    def next_event_date(self) -> Date:
+        events = [
+            self.merchant.next_event_date(self.today), self.next_cycle_date(self.context.marketplace_payment_cycle)]
+        if self.context.snapshot_cycle:
+            events.append(self.next_cycle_date(self.context.snapshot_cycle))
+        return Duration.min(events)
+
+    def next_cycle_date(self, cycle: Duration) -> Date:
+        return self.today - self.today % cycle + cycle
+
+    def simulate_quiet_days(self, duration: Duration):
+        gp = self.merchant.gp_per_day(self.today)
+        self.sales_ledger.record_sales(self.today, self.merchant.revenue_per_day(self.today), gp, duration)
+        self.update_revenue_history(self.today + duration - 1)
+        self.marketplace_balance += gp * duration
+        if self.ledger.outstanding_balance() > O:
+            self.duration_in_debt += duration
+        self.today += duration
 
     def end_simulation(self):
         if self.bankruptcy_date:
@@ -255,7 +406,7 @@ class LoanSimulation(Primitive):
         self.current_cash -= amount
         self.ledger.undo_active_loans()
 
-    def calculate_apr(self, duration: Duration) -> Percent:
+    def calculate_apr(self, duration: Union[Duration, np.ndarray]) -> Union[Percent, np.ndarray]:
         apr = (self.flat_fee + 1) ** (constants.YEAR / duration) - 1
         apr = min_max(apr, 0, constants.MAX_APR)
         return apr
@@ -279,7 +430,8 @@ class LoanSimulation(Primitive):
             self.duration_finished_rate(), self.ledger.num_loans())
 
     def remaining_credit(self) -> Dollar:
-        return Float.max(O, self.approved_amount() - self.debt_to_loan_amount(self.ledger.outstanding_balance()))
+        return self.memoized('remaining_credit', lambda: Float.max(
+            O, self.approved_amount() - self.debt_to_loan_amount(self.ledger.outstanding_balance())))
 
     def underutilized_credit(self) -> Dollar:
         return Float.min(self.credit_needed(), self.remaining_credit())
@@ -367,6 +519,9 @@ class LoanSimulation(Primitive):
         return loss
 
     def lender_profit(self) -> Dollar:
+        return self.memoized('lender_profit', self.calculate_lender_profit)
+
+    def calculate_lender_profit(self) -> Dollar:
         if self.ledger.total_credit() == O:
             return O
         revenues = self.interest_from_amount(self.debt_to_loan_amount(self.repaid_debt()))
@@ -400,6 +555,9 @@ class LoanSimulation(Primitive):
         return projected_profit
 
     def projected_remaining_debt(self) -> Dollar:
+        return self.memoized('projected_remaining_debt', self.calculate_projected_remaining_debt)
+
+    def calculate_projected_remaining_debt(self) -> Dollar:
         if self.ledger.outstanding_balance() == O:
             return O
         if self.is_default():
@@ -421,8 +579,8 @@ class LoanSimulation(Primitive):
         repaid = self.total_debt() - self.projected_remaining_debt()
         return repaid
 
-    def calculate_cost_of_capital_rate(self, duration: Duration) -> Percent:
-        return Percent(inverse_cagr(self.context.cost_of_capital, duration))
+    def calculate_cost_of_capital_rate(self, duration: Union[Duration, np.ndarray]) -> Union[Percent, np.ndarray]:
+        return inverse_cagr(self.context.cost_of_capital, duration)
 
     def operating_costs(self) -> Dollar:
         return self.context.operating_cost_per_loan * self.ledger.num_loans()
@@ -433,26 +591,27 @@ class LoanSimulation(Primitive):
         return repayment_amount
 
     def cost_of_capital(self) -> Dollar:
-        repayments_for_calculation = self.repayments_for_results()
-        cost_of_capital_rates = [self.calculate_cost_of_capital_rate(repayment.duration) for repayment in
-            repayments_for_calculation]
-        cost_of_capital_per_loan = [
-            cost_of_capital_rates[i] * self.debt_to_loan_amount(repayments_for_calculation[i].amount) for i in
-            range(len(repayments_for_calculation))]
-        total_cost_of_capital = Float.sum(cost_of_capital_per_loan)
-        return total_cost_of_capital
+        amounts, durations = self.repayments_for_results()
+        return Float(np.sum(self.calculate_cost_of_capital_rate(durations) * self.debt_to_loan_amount(amounts)))
 
     def debt_to_valuation(self) -> Percent:
         dtv = self.total_debt() / self.merchant.valuation(self.today, self.net_cashflow())
         return dtv
 
     def effective_apr(self) -> Percent:
-        repayments_for_calculation = self.repayments_for_results()
-        all_apr = [self.calculate_apr(repayment.duration) for repayment in repayments_for_calculation]
-        all_amounts = [loan.amount for loan in repayments_for_calculation]
-        apr = weighted_average(all_apr, all_amounts)
-        return apr
-
-    def repayments_for_results(self):
-        return self.ledger.projected_repayments(
-            self.projected_remaining_debt(), self.today, self.projected_amount_per_repayment()) + self.ledger.repayments
+        amounts, durations = self.repayments_for_results()
+        total_amount = Float(np.sum(amounts))
+        if total_amount == O:
+            return O
+        return Float(np.sum(self.calculate_apr(durations) * amounts)) / total_amount
+
+    def repayments_for_results(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.memoized('repayments_for_results', self.calculate_repayments_for_results)
+
+    def calculate_repayments_for_results(self) -> Tuple[np.ndarray, np.ndarray]:
+        _, projected_amounts, projected_durations = self.ledger.projected_repayment_schedule(
+            self.projected_remaining_debt(), self.today, self.projected_amount_per_repayment())
+        amounts = np.concatenate([projected_amounts, [float(repayment.amount) for repayment in self.ledger.repayments]])
+        durations = np.concatenate(
+            [projected_durations, [int(repayment.duration) for repayment in self.ledger.repayments]])
+        return amounts, durations
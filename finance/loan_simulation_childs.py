@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+from typing import Optional, Callable
+
+from finance.baseline_cache import BASELINE_CACHE, BaselineCache
 from loan_simulation import LoanSimulation
 from local_numbers import Dollar, O
 
 
 class IncreasingRebateLoanSimulation(LoanSimulation):
     def update_repayment_rate(self):
-        if self.ledger.active_loans and self.today >= self.ledger.get_current_loan().start_date + \
+        if self.ledger.has_active_loans() and self.today >= self.ledger.get_current_loan().start_date + \
                 self.context.loan_duration:
             self.current_repayment_rate = self.default_repayment_rate() + self.context.delayed_loan_repayment_increase
         else:
@@ -14,8 +17,21 @@ class IncreasingRebateLoanSimulation(LoanSimulation):
 
 
 class NoCapitalLoanSimulation(LoanSimulation):
+    def simulate(self, is_decided: Optional[Callable[[LoanSimulation], bool]] = None) -> bool:
+        if not BaselineCache.is_cacheable(self):
+            return super(NoCapitalLoanSimulation, self).simulate(is_decided)
+        key = BaselineCache.key(self)
+        self.baseline_cache_hit = BASELINE_CACHE.restore(key, self)
+        if not self.baseline_cache_hit:
+            super(NoCapitalLoanSimulation, self).simulate()
+            BASELINE_CACHE.store(key, self)
+        return True
+
     def add_debt(self, amount: Dollar):
         pass
 
     def loan_amount(self) -> Dollar:
         return O
+
+    def credit_frozen(self) -> bool:
+        return True
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, MutableMapping, Tuple, Union
+
+from common.context import RiskContext
+from common.local_enum import LoanSimulationType, LoanRetention
+from common.local_numbers import Dollar, Int, Date, Percent
+from finance.ledger import Ledger
+from finance.loan_simulation import LoanSimulation
+from finance.loan_simulation_results import LoanSimulationResults
+from seller.merchant import Merchant
+
+
+@dataclass(unsafe_hash=True)
+class MerchantSimulationTask:
+    stream_key: Tuple[int, ...]
+    loan_type: LoanSimulationType
+    data_generator_fingerprint: str
+    context_fingerprint: str
+    num_products_stratum: Optional[int] = None
+
+
+class LedgerSummary:
+    def __init__(self, credit: Dollar, loans_count: Int, balance: Dollar, paid_balance: Optional[Dollar] = None):
+        self.credit = credit
+        self.loans_count = loans_count
+        self.balance = balance
+        self.paid_balance = paid_balance
+
+    @classmethod
+    def generate_from_ledger(cls, ledger: Ledger) -> LedgerSummary:
+        return LedgerSummary(ledger.total_credit(), ledger.num_loans(), ledger.outstanding_balance(),
+            ledger.paid_balance)
+
+    @classmethod
+    def generate_from_results(cls, simulation_results: LoanSimulationResults) -> LedgerSummary:
+        return LedgerSummary(
+            simulation_results.total_credit, simulation_results.num_loans, simulation_results.outstanding_balance)
+
+    def total_credit(self) -> Dollar:
+        return self.credit
+
+    def num_loans(self) -> Int:
+        return self.loans_count
+
+    def outstanding_balance(self) -> Dollar:
+        return self.balance
+
+
+class UnderwritingSummary:
+    def __init__(self, initial_risk_context: RiskContext):
+        self.initial_risk_context = initial_risk_context
+
+
+class LoanSimulationRecord:
+    def __init__(
+            self, loan: LoanSimulation, stream_key: Optional[Tuple[int, ...]] = None,
+            retention: LoanRetention = LoanRetention.SUMMARY):
+        assert retention != LoanRetention.FULL
+        self.merchant: Optional[Merchant] = None
+        self.stream_key = stream_key
+        self.retention = retention
+        self.today: Date = loan.today
+        self.simulation_results: LoanSimulationResults = loan.simulation_results
+        self.underwriting = UnderwritingSummary(loan.underwriting.initial_risk_context)
+        self.baseline_cache_hit = loan.baseline_cache_hit
+        if retention == LoanRetention.SUMMARY:
+            self.bankruptcy_date: Optional[Date] = loan.bankruptcy_date
+            self.snapshots: MutableMapping[Date, LoanSimulationResults] = loan.snapshots
+            self.ledger = LedgerSummary.generate_from_ledger(loan.ledger)
+        else:
+            self.bankruptcy_date = None
+            self.snapshots = {}
+            self.ledger = LedgerSummary.generate_from_results(loan.simulation_results)
+
+    @staticmethod
+    def retain(
+            loan: LoanSimulation, retention: LoanRetention, stream_key: Optional[Tuple[int, ...]] = None) -> Union[
+        LoanSimulation, LoanSimulationRecord]:
+        if retention == LoanRetention.FULL:
+            return loan
+        return LoanSimulationRecord(loan, stream_key, retention)
+
+    def revenue_cagr(self) -> Percent:
+        return self.simulation_results.revenue_cagr
@@ -2,13 +2,13 @@ from __future__ import annotations
 
 from copy import deepcopy
 from dataclasses import dataclass, fields
-from typing import Optional, List
+from typing import Optional, List, MutableMapping
 
 import dacite
 
 import constants
 from common.local_numbers import Dollar, Percent, Int, Float, O, ONE, TWO
-from util import inherits_from, weighted_average, min_max
+from util import inherits_from, min_max
 
 
 @dataclass(unsafe_hash=True)
@@ -83,18 +83,15 @@ class AggregatedLoanSimulationResults(LoanSimulationResults):
 
     @classmethod
     def generate_from_list(
-            cls, simulations_results: List[LoanSimulationResults],
-            num_merchants: int) -> AggregatedLoanSimulationResults:
-        funded_loans = Int(len([lsr for lsr in simulations_results if lsr.total_credit > O]))
-        result = {'num_merchants': funded_loans, 'approval_rate': Percent(funded_loans / num_merchants)}
-        for field in fields(LoanSimulationResults):
-            values = [getattr(lsr, field.name) for lsr in simulations_results]
-            if field.name in NO_WEIGHTS_FIELDS:
-                result[field.name] = Float.mean(values)
-            else:
-                weights = [min_max(lsr.valuation, ONE, constants.MAX_RESULTS_WEIGHT) for lsr in simulations_results]
-                result[field.name] = weighted_average(values, weights)
-        return dacite.from_dict(AggregatedLoanSimulationResults, result)
+            cls, simulations_results: List[LoanSimulationResults], num_merchants: float,
+            sampling_weights: Optional[List[float]] = None) -> AggregatedLoanSimulationResults:
+        if sampling_weights is None:
+            sampling_weights = [1.0] * len(simulations_results)
+        assert len(sampling_weights) == len(simulations_results)
+        accumulator = LoanSimulationResultsAccumulator()
+        for lsr, sampling_weight in zip(simulations_results, sampling_weights):
+            accumulator.add(lsr, sampling_weight)
+        return accumulator.finalize(num_merchants)
 
     @classmethod
     def generate_from_numbers(
@@ -107,3 +104,40 @@ class AggregatedLoanSimulationResults(LoanSimulationResults):
             else:
                 result[field.name] = regular_field
         return dacite.from_dict(AggregatedLoanSimulationResults, result)
+
+
+class LoanSimulationResultsAccumulator:
+    def __init__(self):
+        self.count = 0.0
+        self.funded_count = 0
+        self.funded_weight = 0.0
+        self.total_weight = 0.0
+        self.sums: MutableMapping[str, float] = {field.name: 0.0 for field in fields(LoanSimulationResults)}
+
+    def add(self, lsr: LoanSimulationResults, sampling_weight: float = 1.0):
+        weight = float(min_max(lsr.valuation, ONE, constants.MAX_RESULTS_WEIGHT)) * sampling_weight
+        self.count += sampling_weight
+        if lsr.total_credit > O:
+            self.funded_count += 1
+            self.funded_weight += sampling_weight
+        self.total_weight += weight
+        for name in self.sums.keys():
+            value = float(getattr(lsr, name))
+            self.sums[name] += value * sampling_weight if name in NO_WEIGHTS_FIELDS else value * weight
+
+    def merge(self, other: LoanSimulationResultsAccumulator):
+        self.count += other.count
+        self.funded_count += other.funded_count
+        self.funded_weight += other.funded_weight
+        self.total_weight += other.total_weight
+        for name, value in other.sums.items():
+            self.sums[name] += value
+
+    def finalize(self, num_merchants: float) -> AggregatedLoanSimulationResults:
+        result = {'num_merchants': Int(self.funded_count), 'approval_rate': Percent(self.funded_weight / num_merchants)}
+        for name, value in self.sums.items():
+            if name in NO_WEIGHTS_FIELDS:
+                result[name] = Float(value / self.count) if self.count else O
+            else:
+                result[name] = Float(value / self.total_weight) if self.total_weight else O
+        return dacite.from_dict(AggregatedLoanSimulationResults, result)
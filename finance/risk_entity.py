@@ -4,6 +4,8 @@ from common.local_numbers import Percent, Ratio, Date
 
 
 class RiskEntity(ABC):
+    __slots__ = ()
+
     # TODO: calculate amount based on historical values
     def get_out_of_stock_rate(self, day: Date) -> Percent: pass
 
@@ -142,9 +142,11 @@ class LoanSimulationDiff:
         self.diff['merchant']['stock'] = {}
         for i in range(len(self.loan1.merchant.inventories)):
             self.diff['merchant']['stock'][i] = []
-            for j in range(len(self.loan1.merchant.inventories[i].batches)):
-                batch1 = self.loan1.merchant.inventories[i].batches[j]
-                batch2 = self.loan2.merchant.inventories[i].batches[j]
+            batches1 = self.loan1.merchant.inventories[i].all_batches()
+            batches2 = self.loan2.merchant.inventories[i].all_batches()
+            for j in range(min(len(batches1), len(batches2))):
+                batch1 = batches1[j]
+                batch2 = batches2[j]
                 if batch1.stock != batch2.stock and batch1.start_date <= min(today1, today2):
                     self.diff['merchant']['stock'][i].append((j, batch1.stock - batch2.stock, batch1.start_date))
             if not self.diff['merchant']['stock'][i]:
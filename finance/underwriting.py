@@ -1,13 +1,27 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Optional, List, Tuple, MutableMapping, Callable
+
+import numpy as np
+
+from common import constants
 from common.context import SimulationContext, RiskConfiguration, DataGenerator, RiskContext
-from common.local_numbers import Float, Percent, Ratio, Date, O, ONE
-from common.util import weighted_average, min_max
+from common.local_numbers import Float, Percent, Date
+from common.util import weighted_average
 from finance.risk_entity import RiskEntity
 
+PredictorAccessor = Callable[[Date], Float]
+COMPILED_SCORERS: MutableMapping[Tuple, CompiledScorer] = OrderedDict()
+
 
 class Underwriting:
     def __init__(self, context: SimulationContext, data_generator: DataGenerator, entity: RiskEntity):
         self.context = context
         self.data_generator = data_generator
+        self.scorer = CompiledScorer.from_context(context)
+        self.entity_accessors: MutableMapping[int, Tuple[RiskEntity, List[PredictorAccessor]]] = {}
         self.initial_risk_context = self.calculate_score(entity, self.data_generator.start_date)
 
     @staticmethod
@@ -18,33 +32,18 @@ class Underwriting:
     def risk_entity_method_name(predictor: str) -> str:
         return f'get_{predictor}'
 
-    def calculate_score(self, entity: RiskEntity, day: Date) -> RiskContext:
-        risk_context = RiskContext()
-        for predictor in vars(self.context.risk_context).keys():
-            risk_configuration = getattr(risk_context, predictor)
-            risk_configuration.score = self.benchmark_score(entity, predictor, day)
-        return risk_context
+    def predictor_accessors(self, entity: RiskEntity) -> List[PredictorAccessor]:
+        cached = self.entity_accessors.get(id(entity))
+        if cached is None or cached[0] is not entity:
+            cached = entity, self.scorer.bind_accessors(entity)
+            self.entity_accessors[id(entity)] = cached
+        return cached[1]
 
-    def benchmark_comparison(
-            self, benchmark: Float, value: Float, higher_is_better: bool, sensitivity: Ratio) -> Percent:
-        assert benchmark > O
-        if higher_is_better:
-            if value <= O:
-                return O
-            ratio = value / benchmark
-        else:
-            if value <= O:
-                return ONE
-            ratio = benchmark / value
-        ratio = sensitivity * (ratio - 0.5) + 0.5
-        return min_max(ratio, O, ONE)
-
-    def benchmark_score(self, entity: RiskEntity, predictor: str, day: Date):
-        configuration: RiskConfiguration = getattr(self.context.risk_context, predictor)
-        benchmark = getattr(self.context, Underwriting.benchmark_variable_name(predictor))
-        value = getattr(entity, Underwriting.risk_entity_method_name(predictor))(day)
-        score = self.benchmark_comparison(benchmark, value, configuration.higher_is_better, configuration.sensitivity)
-        return score
+    def predictor_scores(self, entity: RiskEntity, day: Date) -> np.ndarray:
+        return self.scorer.score(self.scorer.predictor_values(self.predictor_accessors(entity), day))
+
+    def calculate_score(self, entity: RiskEntity, day: Date) -> RiskContext:
+        return self.scorer.to_risk_context(self.predictor_scores(entity, day))
 
     @staticmethod
     def aggregated_score(risk_context: RiskContext) -> Percent:
@@ -52,11 +51,94 @@ class Underwriting:
         weights = [configuration.weight for configuration in vars(risk_context).values()]
         return weighted_average(scores, weights)
 
-    def approved(self, entity: RiskEntity, day: Date) -> bool:
-        risk_context = self.calculate_score(entity, day)
-        for _, configuration in vars(risk_context).items():
-            if configuration.score < configuration.threshold:
-                return False
-        if self.aggregated_score(risk_context) < self.context.min_risk_score:
-            return False
-        return True
+    def approved(self, entity: RiskEntity, day: Date, risk_context: Optional[RiskContext] = None) -> bool:
+        if risk_context is None:
+            scores = self.predictor_scores(entity, day)
+        else:
+            scores = self.scorer.risk_context_scores(risk_context)
+        return bool(self.scorer.approved(scores))
+
+
+class CompiledScorer:
+    def __init__(self, context: SimulationContext):
+        self.predictors = list(vars(context.risk_context).keys())
+        configurations: List[RiskConfiguration] = [
+            getattr(context.risk_context, predictor) for predictor in self.predictors]
+        self.method_names = [Underwriting.risk_entity_method_name(predictor) for predictor in self.predictors]
+        self.accessors_getter = attrgetter(*self.method_names)
+        self.benchmarks = np.array(
+            [getattr(context, Underwriting.benchmark_variable_name(predictor)) for predictor in self.predictors],
+            dtype=np.float64)
+        assert np.all(self.benchmarks > 0)
+        self.weights = np.array([configuration.weight for configuration in configurations], dtype=np.float64)
+        self.thresholds = np.array([configuration.threshold for configuration in configurations], dtype=np.float64)
+        self.sensitivities = np.array(
+            [configuration.sensitivity for configuration in configurations], dtype=np.float64)
+        self.higher_is_better = np.array([configuration.higher_is_better for configuration in configurations])
+        self.min_risk_score = float(context.min_risk_score)
+
+    @staticmethod
+    def configuration_key(context: SimulationContext) -> Tuple:
+        return tuple(
+            (predictor, float(getattr(context, Underwriting.benchmark_variable_name(predictor))),
+            configuration.higher_is_better, float(configuration.weight), float(configuration.threshold),
+            float(configuration.sensitivity)) for predictor, configuration in
+            vars(context.risk_context).items()), float(context.min_risk_score)
+
+    @staticmethod
+    def from_context(context: SimulationContext) -> CompiledScorer:
+        key = CompiledScorer.configuration_key(context)
+        if key in COMPILED_SCORERS:
+            COMPILED_SCORERS.move_to_end(key)
+            return COMPILED_SCORERS[key]
+        scorer = COMPILED_SCORERS[key] = CompiledScorer(context)
+        while len(COMPILED_SCORERS) > constants.COMPILED_SCORERS_CACHE_SIZE:
+            COMPILED_SCORERS.popitem(last=False)
+        return scorer
+
+    def bind_accessors(self, entity: RiskEntity) -> List[PredictorAccessor]:
+        accessors = self.accessors_getter(entity)
+        return list(accessors) if len(self.method_names) > 1 else [accessors]
+
+    @staticmethod
+    def predictor_values(accessors: List[PredictorAccessor], day: Date) -> np.ndarray:
+        return np.array([accessor(day) for accessor in accessors], dtype=np.float64)
+
+    def predictor_matrix(self, entities: List[RiskEntity], days: List[Date]) -> np.ndarray:
+        assert len(entities) == len(days)
+        values = np.empty((len(entities), len(self.predictors)), dtype=np.float64)
+        for i, (entity, day) in enumerate(zip(entities, days)):
+            values[i] = self.predictor_values(self.bind_accessors(entity), day)
+        return values
+
+    def score(self, values: np.ndarray) -> np.ndarray:
+        positive = values > constants.FLOAT_EQUALITY_TOLERANCE
+        safe_values = np.where(positive, values, 1)
+        ratios = np.where(self.higher_is_better, safe_values / self.benchmarks, self.benchmarks / safe_values)
+        ratios = np.clip(self.sensitivities * (ratios - 0.5) + 0.5, 0, 1)
+        return np.where(positive, ratios, np.where(self.higher_is_better, 0, 1))
+
+    def aggregated_score(self, scores: np.ndarray) -> np.ndarray:
+        total_weights = self.weights.sum()
+        if total_weights <= constants.FLOAT_EQUALITY_TOLERANCE:
+            return np.zeros(scores.shape[:-1])
+        return scores @ self.weights / total_weights
+
+    def approved(self, scores: np.ndarray) -> np.ndarray:
+        above_thresholds = np.all(scores >= self.thresholds - constants.FLOAT_EQUALITY_TOLERANCE, axis=-1)
+        return above_thresholds & (
+                self.aggregated_score(scores) >= self.min_risk_score - constants.FLOAT_EQUALITY_TOLERANCE)
+
+    def score_entities(
+            self, entities: List[RiskEntity], days: List[Date]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        scores = self.score(self.predictor_matrix(entities, days))
+        return scores, self.aggregated_score(scores), self.approved(scores)
+
+    def risk_context_scores(self, risk_context: RiskContext) -> np.ndarray:
+        return np.array([getattr(risk_context, predictor).score for predictor in self.predictors], dtype=np.float64)
+
+    def to_risk_context(self, scores: np.ndarray) -> RiskContext:
+        risk_context = RiskContext()
+        for predictor, score in zip(self.predictors, scores):
+            getattr(risk_context, predictor).score = Float(score)
+        return risk_context
@@ -6,8 +6,9 @@ from typing import Optional
 
 from common import constants
 from common.context import DataGenerator
-from common.local_numbers import Float, Percent, Ratio, Date, Duration, Stock, Dollar, O, ONE, O_INT, HALF, ONE_INT
-from common.primitive import Primitive
+from common.local_numbers import Float, Percent, Ratio, Date, Duration, Stock, Dollar, O, ONE, O_INT, HALF, ONE_INT, \
+    float_equals
+from common.primitive import Primitive, typed_number, VersionCounter
 from common.util import min_max
 from finance.risk_entity import RiskEntity
 from seller.product import Product
@@ -15,6 +16,7 @@ from seller.product import Product
 
 @dataclass(unsafe_hash=True)
 class PurchaseOrder:
+    __slots__ = ('stock', 'upfront_cost', 'post_manufacturing_cost')
     stock: Stock
     upfront_cost: Dollar
     post_manufacturing_cost: Dollar
@@ -24,11 +26,16 @@ class PurchaseOrder:
 
 
 class Batch(Primitive, RiskEntity):
+    __slots__ = (
+        'product', 'inventory_turnover_ratio', 'duration', 'start_date', 'last_date', 'shipping_duration', 'lead_time',
+        'stock', 'out_of_stock_rate', 'roas', 'organic_rate', 'sgna_rate', 'purchase_order', 'next_batch',
+        'version_counter')
+
     def __init__(
-            self, data_generator: DataGenerator, product: Product, shipping_duration: Duration,
-            out_of_stock_rate: Percent, inventory_turnover_ratio: Ratio, roas: Ratio, organic_rate: Percent,
-            start_date: Date, stock: Stock, sgna_rate: Percent):
-        super(Batch, self).__init__(data_generator)
+            self, product: Product, shipping_duration: Duration, out_of_stock_rate: Percent,
+            inventory_turnover_ratio: Ratio, roas: Ratio, organic_rate: Percent, start_date: Date, stock: Stock,
+            sgna_rate: Percent):
+        super(Batch, self).__init__()
         self.product = product
         self.inventory_turnover_ratio = inventory_turnover_ratio
         self.duration = self.calculate_duration(self.inventory_turnover_ratio)
@@ -44,6 +51,11 @@ class Batch(Primitive, RiskEntity):
         self.sgna_rate = sgna_rate
         self.purchase_order: Optional[PurchaseOrder] = None
         self.next_batch: Optional[Batch] = None
+        self.version_counter = VersionCounter()
+
+    @property
+    def data_generator(self) -> DataGenerator:
+        return self.product.data_generator
 
     @staticmethod
     def calculate_duration(inventory_turnover_ratio: Ratio) -> Duration:
@@ -64,10 +76,11 @@ class Batch(Primitive, RiskEntity):
         organic_rate = Batch.generate_organic_rate(data_generator, previous, roas)
         start_date = (previous.last_date + 1) if previous else data_generator.start_date
         new_batch = Batch(
-            data_generator, product, shipping_duration, out_of_stock_rate, inventory_turnover_ratio, roas,
-            organic_rate, start_date, stock, sgna_rate)
+            product, shipping_duration, out_of_stock_rate, inventory_turnover_ratio, roas, organic_rate, start_date,
+            stock, sgna_rate)
         if previous:
             previous.next_batch = new_batch
+            new_batch.version_counter = previous.version_counter
         return new_batch
 
     @classmethod
@@ -164,23 +177,30 @@ class Batch(Primitive, RiskEntity):
     def gp_margin(self) -> Percent:
         # TODO: gradual organic ratio
         # TODO: sell only organic if margin is negative
+        if self.native_numbers:
+            margin = float(self.revenue_margin()) - float(self.marketing_margin()) - float(self.sgna_rate)
+            return 0.0 if margin <= constants.FLOAT_EQUALITY_TOLERANCE else margin
         margin = self.revenue_margin() - self.marketing_margin() - self.sgna_rate
         return Float.max(O, margin)
 
+    @typed_number(Percent)
     def marketing_margin(self) -> Percent:
-        margin = (self.acos() / self.product.price) * (1 - self.organic_rate)
+        margin = (float(self.acos()) / float(self.product.price)) * (1 - float(self.organic_rate))
         return margin
 
+    @typed_number(Dollar)
     def acos(self) -> Dollar:
-        return self.product.price / self.roas
+        return float(self.product.price) / float(self.roas)
 
+    @typed_number(Date)
     def get_manufacturing_done_date(self) -> Optional[Date]:
         if self.purchase_order is None:
             return None
-        return self.get_purchase_order_start_date() + self.product.manufacturing_duration
+        return int(self.get_purchase_order_start_date()) + int(self.product.manufacturing_duration)
 
+    @typed_number(Date)
     def get_purchase_order_start_date(self) -> Date:
-        return self.last_date - self.lead_time + 1
+        return int(self.last_date) - int(self.lead_time) + 1
 
     def max_purchase_order(self) -> PurchaseOrder:
         stock = self.max_stock_for_next_purchase_order()
@@ -195,14 +215,19 @@ class Batch(Primitive, RiskEntity):
         stock = min_max(stock, self.product.min_purchase_order_size, self.data_generator.max_purchase_order_size)
         return stock
 
-    def initiate_new_purchase_order(self, day: Date, available_cash: Dollar) -> Optional[PurchaseOrder]:
+    def next_purchase_order(self, available_cash: Dollar) -> PurchaseOrder:
         new_purchase_order = self.max_purchase_order()
         if not self.can_afford_purchase_order(new_purchase_order, available_cash):
             stock = self.product.batch_size_from_cost(available_cash)
             upfront_cost, post_cost = self.product.purchase_order_cost(stock)
             new_purchase_order = PurchaseOrder(stock, upfront_cost, post_cost)
+        return new_purchase_order
+
+    def initiate_new_purchase_order(self, day: Date, available_cash: Dollar) -> Optional[PurchaseOrder]:
+        new_purchase_order = self.next_purchase_order(available_cash)
         if new_purchase_order.stock >= self.product.min_purchase_order_size:
             self.purchase_order = new_purchase_order
+            self.version_counter.increment()
             if self.next_batch:
                 self.next_batch.stock = self.purchase_order.stock
             if day > self.get_purchase_order_start_date():
@@ -213,12 +238,14 @@ class Batch(Primitive, RiskEntity):
         extension = day - self.get_purchase_order_start_date()
         self.duration += extension
         self.last_date += extension
+        self.version_counter.increment()
         if self.next_batch:
             self.next_batch.push_start_date(extension)
 
     def push_start_date(self, extension: Duration):
         self.start_date += extension
         self.last_date += extension
+        self.version_counter.increment()
         if self.next_batch:
             self.next_batch.push_start_date(extension)
 
@@ -231,12 +258,29 @@ class Batch(Primitive, RiskEntity):
         return purchase_order.total_cost() if self.data_generator.conservative_cash_management else \
             purchase_order.post_manufacturing_cost
 
+    @typed_number(Dollar)
     def max_cash_needed(self, day: Date) -> Dollar:
         if day >= self.get_purchase_order_start_date() and self.purchase_order is None:
-            return self.cash_needed_to_afford_purchase_order(self.max_purchase_order())
+            return float(self.cash_needed_to_afford_purchase_order(self.max_purchase_order()))
         elif day == self.get_manufacturing_done_date() and self.purchase_order:
-            return self.purchase_order.post_manufacturing_cost
-        return O
+            return float(self.purchase_order.post_manufacturing_cost)
+        return 0.0
+
+    def is_idle(self, day: Date, cash_for_new_orders: Dollar) -> bool:
+        if self.purchase_order is None:
+            if day < self.get_purchase_order_start_date():
+                return True
+            return self.next_purchase_order(cash_for_new_orders).stock < self.product.min_purchase_order_size
+        return day != self.get_manufacturing_done_date()
+
+    def next_event_date(self, day: Date) -> Date:
+        events = [self.last_date + 1, self.start_date + self.duration_in_stock()]
+        if self.purchase_order is None:
+            events.append(self.get_purchase_order_start_date())
+        else:
+            manufacturing_done_date = self.get_manufacturing_done_date()
+            events.extend([manufacturing_done_date, manufacturing_done_date + 1])
+        return Duration.min([event for event in events if event > day])
 
     def inventory_cost(self, day: Date, cash_for_new_orders: Dollar) -> Dollar:
         assert self.start_date <= day <= self.last_date
@@ -251,18 +295,21 @@ class Batch(Primitive, RiskEntity):
         return O
 
     def is_out_of_stock(self, day: Date) -> bool:
-        return day - self.start_date >= self.duration_in_stock()
+        return int(day) - int(self.start_date) >= self.duration_in_stock()
 
+    @typed_number(Float)
     def sales_velocity(self) -> Float:
-        return self.stock / (self.duration * (ONE - self.out_of_stock_rate))
+        return float(self.stock) / (float(self.duration) * (1 - float(self.out_of_stock_rate)))
 
+    @typed_number(Dollar)
     def total_revenue_per_day(self, day: Date) -> Dollar:
         if self.is_out_of_stock(day):
-            return O
-        return self.sales_velocity() * self.product.price
+            return 0.0
+        return float(self.sales_velocity()) * float(self.product.price)
 
+    @typed_number(Dollar)
     def revenue_per_day(self, day: Date) -> Dollar:
-        return self.total_revenue_per_day(day) * self.revenue_margin()
+        return float(self.total_revenue_per_day(day)) * float(self.revenue_margin())
 
     @staticmethod
     def revenue_margin() -> Percent:
@@ -271,10 +318,16 @@ class Batch(Primitive, RiskEntity):
     def profit_margin(self) -> Percent:
         return self.gp_margin() - self.product.cogs_margin
 
+    @typed_number(Dollar)
     def gp_per_day(self, day: Date) -> Dollar:
-        return self.total_revenue_per_day(day) * self.gp_margin()
+        return float(self.total_revenue_per_day(day)) * float(self.gp_margin())
 
     def duration_in_stock(self) -> Duration:
+        if self.native_numbers:
+            sales_velocity = self.sales_velocity()
+            if float_equals(sales_velocity, 0):
+                return int(self.duration) if self.stock > 0 else 0
+            return math.ceil(float(self.stock) / sales_velocity - constants.FLOAT_EQUALITY_TOLERANCE)
         if self.sales_velocity() == 0:
             if self.stock > 0:
                 return self.duration
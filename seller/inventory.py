@@ -1,46 +1,122 @@
 from __future__ import annotations
 
 import math
+from copy import deepcopy
 from typing import Optional, List
 
+from numpy.random import Generator, default_rng
+
 from common import constants
 from common.context import DataGenerator
-from common.local_numbers import Percent, Date, Duration, Dollar, O, ONE, Stock
-from common.primitive import Primitive
+from common.local_numbers import Percent, Date, Duration, Dollar, O, ONE, Stock, float_equals
+from common.primitive import Primitive, typed_number, VersionCounter
 from seller.batch import Batch
 from seller.product import Product
 
 
 class Inventory(Primitive):
-    def __init__(self, data_generator: DataGenerator, product: Product, batches: List[Batch]):
-        super(Inventory, self).__init__(data_generator)
+    __slots__ = ('product', 'batches', 'batch_stream', 'cursor', 'version_counter')
+
+    def __init__(self, product: Product, batches: List[Batch], batch_stream: Optional[Generator] = None):
+        super(Inventory, self).__init__()
         self.product = product
         self.batches = batches
+        self.batch_stream = batch_stream
+        self.cursor = 0
+        self.version_counter = VersionCounter()
+        self.share_version_counter(self.version_counter)
+
+    @property
+    def data_generator(self) -> DataGenerator:
+        return self.product.data_generator
 
     @classmethod
     def generate_simulated(
             cls, data_generator: DataGenerator, sgna_rate: Optional[Percent] = None,
             product: Optional[Product] = None) -> Inventory:
+        new_inventory = cls.generate_first_batch(data_generator, sgna_rate, product)
+        new_inventory.generate_batch_chain()
+        return new_inventory
+
+    @classmethod
+    def generate_first_batch(
+            cls, data_generator: DataGenerator, sgna_rate: Optional[Percent] = None,
+            product: Optional[Product] = None) -> Inventory:
         product = product or Product.generate_simulated(data_generator)
         batches = [Batch.generate_simulated(data_generator, product, sgna_rate)]
-        start_date = batches[0].start_date
-        while start_date <= data_generator.simulated_duration:
-            next_batch = Batch.generate_simulated(data_generator, previous=batches[-1])
-            start_date = next_batch.start_date
-            batches.append(next_batch)
-        new_inventory = Inventory(data_generator, product, batches)
-        return new_inventory
+        return Inventory(product, batches)
+
+    def generate_batch_chain(self):
+        if self.data_generator.lazy_batches:
+            self.batch_stream = default_rng(self.data_generator.spawn_seed())
+            self.generate_batches_until(self.batches[0].start_date)
+        else:
+            self.materialize()
+
+    def share_version_counter(self, version_counter: VersionCounter):
+        self.version_counter = version_counter
+        for batch in self.batches:
+            batch.version_counter = version_counter
+
+    def is_complete(self) -> bool:
+        return self.batches[-1].start_date > self.data_generator.simulated_duration
+
+    def generate_next_batch(self):
+        if self.batch_stream is None:
+            self.batches.append(Batch.generate_simulated(self.data_generator, previous=self.batches[-1]))
+        else:
+            with self.data_generator.use_random_stream(self.batch_stream):
+                self.batches.append(Batch.generate_simulated(self.data_generator, previous=self.batches[-1]))
+        self.version_counter.increment()
+
+    def generate_batches_until(self, day: Date):
+        while not self.is_complete() and self.batches[-1].start_date <= day:
+            self.generate_next_batch()
+
+    def materialize(self):
+        while not self.is_complete():
+            self.generate_next_batch()
+
+    def all_batches(self) -> List[Batch]:
+        if self.batch_stream is not None:
+            self.materialize()
+        return self.batches
 
     def __getitem__(self, day: Date) -> Batch:
-        assert day in self, f'{day} not in {[(batch.start_date, batch.last_date) for batch in self.batches]}'
-        return [batch for batch in self.batches if batch.start_date <= day <= batch.last_date][0]
+        index = self.batch_index(day)
+        assert index is not None, f'{day} not in {[(batch.start_date, batch.last_date) for batch in self.batches]}'
+        return self.batches[index]
 
     def __contains__(self, day):
         assert isinstance(day, int)
-        return len([batch for batch in self.batches if batch.start_date <= day <= batch.last_date]) > 0
-
+        return self.batch_index(day) is not None
+
+    def batch_index(self, day: Date) -> Optional[int]:
+        if self.batch_stream is not None:
+            self.generate_batches_until(day)
+        if self.cursor < len(self.batches):
+            for index in range(self.cursor, min(self.cursor + 2, len(self.batches))):
+                if self.batches[index].start_date <= day <= self.batches[index].last_date:
+                    self.cursor = index
+                    return index
+        low, high = 0, len(self.batches)
+        while low < high:
+            middle = (low + high) // 2
+            if self.batches[middle].start_date <= day:
+                low = middle + 1
+            else:
+                high = middle
+        index = low - 1
+        if index < 0 or day > self.batches[index].last_date:
+            return None
+        self.cursor = index
+        return index
+
+    @typed_number(Dollar)
     def annual_top_line(self, day: Date) -> Dollar:
-        return self[day].inventory_turnover_ratio * self[day].stock * self.product.price * self[day].revenue_margin()
+        batch = self[day]
+        return float(batch.inventory_turnover_ratio) * float(batch.stock) * float(self.product.price) * float(
+            batch.revenue_margin())
 
     def gp_per_day(self, day: Date) -> Dollar:
         return self[day].gp_per_day(day)
@@ -49,20 +125,22 @@ class Inventory(Primitive):
         return self[day].revenue_per_day(day)
 
     def purchase_order_valuation(self, day: Date) -> Dollar:
-        if not self[day].purchase_order:
+        batch = self[day]
+        if not batch.purchase_order:
             return O
-        if self[day].sales_velocity() == O:
+        if float_equals(batch.sales_velocity(), 0):
             return O
-        purchase_order_stock = self[day].purchase_order.stock
+        purchase_order_stock = batch.purchase_order.stock
         next_purchase_order_value = purchase_order_stock * self.product.price
-        remaining_lead_time = self[day].last_date.from_date(day)
+        remaining_lead_time = batch.last_date.from_date(day)
         time_to_sell = self.duration_to_sell(day, purchase_order_stock)
         return Inventory.discounted_inventory_value(next_purchase_order_value, time_to_sell, remaining_lead_time)
 
     def current_inventory_valuation(self, day: Date) -> Dollar:
-        if self[day].sales_velocity() == 0:
+        batch = self[day]
+        if float_equals(batch.sales_velocity(), 0):
             return O
-        remaining_stock = self[day].remaining_stock(day)
+        remaining_stock = batch.remaining_stock(day)
         stock_value = remaining_stock * self.product.price
         time_to_sell = self.duration_to_sell(day, remaining_stock)
         return Inventory.discounted_inventory_value(stock_value, time_to_sell)
@@ -89,6 +167,15 @@ class Inventory(Primitive):
                 1 - daily_value_discount)
         return value_per_day * geometric_series_sum_factor * lead_time_factor
 
+    def clone(self) -> Inventory:
+        clone = self.shallow_copy()
+        clone.batches = [batch.shallow_copy() for batch in self.batches]
+        for batch, next_batch in zip(clone.batches, clone.batches[1:]):
+            batch.next_batch = next_batch
+        clone.batch_stream = deepcopy(self.batch_stream)
+        clone.share_version_counter(VersionCounter(self.version_counter.value))
+        return clone
+
     def reset_id(self):
         super(Inventory, self).reset_id()
         self.product.reset_id()
@@ -98,5 +185,7 @@ class Inventory(Primitive):
     def copy_id(self, source: Inventory):
         super(Inventory, self).copy_id(source)
         self.product.copy_id(source.product)
-        for i in range(len(self.batches)):
-            self.batches[i].copy_id(source.batches[i])
+        batches = self.all_batches()
+        source_batches = source.all_batches()
+        for i in range(min(len(batches), len(source_batches))):
+            batches[i].copy_id(source_batches[i])
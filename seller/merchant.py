@@ -1,35 +1,83 @@
 from __future__ import annotations
 
-from random import randint
-from typing import Optional, List
+from contextlib import contextmanager
+from typing import Optional, List, Callable, MutableMapping, Any, TypeVar, Tuple, Hashable
 
 from common import constants
 from common.context import DataGenerator
-from common.local_numbers import Float, Percent, Ratio, Date, Dollar, O, Int
-from common.primitive import Primitive
+from common.local_numbers import Float, Percent, Ratio, Date, Dollar, O, Int, Duration
+from common.primitive import Primitive, typed_number, VersionCounter
 from common.util import weighted_average, min_max
 from finance.risk_entity import RiskEntity
 from seller.batch import Batch
 from seller.inventory import Inventory
 
+T = TypeVar('T')
+
 
 class Merchant(Primitive, RiskEntity):
+    __slots__ = (
+        'data_generator', 'inventories', 'suspension_start_date', 'stream_key', 'stream_fingerprint', 'stream_version',
+        'num_products_stratum', 'sampling_weight', 'version_counter', 'day_views_version', 'memoize_day_views',
+        'day_views')
+
     def __init__(
             self, data_generator: DataGenerator, inventories: List[Inventory],
             suspension_start_date: Optional[Date]):
-        super(Merchant, self).__init__(data_generator)
+        super(Merchant, self).__init__()
+        self.data_generator = data_generator
         self.inventories = inventories
         self.suspension_start_date: Optional[Date] = suspension_start_date
+        self.stream_key: Optional[Tuple[int, ...]] = None
+        self.stream_fingerprint: Optional[str] = None
+        self.stream_version: Optional[int] = None
+        self.num_products_stratum: Optional[int] = None
+        self.sampling_weight = 1.0
+        self.version_counter = VersionCounter()
+        self.share_version_counter(self.version_counter)
+        self.memoize_day_views = False
+        self.day_views: MutableMapping[Date, MutableMapping[Hashable, Any]] = {}
+        self.day_views_version = self.state_version
 
     @classmethod
     def generate_simulated(
-            cls, data_generator: DataGenerator, inventories: Optional[List[Inventory]] = None) -> Merchant:
+            cls, data_generator: DataGenerator, inventories: Optional[List[Inventory]] = None,
+            validator: Optional[Callable[[Merchant], bool]] = None,
+            num_products_stratum: Optional[int] = None) -> Optional[Merchant]:
+        if inventories:
+            account_suspension_date = Merchant.calculate_suspension_start_date(data_generator)
+            return Merchant(data_generator, inventories, account_suspension_date)
         num_products = cls.generate_num_products(data_generator)
+        num_products = num_products_stratum or num_products
         sgna_rate = Batch.generate_sgna_rate(data_generator)
-        inventories = inventories or [Inventory.generate_simulated(data_generator, sgna_rate) for _ in
-            range(num_products)]
+        inventories = [Inventory.generate_first_batch(data_generator, sgna_rate) for _ in range(num_products)]
         account_suspension_date = Merchant.calculate_suspension_start_date(data_generator)
-        return Merchant(data_generator, inventories, account_suspension_date)
+        merchant = Merchant(data_generator, inventories, account_suspension_date)
+        merchant.num_products_stratum = num_products_stratum
+        if validator is not None and not validator(merchant):
+            return None
+        for inventory in inventories:
+            inventory.generate_batch_chain()
+        return merchant
+
+    @classmethod
+    def generate_from_stream(
+            cls, data_generator: DataGenerator, *stream_key: int,
+            validator: Optional[Callable[[Merchant], bool]] = None,
+            num_products_stratum: Optional[int] = None) -> Optional[Merchant]:
+        with data_generator.random_stream(*stream_key):
+            merchant = cls.generate_simulated(
+                data_generator, validator=validator, num_products_stratum=num_products_stratum)
+        if merchant is None:
+            return None
+        merchant.stream_key = tuple(stream_key)
+        merchant.stream_fingerprint = data_generator.fingerprint()
+        merchant.stream_version = merchant.state_version
+        return merchant
+
+    def matches_stream(self, data_generator_fingerprint: str) -> bool:
+        return self.stream_key is not None and self.stream_fingerprint == data_generator_fingerprint and \
+               self.state_version == self.stream_version
 
     @classmethod
     def generate_num_products(cls, data_generator: DataGenerator):
@@ -41,14 +89,59 @@ class Merchant(Primitive, RiskEntity):
     def calculate_suspension_start_date(cls, data_generator: DataGenerator) -> Optional[Date]:
         suspension_start_date = None
         if data_generator.random() < data_generator.account_suspension_chance:
-            suspension_start_date = randint(data_generator.start_date, data_generator.simulated_duration)
+            suspension_start_date = data_generator.randint(data_generator.start_date, data_generator.simulated_duration)
         return suspension_start_date
 
+    @property
+    def state_version(self) -> int:
+        return self.version_counter.value
+
+    def share_version_counter(self, version_counter: VersionCounter):
+        self.version_counter = version_counter
+        for inventory in self.inventories:
+            inventory.share_version_counter(version_counter)
+
+    @contextmanager
+    def memoized_day_views(self):
+        previous_memoize_day_views = self.memoize_day_views
+        self.memoize_day_views = True
+        try:
+            yield
+        finally:
+            self.memoize_day_views = previous_memoize_day_views
+            if not previous_memoize_day_views:
+                self.day_views = {}
+
+    def invalidate_day_views(self):
+        self.version_counter.increment()
+        self.day_views = {}
+        self.day_views_version = self.state_version
+
+    def memoized(self, day: Date, key: Hashable, calculate: Callable[[], T]) -> T:
+        if not self.memoize_day_views:
+            return calculate()
+        if self.day_views_version != self.state_version:
+            self.day_views = {}
+            self.day_views_version = self.state_version
+        day_view = self.day_views.get(day)
+        if day_view is None:
+            if len(self.day_views) >= constants.MERCHANT_DAY_VIEWS_CACHE_SIZE:
+                del self.day_views[next(iter(self.day_views))]
+            day_view = self.day_views[day] = {}
+        if key not in day_view:
+            day_view[key] = calculate()
+        return day_view[key]
+
     def num_products(self, *args, **kwargs) -> Int:
         return Int(len(self.inventories))
 
+    def top_lines(self, day: Date) -> List[Dollar]:
+        return self.memoized(
+            day, 'top_lines', lambda: [inventory.annual_top_line(day) for inventory in self.inventories])
+
+    @typed_number(Dollar)
     def annual_top_line(self, day: Date) -> Dollar:
-        return Float.sum([inventory.annual_top_line(day) for inventory in self.inventories])
+        return self.memoized(day, 'annual_top_line', lambda: sum(self.top_lines(day)))
 
     def is_suspended(self, day: Date):
         # TODO: push all inventory dates by constants.ACCOUNT_SUSPENSION_DURATION to better simulate suspension
@@ -56,24 +149,38 @@ class Merchant(Primitive, RiskEntity):
                self.suspension_start_date <= day <= self.suspension_start_date + \
                constants.ACCOUNT_SUSPENSION_DURATION - 1
 
+    @typed_number(Dollar)
     def gp_per_day(self, day: Date) -> Dollar:
         if self.is_suspended(day):
-            return O
-        total_gp = Float.sum([inventory.gp_per_day(day) for inventory in self.inventories])
-        return total_gp
+            return 0.0
+        return self.memoized(
+            day, 'gp_per_day', lambda: sum([inventory.gp_per_day(day) for inventory in self.inventories]))
 
+    @typed_number(Dollar)
     def revenue_per_day(self, day: Date) -> Dollar:
         if self.is_suspended(day):
-            return O
-        total_revenue = Float.sum([inventory.revenue_per_day(day) for inventory in self.inventories])
-        return total_revenue
+            return 0.0
+        return self.memoized(
+            day, 'revenue_per_day', lambda: sum([inventory.revenue_per_day(day) for inventory in self.inventories]))
 
+    def is_idle(self, day: Date, current_cash: Dollar) -> bool:
+        cash_for_new_orders = Float.max(O, current_cash - self.committed_purchase_orders(day))
+        return all([batch.is_idle(day, cash_for_new_orders) for batch in self.current_batches(day)])
+
+    def next_event_date(self, day: Date) -> Date:
+        events = [batch.next_event_date(day) for batch in self.current_batches(day)]
+        if self.suspension_start_date:
+            events.extend(
+                [self.suspension_start_date, self.suspension_start_date + constants.ACCOUNT_SUSPENSION_DURATION])
+        return Duration.min([event for event in events if event > day])
+
+    @typed_number(Dollar)
     def max_cash_needed(self, day: Date) -> Dollar:
-        max_cost = Float.sum([batch.max_cash_needed(day) for batch in self.current_batches(day)])
+        max_cost = sum([batch.max_cash_needed(day) for batch in self.current_batches(day)])
         return max_cost
 
     def current_batches(self, day: Date) -> List[Batch]:
-        return [inventory[day] for inventory in self.inventories]
+        return self.memoized(day, 'current_batches', lambda: [inventory[day] for inventory in self.inventories])
 
     def batch_profit_margin(self, batch: Batch) -> Percent:
         return batch.profit_margin()
@@ -94,11 +201,12 @@ class Merchant(Primitive, RiskEntity):
                 cash_for_new_orders -= batch.purchase_order.total_cost()
         return total_to_pay
 
+    @typed_number(Dollar)
     def committed_purchase_orders(self, day: Date) -> Dollar:
         # TODO: embed cashdlow forecasting into the calculation
         committed_purchase_orders = [batch.purchase_order for batch in self.current_batches(day) if
             batch.purchase_order and day <= batch.get_manufacturing_done_date()]
-        total_committed_costs = Float.sum([po.post_manufacturing_cost for po in committed_purchase_orders])
+        total_committed_costs = sum([po.post_manufacturing_cost for po in committed_purchase_orders])
         return total_committed_costs
 
     def has_future_revenue(self, day: Date) -> bool:
@@ -108,38 +216,46 @@ class Merchant(Primitive, RiskEntity):
         return False
 
     def valuation(self, day: Date, net_cashflow: Dollar) -> Dollar:
-        return net_cashflow + Float.sum([inventory.valuation(day) for inventory in self.inventories])
+        return net_cashflow + self.memoized(
+            day, 'valuation', lambda: Float.sum([inventory.valuation(day) for inventory in self.inventories]))
 
     def inventory_value(self, day: Date) -> Dollar:
-        return Float.sum([inventory.current_inventory_valuation(day) for inventory in self.inventories])
+        return self.memoized(
+            day, 'inventory_value',
+            lambda: Float.sum([inventory.current_inventory_valuation(day) for inventory in self.inventories]))
+
+    def weighted_by_top_lines(self, day: Date, key: str, batch_value: Callable[[Batch], Float]) -> Float:
+        return self.memoized(
+            day, key, lambda: weighted_average(
+                [batch_value(inventory[day]) for inventory in self.inventories], self.top_lines(day)))
 
     def get_organic_rate(self, day: Date) -> Percent:
-        top_lines = [inventory.annual_top_line(day) for inventory in self.inventories]
-        organic_rates = [inventory[day].organic_rate for inventory in self.inventories]
-        return weighted_average(organic_rates, top_lines)
+        return self.weighted_by_top_lines(day, 'organic_rate', lambda batch: batch.organic_rate)
 
     def get_out_of_stock_rate(self, day: Date) -> Percent:
-        top_lines = [inventory.annual_top_line(day) for inventory in self.inventories]
-        out_of_stock_rates = [inventory[day].out_of_stock_rate for inventory in self.inventories]
-        return weighted_average(out_of_stock_rates, top_lines)
+        return self.weighted_by_top_lines(day, 'out_of_stock_rate', lambda batch: batch.out_of_stock_rate)
 
     def profit_margin(self, day: Date) -> Percent:
-        top_lines = [inventory.annual_top_line(day) for inventory in self.inventories]
-        profit_margins = [inventory[day].profit_margin() for inventory in self.inventories]
-        return weighted_average(profit_margins, top_lines)
+        return self.weighted_by_top_lines(day, 'profit_margin', lambda batch: batch.profit_margin())
 
     def get_adjusted_profit_margin(self, day: Date) -> Percent:
         return self.profit_margin(day) + constants.PROFIT_MARGIN_ADJUSTMENT
 
     def get_inventory_turnover_ratio(self, day: Date) -> Ratio:
-        top_lines = [inventory.annual_top_line(day) for inventory in self.inventories]
-        ratios = [inventory[day].inventory_turnover_ratio for inventory in self.inventories]
-        return weighted_average(ratios, top_lines)
+        return self.weighted_by_top_lines(
+            day, 'inventory_turnover_ratio', lambda batch: batch.inventory_turnover_ratio)
 
     def get_roas(self, day: Date) -> Ratio:
-        top_lines = [inventory.annual_top_line(day) for inventory in self.inventories]
-        ratios = [inventory[day].roas for inventory in self.inventories]
-        return weighted_average(ratios, top_lines)
+        return self.weighted_by_top_lines(day, 'roas', lambda batch: batch.roas)
+
+    def clone(self) -> Merchant:
+        clone = self.shallow_copy()
+        clone.inventories = [inventory.clone() for inventory in self.inventories]
+        clone.share_version_counter(VersionCounter(self.state_version))
+        clone.memoize_day_views = False
+        clone.day_views = {}
+        clone.day_views_version = clone.state_version
+        return clone
 
     def reset_id(self):
         super(Merchant, self).reset_id()
@@ -13,10 +13,13 @@ CHANGE_THRESHOLD = 1.02
 
 
 class Product(Primitive):
+    __slots__ = ('data_generator', 'price', 'cost_per_unit', 'min_purchase_order_size', 'manufacturing_duration', 'cogs_margin')
+
     def __init__(
             self, data_generator: DataGenerator, price: Dollar, min_purchase_order_size: Stock,
             manufacturing_duration: Duration, cogs_margin: Percent):
-        super(Product, self).__init__(data_generator)
+        super(Product, self).__init__()
+        self.data_generator = data_generator
         self.price = price
         self.cost_per_unit = price * cogs_margin
         self.min_purchase_order_size = min_purchase_order_size
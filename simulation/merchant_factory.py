@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from copy import deepcopy
+import math
+import multiprocessing
 from dataclasses import dataclass
-from typing import Callable, List, Optional, Union, Tuple
+from typing import Callable, List, Optional, Union, Tuple, Mapping
 
-from joblib import delayed
+from joblib import delayed, Parallel
+from tqdm.auto import tqdm
 
+from common import constants
 from common.context import DataGenerator, SimulationContext
 from common.local_enum import LoanSimulationType, LoanReferenceType
 from common.local_numbers import Float, O
@@ -14,6 +17,46 @@ from common.util import inherits_from
 from finance import lender
 from finance.loan_simulation import LoanSimulation
 from seller.merchant import Merchant
+from simulation import merchant_pool
+from simulation.stratified_sampler import StratifiedSampler
+
+MERCHANT_PUSHDOWN_FIELDS = [
+    'annual_top_line',
+    'num_products',
+    'gp_per_day',
+    'revenue_per_day',
+    'valuation',
+    'inventory_value',
+    'profit_margin',
+    'get_adjusted_profit_margin',
+    'get_organic_rate',
+    'get_out_of_stock_rate',
+    'get_inventory_turnover_ratio',
+    'get_roas'
+]
+
+
+def total_credit_lower_bound(loan: LoanSimulation) -> Tuple[Float, bool]:
+    repaid_credit = Float.sum([repaid_loan.amount for repaid_loan in loan.ledger.repaid_loans()])
+    return repaid_credit, len(loan.ledger.partially_repaid_loans()) > 0
+
+
+def num_loans_lower_bound(loan: LoanSimulation) -> Tuple[Float, bool]:
+    return Float(len(loan.ledger.repaid_loans()) + len(loan.ledger.partially_repaid_loans())), False
+
+
+def merchant_field_value(data_generator: DataGenerator, merchant: Merchant, field_name: str) -> Float:
+    day = data_generator.start_date
+    if field_name == 'valuation':
+        initial_cash = data_generator.initial_cash_ratio * merchant.annual_top_line(day)
+        return merchant.valuation(day, initial_cash)
+    return getattr(merchant, field_name)(day)
+
+
+EARLY_DECISION_FIELDS: Mapping[str, Callable[[LoanSimulation], Tuple[Float, bool]]] = {
+    'total_credit': total_credit_lower_bound,
+    'num_loans': num_loans_lower_bound
+}
 
 
 @dataclass(unsafe_hash=True)
@@ -37,6 +80,37 @@ class Condition:
     def __repr__(self):
         return self.__str__()
 
+    def is_satisfied(self, value: Float) -> bool:
+        if self.min_value is not None and not value > self.min_value:
+            return False
+        if self.max_value is not None and not value < self.max_value:
+            return False
+        return True
+
+    def decide(self, loan: LoanSimulation) -> Optional[bool]:
+        if not self.field_name:
+            return True
+        if self.field_name not in EARLY_DECISION_FIELDS:
+            return None
+        return self.decide_from_lower_bound(*EARLY_DECISION_FIELDS[self.field_name](loan))
+
+    def is_decided(self, loan: LoanSimulation) -> bool:
+        return self.decide(loan) is not None
+
+    def decide_from_lower_bound(self, lower_bound: Float, strict: bool) -> Optional[bool]:
+        if self.max_value is not None:
+            if lower_bound >= self.max_value:
+                return False
+            return None
+        if self.min_value is None:
+            return None
+        if lower_bound > self.min_value or (strict and lower_bound >= self.min_value):
+            return True
+        return None
+
+    def can_push_down(self) -> bool:
+        return self.loan_type is None and self.field_name in MERCHANT_PUSHDOWN_FIELDS
+
     @classmethod
     def generate_from_loan_reference_type(
             cls, loan_reference_type: LoanReferenceType, loan_type: LoanSimulationType) -> Condition:
@@ -54,7 +128,9 @@ ConditionsEntityOrList = Union[Condition, List[Condition]]
 ResultsType = Union[LoanSimulation, Float]
 EntityOrList = Optional[Union[ResultsType, List[ResultsType]]]
 ValidatorMethod = Callable[[Merchant], EntityOrList]
+PushdownValidatorMethod = Callable[[Merchant], bool]
 MerchantAndResult = Tuple[Merchant, EntityOrList]
+CandidatesBatch = Tuple[List[MerchantAndResult], int]
 
 
 class MerchantFactory:
@@ -67,17 +143,27 @@ class MerchantFactory:
             conditions = [conditions]
 
         def validator(merchant: Merchant) -> EntityOrList:
-            values: List[Float] = [getattr(merchant, condition.field_name)(self.data_generator.start_date) for condition
-                in conditions]
+            values: List[Float] = [merchant_field_value(self.data_generator, merchant, condition.field_name) for
+                condition in conditions]
             for i in range(len(conditions)):
-                if conditions[i].min_value is not None and not values[i] > conditions[i].min_value:
-                    return None
-                if conditions[i].max_value is not None and not values[i] < conditions[i].max_value:
+                if not conditions[i].is_satisfied(values[i]):
                     return None
             return values if len(values) > 1 else values[0]
 
         return validator
 
+    def generate_pushdown_validator(self, conditions: List[Condition]) -> Optional[PushdownValidatorMethod]:
+        pushdown_conditions = [condition for condition in conditions if condition.can_push_down()]
+        if not pushdown_conditions:
+            return None
+
+        def pushdown_validator(merchant: Merchant) -> bool:
+            return all([
+                condition.is_satisfied(merchant_field_value(self.data_generator, merchant, condition.field_name)) for
+                condition in pushdown_conditions])
+
+        return pushdown_validator
+
     def generate_diff_validator(self, conditions: ConditionsEntityOrList) -> ValidatorMethod:
         lsr_validator = self.generate_lsr_validator(conditions)
 
@@ -107,39 +193,114 @@ class MerchantFactory:
                 reference_loan = loans[0] if loans and self.context.loan_reference_type else None
                 loans.append(
                     lender.Lender.generate_loan(
-                        deepcopy(merchant), self.context, self.data_generator, conditions[i].loan_type, reference_loan))
-                loans[i].simulate()
-                if conditions[i].field_name:
-                    value = getattr(loans[i].simulation_results, conditions[i].field_name)
-                    if conditions[i].min_value is not None and not value > conditions[i].min_value:
+                        merchant.clone(), self.context, self.data_generator, conditions[i].loan_type, reference_loan))
+                is_decided = None if self.context.loan_reference_type else conditions[i].is_decided
+                if loans[i].simulate(is_decided):
+                    if not self.is_loan_accepted(loans[i], conditions[i], reference_loan):
                         return None
-                    if conditions[i].max_value is not None and not value < conditions[i].max_value:
-                        return None
-                if reference_loan and loans[i].reference_loan and conditions[
-                    i].loan_type != LoanSimulationType.NO_CAPITAL:
-                    if not loans[i].close_to_reference_loan():
+                elif not conditions[i].decide(loans[i]):
+                    return None
+            for loan, condition in zip(loans, conditions):
+                if loan.simulation_results is None:
+                    loan.finish_simulation()
+                    if not self.is_loan_accepted(loan, condition):
                         return None
             return loans if len(loans) > 1 else loans[0]
 
         return validator
 
+    def is_loan_accepted(
+            self, loan: LoanSimulation, condition: Condition, reference_loan: Optional[LoanSimulation] = None) -> bool:
+        if condition.field_name and not condition.is_satisfied(getattr(loan.simulation_results, condition.field_name)):
+            return False
+        if reference_loan and loan.reference_loan and condition.loan_type != LoanSimulationType.NO_CAPITAL:
+            return loan.close_to_reference_loan()
+        return True
+
     def generate_merchants(
             self, validator: Optional[ValidatorMethod] = None, num_merchants: Optional[int] = None,
-            show_live_rate: bool = False) -> List[Union[MerchantAndResult, Merchant]]:
+            show_live_rate: bool = False, pushdown_validator: Optional[PushdownValidatorMethod] = None,
+            sampler: Optional[StratifiedSampler] = None, first_merchant_index: int = 0) -> List[
+        Union[MerchantAndResult, Merchant]]:
         num_merchants = num_merchants or self.data_generator.num_merchants
+        merchant_indices = range(first_merchant_index, first_merchant_index + num_merchants)
         if validator is None:
-            return [Merchant.generate_simulated(self.data_generator) for _ in range(num_merchants)]
+            return [self.generate_merchant(i) for i in merchant_indices]
+        if self.data_generator.pooled_sampling:
+            return self.generate_merchants_from_pool(
+                validator, num_merchants, show_live_rate, pushdown_validator, first_merchant_index)
         if num_merchants > 1:
             if show_live_rate:
                 LIVE_RATE.name = 'merchant_qualify'
                 LIVE_RATE.reset()
             merchants_and_results = TqdmParallel(
                 desc='Generating merchants', total=num_merchants, show_live_rate=show_live_rate)(
-                delayed(self.merchant_generation_iteration)(validator, show_live_rate) for _ in range(num_merchants))
+                delayed(self.merchant_generation_iteration)(validator, show_live_rate, i, pushdown_validator, sampler)
+                for i in merchant_indices)
             MerchantFactory.reset_id(merchants_and_results)
             return merchants_and_results
         else:
-            return [self.merchant_generation_iteration(validator)]
+            return [self.merchant_generation_iteration(
+                validator, merchant_index=first_merchant_index, pushdown_validator=pushdown_validator,
+                sampler=sampler)]
+
+    def generate_merchants_from_pool(
+            self, validator: ValidatorMethod, num_merchants: int, show_live_rate: bool = False,
+            pushdown_validator: Optional[PushdownValidatorMethod] = None, first_task_index: int = 0) -> List[
+        MerchantAndResult]:
+        LIVE_RATE.name = 'merchant_qualify'
+        LIVE_RATE.reset()
+        merchants_and_results: List[MerchantAndResult] = []
+        task_index = first_task_index
+        num_candidates_sampled = 0
+        num_candidates_accepted = 0
+        with tqdm(desc='Generating merchants', total=num_merchants) as progress_bar:
+            while len(merchants_and_results) < num_merchants:
+                if num_candidates_sampled >= self.data_generator.max_merchant_attempts * num_merchants:
+                    raise RuntimeError(
+                        f'Only {len(merchants_and_results)} of {num_merchants} merchants satisfied the conditions '
+                        f'after {num_candidates_sampled} pool candidates')
+                num_tasks = MerchantFactory.pool_batch_size(
+                    num_merchants - len(merchants_and_results), num_candidates_accepted, num_candidates_sampled)
+                batches = Parallel(n_jobs=multiprocessing.cpu_count())(
+                    delayed(self.sample_candidates)(validator, i, pushdown_validator) for i in
+                    range(task_index, task_index + num_tasks))
+                task_index += num_tasks
+                for accepted, num_candidates in batches:
+                    num_candidates_sampled += num_candidates
+                    num_candidates_accepted += len(accepted)
+                    LIVE_RATE.total += num_candidates
+                    LIVE_RATE.positive += len(accepted)
+                    accepted = accepted[:num_merchants - len(merchants_and_results)]
+                    merchants_and_results.extend(accepted)
+                    progress_bar.update(len(accepted))
+                    if show_live_rate:
+                        progress_bar.set_postfix_str(str(LIVE_RATE))
+        MerchantFactory.reset_id(merchants_and_results)
+        return merchants_and_results
+
+    @staticmethod
+    def pool_batch_size(num_remaining: int, num_accepted: int, num_sampled: int) -> int:
+        num_workers = multiprocessing.cpu_count()
+        if num_sampled == 0:
+            return num_workers
+        acceptance_rate = max(num_accepted, 1) / num_sampled
+        num_tasks = math.ceil(num_remaining / (acceptance_rate * constants.POOL_CANDIDATES_PER_TASK))
+        return max(num_workers, min(num_tasks, num_workers * constants.TASK_CHUNKS_PER_WORKER))
+
+    def sample_candidates(
+            self, validator: ValidatorMethod, task_index: int,
+            pushdown_validator: Optional[PushdownValidatorMethod] = None) -> CandidatesBatch:
+        accepted: List[MerchantAndResult] = []
+        for attempt in range(constants.POOL_CANDIDATES_PER_TASK):
+            merchant = self.generate_merchant(
+                constants.POOL_STREAM_KEY, task_index, attempt, pushdown_validator=pushdown_validator)
+            if merchant is None:
+                continue
+            result = validator(merchant)
+            if result:
+                accepted.append((merchant, result))
+        return accepted, constants.POOL_CANDIDATES_PER_TASK
 
     @staticmethod
     def reset_id(results: List[MerchantAndResult]):
@@ -156,17 +317,58 @@ class MerchantFactory:
     def get_merchants_from_results(merchants_and_results: List[MerchantAndResult]) -> List[Merchant]:
         return [mnr[0] for mnr in merchants_and_results]
 
+    def generate_sampler(
+            self, conditions: List[Condition], validator: ValidatorMethod,
+            pushdown_validator: Optional[PushdownValidatorMethod] = None) -> Optional[StratifiedSampler]:
+        if not self.data_generator.stratified_sampling or self.data_generator.pooled_sampling:
+            return None
+        sampler = StratifiedSampler(self.data_generator)
+        top_line_conditions = [condition for condition in conditions if
+            condition.loan_type is None and condition.field_name == 'annual_top_line']
+        if top_line_conditions:
+            sampler.set_top_line_range(
+                max([condition.min_value for condition in top_line_conditions if condition.min_value is not None],
+                    default=None),
+                min([condition.max_value for condition in top_line_conditions if condition.max_value is not None],
+                    default=None))
+        if pushdown_validator:
+            sampler.calibrate(pushdown_validator, partial=True)
+        else:
+            sampler.calibrate(validator)
+        return sampler if sampler.is_calibrated() else None
+
+    def generate_merchant(
+            self, *stream_key: int, pushdown_validator: Optional[PushdownValidatorMethod] = None,
+            num_products_stratum: Optional[int] = None) -> Optional[Merchant]:
+        if self.data_generator.seed is None:
+            return Merchant.generate_simulated(
+                self.data_generator, validator=pushdown_validator, num_products_stratum=num_products_stratum)
+        return Merchant.generate_from_stream(
+            self.data_generator, *stream_key, validator=pushdown_validator, num_products_stratum=num_products_stratum)
+
     def merchant_generation_iteration(
-            self, validator: ValidatorMethod, show_live_rate: bool = False) -> MerchantAndResult:
-        while True:
-            merchant = Merchant.generate_simulated(self.data_generator)
+            self, validator: ValidatorMethod, show_live_rate: bool = False, merchant_index: int = 0,
+            pushdown_validator: Optional[PushdownValidatorMethod] = None,
+            sampler: Optional[StratifiedSampler] = None) -> MerchantAndResult:
+        for attempt in range(self.data_generator.max_merchant_attempts):
+            num_products_stratum = sampler.choose_stratum(merchant_index, attempt) if sampler else None
+            merchant = self.generate_merchant(
+                merchant_index, attempt, pushdown_validator=pushdown_validator,
+                num_products_stratum=num_products_stratum)
             if show_live_rate:
                 LIVE_RATE.total += 1
+            if merchant is None:
+                continue
             result = validator(merchant)
             if result:
                 if show_live_rate:
                     LIVE_RATE.positive += 1
+                if sampler:
+                    merchant.sampling_weight = sampler.sampling_weight(num_products_stratum)
                 return merchant, result
+        raise RuntimeError(
+            f'No merchant satisfied the conditions for merchant {merchant_index} after '
+            f'{self.data_generator.max_merchant_attempts} attempts')
 
     def generate_validator(self, conditions: List[Condition]) -> ValidatorMethod:
         ensure_diff = len(set([condition.loan_type for condition in conditions if condition.loan_type is not None])) > 1
@@ -193,4 +395,8 @@ class MerchantFactory:
         if not conditions:
             return self.generate_merchants()
         validator = self.generate_validator(conditions)
-        return self.generate_merchants(validator)
+        pushdown_validator = self.generate_pushdown_validator(conditions)
+        if self.data_generator.merchant_pool_dir is not None and self.data_generator.seed is not None:
+            return merchant_pool.MerchantPool(self, conditions).draw(validator, pushdown_validator)
+        sampler = self.generate_sampler(conditions, validator, pushdown_validator)
+        return self.generate_merchants(validator, pushdown_validator=pushdown_validator, sampler=sampler)
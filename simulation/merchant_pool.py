@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import pickle
+from copy import copy
+from typing import List, Optional, Mapping, Any
+
+from joblib import delayed
+
+from common.context import EXECUTION_FIELDS
+from common.tqdm_parallel import TqdmParallel
+from seller.merchant import Merchant
+from simulation import merchant_factory
+
+POOL_INDEPENDENT_FIELDS = ['num_merchants', 'merchant_pool_dir', 'max_merchant_attempts']
+
+
+class MerchantPool:
+    def __init__(self, factory: merchant_factory.MerchantFactory, conditions: List[merchant_factory.Condition]):
+        assert factory.data_generator.seed is not None
+        assert factory.data_generator.merchant_pool_dir is not None
+        self.factory = factory
+        self.data_generator = factory.data_generator
+        self.conditions = conditions
+        self.entries: List[Mapping[str, Any]] = []
+        self.load()
+
+    def fingerprint(self, context_independent_fields: List[str]) -> str:
+        data_generator = copy(self.data_generator)
+        for field in POOL_INDEPENDENT_FIELDS:
+            setattr(data_generator, field, None)
+        context = copy(self.factory.context)
+        for field in context_independent_fields:
+            setattr(context, field, None)
+        key_values = [data_generator.fingerprint(), context.fingerprint(), repr(self.conditions)]
+        return hashlib.sha1(' '.join(key_values).encode()).hexdigest()
+
+    def key(self) -> str:
+        return self.fingerprint(EXECUTION_FIELDS)
+
+    def validator_fingerprint(self) -> str:
+        return self.fingerprint([])
+
+    def filename(self) -> str:
+        return os.path.join(self.data_generator.merchant_pool_dir, f'{self.key()}.json')
+
+    def load(self):
+        if os.path.exists(self.filename()):
+            with open(self.filename()) as infile:
+                self.entries = json.load(infile)
+
+    def save(self):
+        os.makedirs(self.data_generator.merchant_pool_dir, exist_ok=True)
+        temp_filename = f'{self.filename()}.tmp'
+        with open(temp_filename, 'w') as outfile:
+            json.dump(self.entries, outfile)
+        os.replace(temp_filename, self.filename())
+
+    @staticmethod
+    def to_entry(
+            merchant_and_result: merchant_factory.MerchantAndResult, validator_fingerprint: str) -> Mapping[str, Any]:
+        merchant, result = merchant_and_result
+        return {
+            'stream_key': list(merchant.stream_key), 'num_products_stratum': merchant.num_products_stratum,
+            'sampling_weight': merchant.sampling_weight, 'validator_fingerprint': validator_fingerprint,
+            'result': base64.b64encode(pickle.dumps(result)).decode()}
+
+    def next_merchant_index(self) -> int:
+        return max([MerchantPool.merchant_index(entry) for entry in self.entries], default=-1) + 1
+
+    @staticmethod
+    def merchant_index(entry: Mapping[str, Any]) -> int:
+        return entry['stream_key'][-2]
+
+    def regenerate(
+            self, validator: merchant_factory.ValidatorMethod, entry: Mapping[str, Any],
+            validator_fingerprint: str) -> Optional[merchant_factory.MerchantAndResult]:
+        merchant = Merchant.generate_from_stream(
+            self.data_generator, *entry['stream_key'], num_products_stratum=entry['num_products_stratum'])
+        merchant.sampling_weight = entry['sampling_weight']
+        if entry['validator_fingerprint'] == validator_fingerprint:
+            return merchant, pickle.loads(base64.b64decode(entry['result']))
+        result = validator(merchant)
+        return (merchant, result) if result else None
+
+    def draw(
+            self, validator: merchant_factory.ValidatorMethod,
+            pushdown_validator: Optional[merchant_factory.PushdownValidatorMethod] = None) -> List[
+        merchant_factory.MerchantAndResult]:
+        num_merchants = self.data_generator.num_merchants
+        validator_fingerprint = self.validator_fingerprint()
+        entries = self.entries[:num_merchants]
+        revalidated = any([entry['validator_fingerprint'] != validator_fingerprint for entry in entries])
+        merchants_and_results = []
+        if entries:
+            merchants_and_results = TqdmParallel(desc='Loading merchant pool', total=len(entries))(
+                delayed(self.regenerate)(validator, entry, validator_fingerprint) for entry in entries)
+            merchants_and_results = [mnr for mnr in merchants_and_results if mnr is not None]
+        new_merchants_and_results = []
+        if len(merchants_and_results) < num_merchants:
+            sampler = self.factory.generate_sampler(self.conditions, validator, pushdown_validator)
+            new_merchants_and_results = self.factory.generate_merchants(
+                validator, num_merchants - len(merchants_and_results), pushdown_validator=pushdown_validator,
+                sampler=sampler, first_merchant_index=self.next_merchant_index())
+        if revalidated or new_merchants_and_results:
+            drawn_entries = [MerchantPool.to_entry(mnr, validator_fingerprint) for mnr in merchants_and_results]
+            new_entries = [MerchantPool.to_entry(mnr, validator_fingerprint) for mnr in new_merchants_and_results]
+            self.entries = drawn_entries + self.entries[num_merchants:] + new_entries
+            self.save()
+            merchants_and_results.extend(new_merchants_and_results)
+        merchant_factory.MerchantFactory.reset_id(merchants_and_results)
+        return merchants_and_results
@@ -4,7 +4,6 @@ import json
 import os
 import time
 from abc import abstractmethod, ABC
-from copy import deepcopy
 from shutil import copyfile
 from typing import List, Mapping, Optional
 
@@ -54,7 +53,8 @@ class Simulation(ABC):
             if isinstance(results[0][1], list) and inherits_from(type(results[0][1][0]), LoanSimulation.__name__):
                 return self.generate_lenders_from_simulated_loans(results)
         loan_types = self.scenario.loan_simulation_types or self.loan_types
-        return [Lender(self.context, self.data_generator, deepcopy(merchants), loan_type) for loan_type in loan_types]
+        return [Lender(self.context, self.data_generator, [merchant.clone() for merchant in merchants], loan_type) for
+            loan_type in loan_types]
 
     def generate_lenders_from_simulated_loans(self, results: List[MerchantAndResult]) -> List[Lender]:
         lenders = []
@@ -64,12 +64,22 @@ class Simulation(ABC):
         return lenders
 
     def simulate(self):
+        if Lender.can_simulate_forked(self.lenders):
+            Lender.simulate_forked(self.lenders)
         for i in range(len(self.lenders)):
             if i > 0:
                 self.lenders[i].set_reference(self.lenders[0])
             self.lenders[i].simulate()
+        if self.context.baseline_cache:
+            self.report_baseline_cache()
         self.post_simulation()
 
+    def report_baseline_cache(self):
+        for lender in self.lenders:
+            statistics = lender.baseline_cache_statistics()
+            if statistics.lookups():
+                print(f'{lender.id}({lender.loan_type.value}) {statistics}')
+
     @abstractmethod
     def post_simulation(self):
         self.save_context_files()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from typing import Callable, Any, MutableMapping, List, Optional
+
+import numpy as np
+
+from common import constants
+from common.context import DataGenerator
+from seller.merchant import Merchant
+
+
+class StratifiedSampler:
+    def __init__(self, data_generator: DataGenerator):
+        self.data_generator = data_generator
+        self.tried: MutableMapping[int, int] = {}
+        self.accepted: MutableMapping[int, int] = {}
+        self.in_top_line_range: MutableMapping[int, int] = {}
+        self.product_top_lines: List[float] = []
+        self.min_top_line: Optional[float] = None
+        self.max_top_line: Optional[float] = None
+        self.strata: List[int] = []
+        self.cumulative_probabilities = np.array([])
+        self.sampling_weights: MutableMapping[int, float] = {}
+
+    def set_top_line_range(self, min_top_line: Optional[float], max_top_line: Optional[float]):
+        self.min_top_line = min_top_line
+        self.max_top_line = max_top_line
+
+    def has_top_line_range(self) -> bool:
+        return self.min_top_line is not None or self.max_top_line is not None
+
+    def is_in_top_line_range(self, top_line: float) -> bool:
+        if self.min_top_line is not None and top_line <= self.min_top_line:
+            return False
+        if self.max_top_line is not None and top_line >= self.max_top_line:
+            return False
+        return True
+
+    def calibrate(self, validator: Callable[[Merchant], Any], partial: bool = False):
+        for i in range(self.data_generator.calibration_sample_size):
+            self.observe(i, validator, partial)
+        num_products_distribution = self.num_products_distribution()
+        strata = sorted(num_products_distribution.keys())
+        probabilities = np.array([num_products_distribution[num_products] * self.stratum_acceptance_rate(
+            num_products) for num_products in strata])
+        self.strata = [num_products for num_products, probability in zip(strata, probabilities) if probability > 0]
+        if self.strata:
+            probabilities = probabilities[probabilities > 0]
+            probabilities = probabilities / probabilities.sum()
+            self.cumulative_probabilities = np.cumsum(probabilities)
+            self.sampling_weights = {num_products: num_products_distribution[num_products] / probability for
+                num_products, probability in zip(self.strata, probabilities)}
+
+    def num_products_distribution(self) -> MutableMapping[int, float]:
+        num_products_mean = self.data_generator.num_products
+        max_num_products = self.data_generator.max_num_products
+
+        def cdf(num_products: int) -> float:
+            if num_products >= max_num_products:
+                return 1
+            return self.data_generator.normal_ratio_cdf(
+                (num_products + 0.5) / num_products_mean, self.data_generator.num_products_std)
+
+        masses = {num_products: cdf(num_products) - cdf(num_products - 1) if num_products > 1 else cdf(num_products)
+            for num_products in range(1, max_num_products + 1)}
+        return {num_products: mass for num_products, mass in masses.items() if mass > 0}
+
+    def is_calibrated(self) -> bool:
+        return len(self.strata) > 0
+
+    def generate_calibration_merchant(
+            self, i: int, validator: Optional[Callable[[Merchant], bool]] = None) -> Optional[Merchant]:
+        if self.data_generator.seed is None:
+            return Merchant.generate_simulated(self.data_generator, validator=validator)
+        return Merchant.generate_from_stream(
+            self.data_generator, constants.CALIBRATION_STREAM_KEY, i, validator=validator)
+
+    def observe(self, i: int, validator: Callable[[Merchant], Any], partial: bool):
+        observations = []
+
+        def observe_merchant(merchant: Merchant) -> bool:
+            observations.append(bool(validator(merchant)))
+            self.product_top_lines.extend([float(inventory.annual_top_line(self.data_generator.start_date)) for
+                inventory in merchant.inventories])
+            num_products = merchant.num_products()
+            self.tried[num_products] = self.tried.get(num_products, 0) + 1
+            self.accepted[num_products] = self.accepted.get(num_products, 0) + int(observations[0])
+            self.in_top_line_range[num_products] = self.in_top_line_range.get(num_products, 0) + int(
+                self.is_in_top_line_range(merchant.annual_top_line(self.data_generator.start_date)))
+            return False
+
+        if partial:
+            self.generate_calibration_merchant(i, observe_merchant)
+        else:
+            observe_merchant(self.generate_calibration_merchant(i))
+
+    def acceptance_rate(self) -> float:
+        return sum(self.accepted.values()) / sum(self.tried.values())
+
+    def top_line_range_rate(self, num_products: int) -> float:
+        if not self.has_top_line_range():
+            return 1
+        rng = np.random.default_rng(self.data_generator.seed)
+        top_lines = rng.choice(self.product_top_lines, (constants.CALIBRATION_BOOTSTRAP_SIZE, num_products)).sum(
+            axis=1)
+        in_range = np.ones(len(top_lines), dtype=bool)
+        if self.min_top_line is not None:
+            in_range &= top_lines > self.min_top_line
+        if self.max_top_line is not None:
+            in_range &= top_lines < self.max_top_line
+        return (in_range.sum() + 1) / (constants.CALIBRATION_BOOTSTRAP_SIZE + 1)
+
+    def stratum_acceptance_rate(self, num_products: int) -> float:
+        total_in_range = sum(self.in_top_line_range.values())
+        in_range_acceptance = sum(self.accepted.values()) / total_in_range if total_in_range > 0 else 1
+        prior = constants.CALIBRATION_PRIOR_WEIGHT * in_range_acceptance
+        accepted = self.accepted.get(num_products, 0) + prior
+        in_range = self.in_top_line_range.get(num_products, 0) + constants.CALIBRATION_PRIOR_WEIGHT
+        return self.top_line_range_rate(num_products) * accepted / in_range
+
+    def choose_stratum(self, merchant_index: int, attempt: int) -> int:
+        assert self.is_calibrated()
+        if self.data_generator.seed is None:
+            value = float(self.data_generator.random())
+        else:
+            with self.data_generator.random_stream(constants.STRATUM_STREAM_KEY, merchant_index, attempt):
+                value = float(self.data_generator.random())
+        index = int(np.searchsorted(self.cumulative_probabilities, value, side='right'))
+        return self.strata[min(index, len(self.strata) - 1)]
+
+    def sampling_weight(self, num_products_stratum: int) -> float:
+        return self.sampling_weights[num_products_stratum]
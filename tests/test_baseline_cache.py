@@ -0,0 +1,85 @@
+from unittest.mock import MagicMock
+
+from common import constants
+from common.local_enum import LoanReferenceType
+from common.local_numbers import Date
+from finance.baseline_cache import BaselineCache, BASELINE_CACHE, BaselineCacheStatistics
+from finance.loan_simulation import LoanSimulation
+from finance.loan_simulation_childs import NoCapitalLoanSimulation
+from seller.merchant import Merchant
+from tests.util_test import BaseTestCase
+
+
+class TestBaselineCache(BaseTestCase):
+    def setUp(self) -> None:
+        super(TestBaselineCache, self).setUp()
+        self.data_generator.simulated_duration = Date(constants.YEAR)
+        self.context.snapshot_cycle = constants.MONTH
+        self.context.baseline_cache = True
+        self.data_generator.seed = 1
+        self.merchant = Merchant.generate_from_stream(self.data_generator, 0)
+        BASELINE_CACHE.clear()
+
+    def tearDown(self) -> None:
+        BASELINE_CACHE.clear()
+
+    def generate_loan(self) -> NoCapitalLoanSimulation:
+        return NoCapitalLoanSimulation(self.context, self.data_generator, self.merchant.clone())
+
+    def test_key(self):
+        key = BaselineCache.key(self.generate_loan())
+        self.assertEqual(key, BaselineCache.key(self.generate_loan()))
+        self.context.loan_reference_type = LoanReferenceType.ANNUAL_REVENUE
+        self.assertEqual(key, BaselineCache.key(self.generate_loan()))
+        self.assertNotEqual(key, BaselineCache.key(NoCapitalLoanSimulation(
+            self.context, self.data_generator, Merchant.generate_from_stream(self.data_generator, 1))))
+        self.context.snapshot_cycle = constants.WEEK
+        self.assertNotEqual(key[1], BaselineCache.key(self.generate_loan())[1])
+
+    def test_is_cacheable(self):
+        loan = self.generate_loan()
+        self.assertTrue(BaselineCache.is_cacheable(loan))
+        loan.set_reference_loan(LoanSimulation(self.context, self.data_generator, self.merchant.clone()))
+        self.assertFalse(BaselineCache.is_cacheable(loan))
+        self.assertFalse(BaselineCache.is_cacheable(NoCapitalLoanSimulation(
+            self.context, self.data_generator, Merchant.generate_simulated(self.data_generator))))
+        self.merchant.invalidate_day_views()
+        self.assertFalse(BaselineCache.is_cacheable(self.generate_loan()))
+        self.context.baseline_cache = False
+        self.assertFalse(BaselineCache.is_cacheable(self.generate_loan()))
+
+    def test_simulate(self):
+        loan = self.generate_loan()
+        loan.simulate()
+        self.assertEqual(len(BASELINE_CACHE.baselines), 1)
+        cached_loan = self.generate_loan()
+        cached_loan.simulate_until = MagicMock()
+        self.assertTrue(cached_loan.simulate())
+        cached_loan.simulate_until.assert_not_called()
+        self.assertFalse(loan.baseline_cache_hit)
+        self.assertTrue(cached_loan.baseline_cache_hit)
+        self.assertEqual(loan.today, cached_loan.today)
+        self.assertEqual(loan.merchant, cached_loan.merchant)
+        self.assertIsNot(loan.merchant, cached_loan.merchant)
+        self.assertIsNot(loan.ledger, cached_loan.ledger)
+        self.assertDeepAlmostEqual(loan.simulation_results, cached_loan.simulation_results)
+        self.assertDeepAlmostEqual(loan.snapshots, cached_loan.snapshots)
+        self.assertEqual(
+            loan.merchant.annual_top_line(loan.today), cached_loan.merchant.annual_top_line(cached_loan.today))
+
+    def test_max_size(self):
+        cache = BaselineCache(max_size=2)
+        loans = [NoCapitalLoanSimulation(
+            self.context, self.data_generator, Merchant.generate_from_stream(self.data_generator, i)) for i in range(3)]
+        keys = [BaselineCache.key(loan) for loan in loans]
+        cache.store(keys[0], loans[0])
+        cache.store(keys[1], loans[1])
+        self.assertIsNotNone(cache.get(keys[0]))
+        cache.store(keys[2], loans[2])
+        self.assertEqual(list(cache.baselines.keys()), [keys[0], keys[2]])
+
+    def test_statistics(self):
+        statistics = BaselineCacheStatistics.generate_from_hits([True, None, False, True])
+        self.assertEqual((statistics.hits, statistics.misses, statistics.lookups()), (2, 1, 3))
+        self.assertAlmostEqual(statistics.hit_rate(), 2 / 3)
+        self.assertEqual(BaselineCacheStatistics().hit_rate(), 0)
@@ -1,7 +1,8 @@
+from copy import deepcopy
 from random import randint
 from unittest.mock import MagicMock
 
-from common.local_numbers import Percent, Dollar, O, ONE, Date, Duration
+from common.local_numbers import Percent, Dollar, O, ONE, Date, Duration, Float
 from seller.batch import Batch, PurchaseOrder
 from tests.util_test import BaseTestCase
 
@@ -11,6 +12,33 @@ class TestBatch(BaseTestCase):
         super(TestBatch, self).setUp()
         self.batch: Batch = Batch.generate_simulated(self.data_generator)
 
+    def test_typed_number(self):
+        day = self.batch.get_purchase_order_start_date()
+        self.assertIs(type(self.batch.max_cash_needed(day=day)), Dollar)
+        self.assertEqual(self.batch.max_cash_needed(day=day), self.batch.max_cash_needed(day))
+        native_data_generator = deepcopy(self.data_generator)
+        native_data_generator.native_numbers = True
+        native_batch = Batch.generate_simulated(native_data_generator)
+        self.assertIs(type(native_batch.max_cash_needed(day=day)), float)
+        self.assertIs(native_batch.data_generator, native_batch.product.data_generator)
+        self.assertFalse(hasattr(native_batch, '__dict__'))
+        native_data_generator.native_numbers = False
+        self.assertIs(type(native_batch.gp_margin()), Float)
+        self.assertIs(type(self.batch.gp_margin()), Float)
+
+    def test_instance_state(self):
+        _, slots_state = self.batch.instance_state()
+        self.assertIn('int_id', slots_state)
+        self.assertIn('product', slots_state)
+        self.assertNotIn('__dict__', slots_state)
+        self.batch.next_batch = None
+        del self.batch.next_batch
+        _, slots_state = self.batch.instance_state()
+        self.assertNotIn('next_batch', slots_state)
+        clone = self.batch.shallow_copy()
+        self.assertIs(clone.product, self.batch.product)
+        self.assertFalse(hasattr(clone, 'next_batch'))
+
     def test_generate_simulated(self):
         ratio = 1.1
         self.data_generator.normal_ratio = MagicMock(return_value=ratio)
@@ -46,7 +74,7 @@ class TestBatch(BaseTestCase):
         self.assertEqual(batch2.start_date, self.batch.last_date + 1)
 
     def test_has_future_revenue(self):
-        self.batch.is_out_of_stock = MagicMock(return_value=True)
+        self.mock_method(self.batch, 'is_out_of_stock', MagicMock(return_value=True))
         self.batch.stock = 0
         self.batch.purchase_order = None
         duration = Duration(randint(self.batch.start_date, self.batch.last_date))
@@ -56,7 +84,7 @@ class TestBatch(BaseTestCase):
         self.batch.purchase_order = None
         self.batch.stock = 1
         self.assertFalse(self.batch.has_future_revenue(duration))
-        self.batch.is_out_of_stock = MagicMock(return_value=False)
+        self.mock_method(self.batch, 'is_out_of_stock', MagicMock(return_value=False))
         self.assertTrue(self.batch.has_future_revenue(duration))
         self.batch.stock = 0
         self.assertFalse(self.batch.has_future_revenue(duration))
@@ -83,7 +111,7 @@ class TestBatch(BaseTestCase):
     def test_get_manufacturing_done_date(self):
         self.assertIsNone(self.batch.get_manufacturing_done_date())
         self.batch.purchase_order = PurchaseOrder(Date(0), O, O)
-        self.batch.get_purchase_order_start_date = MagicMock(return_value=1)
+        self.mock_method(self.batch, 'get_purchase_order_start_date', MagicMock(return_value=1))
         self.assertEqual(self.batch.get_manufacturing_done_date(), 1 + self.batch.product.manufacturing_duration)
 
     def test_get_purchase_order_start_date(self):
@@ -96,9 +124,9 @@ class TestBatch(BaseTestCase):
         max_stock = self.batch.max_stock_for_next_purchase_order()
         self.assertEqual(self.batch.max_purchase_order().stock, max_stock)
 
-        self.batch.product.purchase_order_cost = MagicMock(
+        self.mock_method(self.batch.product, 'purchase_order_cost', MagicMock(
             side_effect=[(self.data_generator.max_purchase_order_value, self.data_generator.max_purchase_order_value),
-                (ONE, ONE)])
+                (ONE, ONE)]))
         stock = self.batch.product.batch_size_from_cost(self.data_generator.max_purchase_order_value)
         self.assertEqual(self.batch.max_purchase_order(), PurchaseOrder(stock, ONE, ONE))
 
@@ -113,7 +141,7 @@ class TestBatch(BaseTestCase):
             self.batch.purchase_order, PurchaseOrder(self.batch.product.min_purchase_order_size, upfront, post))
         self.assertEqual(batch2.stock, self.batch.product.min_purchase_order_size)
         upfront2, post2 = self.batch.product.purchase_order_cost(self.batch.max_stock_for_next_purchase_order())
-        self.batch.extend_duration = MagicMock()
+        self.mock_method(self.batch, 'extend_duration', MagicMock())
         self.assertIsNotNone(
             self.batch.initiate_new_purchase_order(self.batch.get_purchase_order_start_date() + 2, post2))
         self.assertEqual(
@@ -141,7 +169,7 @@ class TestBatch(BaseTestCase):
         self.assertEqual(batch2.last_date, prev_end2 + extension)
 
     def test_extend_duration(self):
-        self.batch.push_start_date = MagicMock()
+        self.mock_method(self.batch, 'push_start_date', MagicMock())
         extension = 2
         prev_duration = self.batch.duration
         prev_last = self.batch.last_date
@@ -153,7 +181,7 @@ class TestBatch(BaseTestCase):
             self.batch.is_out_of_stock(self.data_generator.start_date + self.batch.duration_in_stock() - 1))
         self.assertTrue(self.batch.is_out_of_stock(self.data_generator.start_date + self.batch.duration_in_stock()))
         batch2 = Batch.generate_simulated(self.data_generator, previous=self.batch)
-        batch2.push_start_date = MagicMock()
+        self.mock_method(batch2, 'push_start_date', MagicMock())
         self.batch.extend_duration(self.batch.get_purchase_order_start_date() + extension)
         batch2.push_start_date.assert_called()
         self.batch.push_start_date.assert_not_called()
@@ -208,6 +236,31 @@ class TestBatch(BaseTestCase):
         self.assertEqual(self.batch.inventory_cost(self.batch.get_manufacturing_done_date(), O), post)
         self.assertEqual(self.batch.inventory_cost(self.batch.get_manufacturing_done_date() + 1, million), 0)
 
+    def test_is_idle(self):
+        self.data_generator.conservative_cash_management = False
+        upfront, post = self.batch.product.purchase_order_cost(self.batch.product.min_purchase_order_size)
+        purchase_order_start_date = self.batch.get_purchase_order_start_date()
+        self.assertTrue(self.batch.is_idle(purchase_order_start_date - 1, post))
+        self.assertTrue(self.batch.is_idle(purchase_order_start_date, post - 1))
+        self.assertFalse(self.batch.is_idle(purchase_order_start_date, post))
+        self.batch.initiate_new_purchase_order(purchase_order_start_date, post)
+        self.assertTrue(self.batch.is_idle(purchase_order_start_date, O))
+        self.assertFalse(self.batch.is_idle(self.batch.get_manufacturing_done_date(), O))
+
+    def test_next_event_date(self):
+        self.batch.stock = self.batch.duration
+        self.batch.out_of_stock_rate = O
+        self.batch.product.manufacturing_duration = Duration(1)
+        self.batch.lead_time = Duration(2)
+        day = self.data_generator.start_date
+        self.assertEqual(self.batch.next_event_date(day), self.batch.get_purchase_order_start_date())
+        self.batch.initiate_new_purchase_order(self.batch.get_purchase_order_start_date(), Dollar(10000000))
+        self.assertEqual(self.batch.next_event_date(day), self.batch.get_manufacturing_done_date())
+        self.assertEqual(
+            self.batch.next_event_date(self.batch.get_manufacturing_done_date()),
+            self.batch.get_manufacturing_done_date() + 1)
+        self.assertEqual(self.batch.next_event_date(self.batch.last_date), self.batch.last_date + 1)
+
     def test_is_out_of_stock(self):
         self.assertFalse(self.batch.is_out_of_stock(self.data_generator.start_date))
         self.assertFalse(
@@ -223,7 +276,7 @@ class TestBatch(BaseTestCase):
     def test_revenue_per_day(self):
         self.assertEqual(
             self.batch.revenue_per_day(self.data_generator.start_date + self.batch.duration_in_stock() + 1), 0)
-        self.batch.revenue_margin = MagicMock(return_value=1)
+        self.mock_method(self.batch, 'revenue_margin', MagicMock(return_value=1))
         self.assertEqual(
             self.batch.revenue_per_day(self.data_generator.start_date),
             self.batch.product.price * self.batch.sales_velocity())
@@ -233,7 +286,7 @@ class TestBatch(BaseTestCase):
 
     def test_gp_per_day(self):
         self.assertEqual(self.batch.gp_per_day(self.data_generator.start_date + self.batch.duration_in_stock() + 1), 0)
-        self.batch.gp_margin = MagicMock(return_value=0.8)
+        self.mock_method(self.batch, 'gp_margin', MagicMock(return_value=0.8))
         self.assertEqual(
             self.batch.total_revenue_per_day(self.data_generator.start_date) * 0.8,
             self.batch.gp_per_day(self.data_generator.start_date))
@@ -242,11 +295,11 @@ class TestBatch(BaseTestCase):
         self.batch.out_of_stock_rate = 0
         self.assertEqual(self.batch.duration_in_stock(), self.batch.duration)
         self.batch.stock = 30
-        self.batch.sales_velocity = MagicMock(return_value=10)
+        self.mock_method(self.batch, 'sales_velocity', MagicMock(return_value=10))
         self.batch.duration = 4
         self.batch.out_of_stock_rate = 0.25
         self.assertEqual(self.batch.duration_in_stock(), 3)
-        self.batch.sales_velocity = MagicMock(return_value=0)
+        self.mock_method(self.batch, 'sales_velocity', MagicMock(return_value=0))
         self.assertEqual(self.batch.duration_in_stock(), self.batch.duration)
         self.batch.stock = 0
         self.assertEqual(self.batch.duration_in_stock(), 0)
@@ -1,7 +1,9 @@
+from copy import deepcopy
 from unittest import mock
 from unittest.mock import MagicMock
 
 from common import constants
+from common.context import RANDOM_STREAM, RiskContext
 from common.local_numbers import Float, Int, Duration, Date
 from tests.util_test import BaseTestCase
 
@@ -27,6 +29,28 @@ class TestDataGenerator(BaseTestCase):
         random_mock.return_value = 0.09
         self.assertEqual(self.data_generator.normal_ratio(std=2, max_ratio=2), 5)
 
+    def test_random_stream(self):
+        self.data_generator.seed = 7
+        with self.data_generator.random_stream(1, 2):
+            values = [self.data_generator.random(), self.data_generator.normal_ratio(), self.data_generator.randint(1, 9)]
+        with self.data_generator.random_stream(1, 2):
+            self.assertEqual(
+                values,
+                [self.data_generator.random(), self.data_generator.normal_ratio(), self.data_generator.randint(1, 9)])
+        with self.data_generator.random_stream(1, 3):
+            self.assertNotEqual(values[0], self.data_generator.random())
+        self.assertIsNone(getattr(RANDOM_STREAM, 'generator', None))
+
+    def test_fingerprint(self):
+        fingerprint = self.data_generator.fingerprint()
+        self.assertEqual(fingerprint, deepcopy(self.data_generator).fingerprint())
+        self.data_generator.seed = 7
+        self.assertNotEqual(fingerprint, self.data_generator.fingerprint())
+        self.context.risk_context = RiskContext()
+        context_fingerprint = self.context.fingerprint()
+        self.context.risk_context.roas.weight = Float(7)
+        self.assertNotEqual(context_fingerprint, self.context.fingerprint())
+
     def test_generate_data_generator(self):
         self.assertEqual(type(self.data_generator.first_batch_std_factor), Float)
         self.assertEqual(type(self.data_generator.max_purchase_order_size), Int)
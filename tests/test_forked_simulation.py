@@ -0,0 +1,72 @@
+from dataclasses import fields
+
+from common import constants
+from common.local_enum import LoanReferenceType
+from common.local_numbers import Float, Date
+from finance.forked_simulation import ForkedSimulation, TrunkSimulation
+from finance.lender import LOAN_TYPES_MAPPING
+from finance.loan_simulation import LoanSimulation
+from seller.merchant import Merchant
+from tests.util_test import BaseTestCase
+
+
+class TestForkedSimulation(BaseTestCase):
+    def setUp(self) -> None:
+        super(TestForkedSimulation, self).setUp()
+        self.data_generator.max_num_products = 4
+        self.data_generator.num_products = 2
+        self.data_generator.simulated_duration = Date(constants.YEAR)
+        self.context.snapshot_cycle = constants.MONTH
+        self.merchants = [Merchant.generate_simulated(self.data_generator) for _ in range(4)]
+
+    def generate_loans(self, merchant: Merchant) -> list:
+        return [loan_type(self.context, self.data_generator, merchant.clone()) for loan_type in
+            LOAN_TYPES_MAPPING.values()]
+
+    def test_is_supported(self):
+        loans = self.generate_loans(self.merchants[0])
+        self.assertTrue(ForkedSimulation.is_supported(self.context, loans))
+        self.assertFalse(ForkedSimulation.is_supported(self.context, []))
+        self.assertFalse(ForkedSimulation.is_supported(
+            self.context, loans + [LoanSimulation(self.context, self.data_generator, self.merchants[1])]))
+        self.context.event_driven_simulation = True
+        self.assertFalse(ForkedSimulation.is_supported(self.context, loans))
+        self.context.event_driven_simulation = False
+        self.context.loan_reference_type = LoanReferenceType.DAILY_REVENUE
+        self.assertFalse(ForkedSimulation.is_supported(self.context, loans))
+
+    def test_diverges(self):
+        loan = LoanSimulation(self.context, self.data_generator, self.merchants[0].clone())
+        trunk = TrunkSimulation(self.context, self.data_generator, self.merchants[0].clone(), [loan])
+        self.assertEqual(trunk.diverges(loan), loan.primary_approval_conditions() and loan.calculate_amount() > 0)
+        self.assertEqual(type(trunk), TrunkSimulation)
+        branch = trunk.branch(LoanSimulation)
+        self.assertIs(type(branch), LoanSimulation)
+        self.assertIs(branch.merchant, trunk.merchant)
+        self.assertIs(branch.ledger, trunk.ledger)
+        self.assertEqual(branch.current_cash, trunk.current_cash)
+        trunk.fork_diverged_loans()
+        self.assertEqual(len(trunk.pending_loans), 0 if trunk.diverges(loan) else 1)
+
+    def test_simulate(self):
+        for merchant in self.merchants:
+            loans = self.generate_loans(merchant)
+            forked_loans = self.generate_loans(merchant)
+            for loan in loans:
+                loan.simulate()
+            ForkedSimulation(self.context, self.data_generator, forked_loans).simulate()
+            for loan, forked_loan in zip(loans, forked_loans):
+                loan_type = type(loan).__name__
+                self.assertEqual(loan.today, forked_loan.today)
+                self.assertEqual(loan.bankruptcy_date, forked_loan.bankruptcy_date)
+                self.assertEqual(loan.ledger.num_loans(), forked_loan.ledger.num_loans())
+                self.assertEqual(list(loan.snapshots.keys()), list(forked_loan.snapshots.keys()))
+                for day in loan.snapshots.keys():
+                    self.assertTrue(loan.snapshots[day].revenue_cagr.is_close(
+                        forked_loan.snapshots[day].revenue_cagr), f'{loan_type}@{day}')
+                for field in fields(loan.simulation_results):
+                    value = getattr(loan.simulation_results, field.name)
+                    forked_value = getattr(forked_loan.simulation_results, field.name)
+                    self.assertTrue(
+                        Float(value).is_close(forked_value, constants.FLOAT_EQUALITY_TOLERANCE),
+                        f'{loan_type}.{field.name}: {value} != {forked_value}')
@@ -1,3 +1,4 @@
+from copy import deepcopy
 from unittest.mock import MagicMock
 
 from common import constants
@@ -20,10 +21,46 @@ class TestInventory(BaseTestCase):
             self.assertEqual(self.inventory.batches[i].sgna_rate, self.inventory.batches[i + 1].sgna_rate)
         self.assertGreater(self.inventory.batches[-1].start_date, self.data_generator.simulated_duration)
 
+    def test_lazy_batches(self):
+        self.data_generator.lazy_batches = True
+        inventory = Inventory.generate_simulated(self.data_generator)
+        self.assertEqual(len(inventory.batches), 2)
+        reversed_inventory = deepcopy(inventory)
+        reversed_inventory.batch_index(self.data_generator.simulated_duration)
+        for day in range(self.data_generator.start_date, self.data_generator.simulated_duration + 1):
+            self.assertIsNotNone(inventory.batch_index(day))
+        self.assertTrue(inventory.is_complete())
+        self.assertEqual(len(inventory.batches), len(reversed_inventory.all_batches()))
+        for batch, reversed_batch in zip(inventory.batches, reversed_inventory.batches):
+            self.assertEqual(batch.start_date, reversed_batch.start_date)
+            self.assertEqual(batch.roas, reversed_batch.roas)
+            self.assertEqual(batch.inventory_turnover_ratio, reversed_batch.inventory_turnover_ratio)
+        for i in range(len(inventory.batches) - 1):
+            self.assertEqual(inventory.batches[i].next_batch, inventory.batches[i + 1])
+            self.assertEqual(inventory.batches[i].last_date + 1, inventory.batches[i + 1].start_date)
+
     def test_current_batch(self):
         self.assertEqual(self.inventory[self.data_generator.start_date], self.inventory.batches[0])
         self.assertEqual(self.inventory[self.inventory.batches[0].last_date + 1], self.inventory.batches[1])
 
+    def test_current_batch_any_order(self):
+        last_batch = self.inventory.batches[-1]
+        self.assertEqual(self.inventory[last_batch.start_date], last_batch)
+        for batch in self.inventory.batches:
+            self.assertEqual(self.inventory[batch.last_date], batch)
+        self.assertEqual(self.inventory[self.data_generator.start_date], self.inventory.batches[0])
+        self.assertFalse(self.data_generator.start_date - 1 in self.inventory)
+        self.assertFalse(last_batch.last_date + 1 in self.inventory)
+
+    def test_current_batch_after_extend_duration(self):
+        first_batch = self.inventory.batches[0]
+        second_batch = self.inventory.batches[1]
+        self.assertEqual(self.inventory[first_batch.last_date + 1], second_batch)
+        first_batch.extend_duration(first_batch.get_purchase_order_start_date() + 10)
+        self.assertEqual(self.inventory[first_batch.last_date], first_batch)
+        self.assertEqual(self.inventory[first_batch.last_date + 1], second_batch)
+        self.assertEqual(self.inventory[second_batch.last_date + 1], self.inventory.batches[2])
+
     def test_gp_per_day(self):
         self.assertEqual(
             self.inventory.gp_per_day(self.data_generator.start_date),
@@ -50,14 +87,14 @@ class TestInventory(BaseTestCase):
         batch: Batch = self.inventory[self.data_generator.start_date]
         ten = Float(10)
         five = Float(5)
-        batch.remaining_stock = MagicMock(side_effect=[ten, five])
-        batch.sales_velocity = MagicMock(return_value=five)
+        self.mock_method(batch, 'remaining_stock', MagicMock(side_effect=[ten, five]))
+        self.mock_method(batch, 'sales_velocity', MagicMock(return_value=five))
         batch.product.price = 2
         self.assertEqual(
             self.inventory.current_inventory_valuation(self.data_generator.start_date),
             ten + ten * constants.INVENTORY_NPV_DISCOUNT_FACTOR)
         self.assertEqual(self.inventory.current_inventory_valuation(self.data_generator.start_date + 1), ten)
-        batch.sales_velocity = MagicMock(return_value=0)
+        self.mock_method(batch, 'sales_velocity', MagicMock(return_value=0))
         self.assertEqual(self.inventory.current_inventory_valuation(self.data_generator.start_date), 0)
 
     def test_purchase_order_valuation(self):
@@ -66,7 +103,7 @@ class TestInventory(BaseTestCase):
         velocity = Float(4)
         batch.purchase_order.stock = velocity * 2
         batch.last_date = Date(2)
-        batch.sales_velocity = MagicMock(return_value=velocity)
+        self.mock_method(batch, 'sales_velocity', MagicMock(return_value=velocity))
         batch.product.price = ONE
         dv = batch.product.price * velocity
         r = constants.INVENTORY_NPV_DISCOUNT_FACTOR
@@ -75,7 +112,7 @@ class TestInventory(BaseTestCase):
         self.assertEqual(
             self.inventory.purchase_order_valuation(self.data_generator.start_date + 1),
             dv * (r ** 1) + dv * (r ** 2))
-        batch.sales_velocity = MagicMock(return_value=0)
+        self.mock_method(batch, 'sales_velocity', MagicMock(return_value=0))
         self.assertEqual(self.inventory.purchase_order_valuation(self.data_generator.start_date), 0)
 
     def test_valuation(self):
@@ -1,7 +1,7 @@
 from copy import deepcopy
 
 from common.local_numbers import Dollar, ONE, ONE_INT, TWO, O, TWO_INT, Duration, O_INT, Date, HALF
-from finance.ledger import Ledger, Loan, Repayment
+from finance.ledger import Ledger, Loan, Repayment, SalesLedger
 from tests.util_test import BaseTestCase
 
 
@@ -12,6 +12,20 @@ class TestLedger(BaseTestCase):
         self.one_loan = Loan(ONE, ONE, ONE_INT)
         self.one_loan_paid = Loan(ONE, O, ONE_INT)
 
+    def test_version_counter(self):
+        version = self.ledger.version_counter.value
+        self.ledger.new_loan(self.one_loan)
+        self.assertGreater(self.ledger.version_counter.value, version)
+        version = self.ledger.version_counter.value
+        self.ledger.record_cash(ONE_INT, ONE)
+        self.assertGreater(self.ledger.version_counter.value, version)
+        version = self.ledger.version_counter.value
+        self.ledger.initiate_loan_repayment(ONE_INT, ONE)
+        self.assertGreater(self.ledger.version_counter.value, version)
+        version = self.ledger.version_counter.value
+        self.ledger.outstanding_balance()
+        self.assertEqual(self.ledger.version_counter.value, version)
+
     def test_outstanding_balance(self):
         self.ledger.new_loan(self.one_loan)
         self.ledger.new_loan(self.one_loan)
@@ -128,6 +142,21 @@ class TestLedger(BaseTestCase):
         self.assertDeepAlmostEqual(self.ledger.projected_repayments(ONE, today, HALF), repayments_HALF[:2])
         self.assertDeepAlmostEqual(self.ledger.active_loans, [self.one_loan, loan2])
 
+    def test_projected_repayment_schedule(self):
+        today = Date(TWO_INT)
+        cycle = self.context.marketplace_payment_cycle
+        self.ledger.new_loan(Loan(ONE, ONE, ONE_INT))
+        self.ledger.new_loan(Loan(ONE, HALF, today))
+        self.ledger.initiate_loan_repayment(today, HALF)
+        dates, amounts, durations = self.ledger.projected_repayment_schedule(O, today, Dollar(0.4))
+        self.assertEqual(
+            list(dates), [today + cycle - 1, today + 2 * cycle - 1, today + 2 * cycle - 1, today + 3 * cycle - 1])
+        self.assertDeepAlmostEqual(
+            [Dollar(amount) for amount in amounts], [Dollar(0.4), Dollar(0.1), Dollar(0.3), Dollar(0.2)])
+        self.assertEqual(list(durations), [cycle + 1, 2 * cycle + 1, 2 * cycle, 3 * cycle])
+        self.assertDeepAlmostEqual(self.ledger.active_loans, [Loan(ONE, HALF, ONE_INT), Loan(ONE, HALF, today)])
+        self.assertEqual(len(self.ledger.projected_repayment_schedule(ONE, today, Dollar(0.4))[0]), 0)
+
     def test_undo_active_loans(self):
         repaid = Dollar(0.6)
         self.ledger.new_loan(deepcopy(self.one_loan))
@@ -144,6 +173,44 @@ class TestLedger(BaseTestCase):
         self.assertEqual(self.ledger.outstanding_balance(), O)
         self.assertEqual(self.ledger.total_credit(), repaid / 2)
 
+    def test_repaid_loans(self):
+        repaid = Dollar(0.6)
+        self.ledger.new_loan(Loan(repaid, repaid, ONE_INT))
+        self.ledger.new_loan(Loan(repaid, repaid, ONE_INT))
+        self.ledger.new_loan(Loan(repaid, repaid, ONE_INT))
+        self.assertEqual(self.ledger.repaid_loans(), [])
+        self.assertEqual(self.ledger.partially_repaid_loans(), [])
+        self.ledger.initiate_loan_repayment(ONE_INT, repaid * 1.5)
+        self.assertEqual(self.ledger.repaid_loans(), [Loan(repaid, repaid, ONE_INT)])
+        self.assertEqual(self.ledger.partially_repaid_loans(), [Loan(repaid, repaid / 2, ONE_INT)])
+
+    def test_record_cash(self):
+        self.ledger.record_cash(ONE_INT, ONE)
+        self.ledger.record_cash(ONE_INT, TWO)
+        self.ledger.record_cash(TWO_INT, HALF)
+        self.assertDeepAlmostEqual(self.ledger.cash_history, {ONE_INT: TWO, TWO_INT: HALF})
+        self.ledger.record_cash(Duration(3), ONE)
+        self.assertDeepAlmostEqual(self.ledger.cash_history, {ONE_INT: TWO, TWO_INT: HALF, Duration(3): ONE})
+        with self.assertRaises(AssertionError):
+            self.ledger.record_cash(TWO_INT, ONE)
+
+    def test_running_totals(self):
+        self.assertFalse(self.ledger.has_active_loans())
+        self.ledger.new_loan(Loan(ONE, TWO, ONE_INT))
+        self.ledger.new_loan(Loan(HALF, ONE, TWO_INT))
+        self.assertTrue(self.ledger.has_active_loans())
+        self.assertEqual(self.ledger.total_credit(), ONE + HALF)
+        self.assertEqual(self.ledger.outstanding_balance(), TWO + ONE)
+        self.assertEqual(self.ledger.num_loans(), TWO_INT)
+        self.ledger.initiate_loan_repayment(TWO_INT, TWO + HALF)
+        self.assertEqual(self.ledger.outstanding_balance(), HALF)
+        self.assertEqual(self.ledger.get_current_loan(), Loan(HALF, HALF, TWO_INT))
+        self.assertDeepAlmostEqual(self.ledger.loans_history, [Loan(ONE, TWO, ONE_INT), Loan(HALF, ONE, TWO_INT)])
+        self.ledger.initiate_loan_repayment(Duration(3), ONE)
+        self.assertFalse(self.ledger.has_active_loans())
+        self.assertEqual(self.ledger.outstanding_balance(), O)
+        self.assertEqual(self.ledger.total_credit(), ONE + HALF)
+
 
 class TestRepayment(BaseTestCase):
     def test_generate_from_loan(self):
@@ -170,3 +237,22 @@ class TestRepayment(BaseTestCase):
         repayment.repay(loans)
         self.assertDeepAlmostEqual(loans, [])
         self.assertEqual(loan2, loan2_repaid)
+
+    def test_sales_ledger_record_sales(self):
+        sales_ledger = SalesLedger(ONE_INT)
+        sales_ledger.record_sales(ONE_INT, ONE, HALF)
+        sales_ledger.record_sales(Duration(3), TWO, ONE, TWO_INT)
+        self.assertEqual(sales_ledger.last_date(), Duration(4))
+        self.assertEqual(sales_ledger.revenue(ONE_INT, Duration(4)), ONE + TWO * 2)
+        self.assertEqual(sales_ledger.revenue(TWO_INT, TWO_INT), O)
+        self.assertEqual(sales_ledger.gp(ONE_INT, Duration(3)), HALF + ONE)
+        with self.assertRaises(AssertionError):
+            sales_ledger.record_sales(Duration(4), ONE, ONE)
+
+    def test_sales_ledger_revenue_in_window(self):
+        sales_ledger = SalesLedger(ONE_INT)
+        for day in range(1, 11):
+            sales_ledger.record_sales(Duration(day), Dollar(day), O)
+        self.assertEqual(sales_ledger.revenue_in_window(Duration(10), Duration(3)), Dollar(8 + 9 + 10))
+        self.assertEqual(sales_ledger.revenue_in_window(Duration(2), Duration(3)), Dollar(1 + 2))
+        self.assertEqual(sales_ledger.revenue_in_window(Duration(12), Duration(3)), Dollar(10))
@@ -5,10 +5,11 @@ from unittest.mock import MagicMock
 import numpy as np
 
 from common import constants
-from common.local_enum import LoanSimulationType
+from common.local_enum import LoanSimulationType, LoanRetention, LoanReferenceType
 from common.local_numbers import O, ONE, Float, Percent, Int, ONE_INT, Duration, Date, TWO, Dollar
 from finance.lender import Lender
 from finance.loan_simulation import LoanSimulation
+from finance.loan_simulation_record import LoanSimulationRecord
 from finance.loan_simulation_results import LoanSimulationResults
 from loan_simulation_results import ONE_LSR, TWO_LSR, WEIGHT_FIELD, AggregatedLoanSimulationResults
 from simulation.merchant_factory import MerchantFactory
@@ -34,6 +35,27 @@ class TestLender(StatisticalTestCase):
     def test_loan_from_merchant(self):
         self.assertEqual(self.lender.generate_loan_from_merchant(self.merchants[0]).merchant, self.merchants[0])
 
+    def test_reference_retention(self):
+        self.data_generator.simulated_duration = Duration(constants.MONTH)
+        reference_context = deepcopy(self.context)
+        reference_context.loan_reference_type = LoanReferenceType.TOTAL_INTEREST
+        reference_context.loan_retention = LoanRetention.SUMMARY
+        with self.assertRaises(AssertionError):
+            Lender(reference_context, self.data_generator, self.merchants[:1])
+        reference_context.loan_retention = LoanRetention.FULL
+        reference_lender = Lender(reference_context, self.data_generator, self.merchants[:1])
+        reference_lender.simulate()
+        lender = Lender(reference_context, self.data_generator, self.merchants[:1], reference_lender=reference_lender)
+        self.assertIs(
+            lender.generate_loan_from_merchant(self.merchants[0]).reference_loan,
+            reference_lender.loans[self.merchants[0]])
+        reference_lender.store_loan(self.merchants[0], LoanSimulationRecord.retain(
+            reference_lender.loans[self.merchants[0]], LoanRetention.SUMMARY))
+        with self.assertRaises(AssertionError):
+            lender.generate_loan_from_merchant(self.merchants[0])
+        lender = Lender(self.context, self.data_generator, self.merchants[:1], reference_lender=reference_lender)
+        self.assertIsNone(lender.generate_loan_from_merchant(self.merchants[0]).reference_loan)
+
     def test_aggregate_results(self):
         self.lender.merchants = [self.merchants[0]] * 3
         three = Float(3)
@@ -48,6 +70,8 @@ class TestLender(StatisticalTestCase):
         self.data_generator.simulated_duration = ONE_INT
         self.lender.all_merchants_simulation_results = MagicMock(return_value=[ONE_LSR])
         self.lender.funded_merchants_simulation_results = MagicMock(return_value=[ONE_LSR])
+        self.lender.loans = {self.merchants[0]: MagicMock()}
+        self.lender.funded_merchants = MagicMock(return_value=[self.merchants[0]])
         self.lender.underwriting_correlation = MagicMock()
         self.lender.reference = None
         self.lender.calculate_results()
@@ -58,10 +82,10 @@ class TestLender(StatisticalTestCase):
         merchants = self.factory.generate_merchants(num_merchants=2)
         loan1 = LoanSimulation(self.context, self.data_generator, merchants[0])
         loan1.simulation_results = ONE_LSR
-        loan1.ledger.total_credit = MagicMock(return_value=1)
+        self.mock_method(loan1.ledger, 'total_credit', MagicMock(return_value=1))
         loan2 = LoanSimulation(self.context, self.data_generator, merchants[1])
         loan2.simulation_results = TWO_LSR
-        loan2.ledger.total_credit = MagicMock(return_value=1)
+        self.mock_method(loan2.ledger, 'total_credit', MagicMock(return_value=1))
         for risk_field in vars(self.context.risk_context).keys():
             getattr(loan1.underwriting.initial_risk_context, risk_field).score = 2
             getattr(loan2.underwriting.initial_risk_context, risk_field).score = 2
@@ -88,10 +112,10 @@ class TestLender(StatisticalTestCase):
         merchants = self.factory.generate_merchants(num_merchants=2)
         loan1 = LoanSimulation(self.context, self.data_generator, merchants[0])
         loan1.simulation_results = ONE_LSR
-        loan1.ledger.total_credit = MagicMock(return_value=1)
+        self.mock_method(loan1.ledger, 'total_credit', MagicMock(return_value=1))
         loan2 = LoanSimulation(self.context, self.data_generator, merchants[1])
         loan2.simulation_results = TWO_LSR
-        loan2.ledger.total_credit = MagicMock(return_value=1)
+        self.mock_method(loan2.ledger, 'total_credit', MagicMock(return_value=1))
         self.lender.loans = {1: loan1, 2: loan2}
         for risk_field in vars(self.context.risk_context).keys():
             getattr(loan1.underwriting.initial_risk_context, risk_field).score = 1.5
@@ -127,6 +151,97 @@ class TestLender(StatisticalTestCase):
         self.data_generator.normal_ratio.assert_not_called()
         self.data_generator.random.assert_not_called()
 
+    def test_simulate_forked(self):
+        self.data_generator.simulated_duration = Duration(constants.YEAR)
+        merchants = self.merchants[:4]
+        lenders = [Lender(self.context, self.data_generator, [merchant.clone() for merchant in merchants], loan_type)
+            for loan_type in LoanSimulationType]
+        self.assertFalse(Lender.can_simulate_forked(lenders))
+        self.context.forked_simulation = True
+        self.assertTrue(Lender.can_simulate_forked(lenders))
+        Lender.simulate_forked(lenders)
+        self.assertFalse(Lender.can_simulate_forked(lenders))
+        for lender in lenders:
+            self.assertTrue(lender.is_presimulated())
+            lender.simulate()
+            reference_lender = Lender(
+                self.context, self.data_generator, [merchant.clone() for merchant in merchants], lender.loan_type)
+            reference_lender.context = deepcopy(self.context)
+            reference_lender.context.forked_simulation = False
+            reference_lender.simulate()
+            for merchant in merchants:
+                self.assertEqual(type(lender.loans[merchant]).__name__, lender.loan_type.value)
+                self.assertEqual(lender.loans[merchant].merchant, merchant)
+                self.assertEqual(lender.loans[merchant].today, reference_lender.loans[merchant].today)
+            self.assertDeepAlmostEqual(lender.simulation_results, reference_lender.simulation_results)
+
+    def test_simulate_from_streams(self):
+        self.data_generator.simulated_duration = Duration(constants.YEAR)
+        self.data_generator.seed = 3
+        merchants = self.factory.generate_merchants(num_merchants=4)
+        lender = Lender(self.context, self.data_generator, merchants)
+        self.assertTrue(lender.can_simulate_from_streams())
+        lender.simulate()
+        loans = [LoanSimulation(self.context, self.data_generator, deepcopy(merchant)) for merchant in merchants]
+        for loan in loans:
+            loan.simulate()
+        for merchant, loan in zip(merchants, loans):
+            self.assertEqual(type(lender.loans[merchant]), LoanSimulation)
+            self.assertEqual(lender.loans[merchant].merchant, merchant)
+            self.assertEqual(lender.loans[merchant].today, loan.today)
+            self.assertDeepAlmostEqual(lender.loans[merchant].simulation_results, loan.simulation_results)
+        self.assertDeepAlmostEqual(
+            lender.simulation_results, Lender.generate_from_simulated_loans(loans).simulation_results)
+        self.context.loan_retention = LoanRetention.SUMMARY
+        summary_lender = Lender(self.context, self.data_generator, merchants)
+        summary_lender.simulate()
+        for merchant, loan in zip(merchants, loans):
+            self.assertEqual(type(summary_lender.loans[merchant]), LoanSimulationRecord)
+            self.assertEqual(summary_lender.loans[merchant].merchant, merchant)
+            self.assertDeepAlmostEqual(summary_lender.loans[merchant].simulation_results, loan.simulation_results)
+        self.data_generator.simulated_duration = Duration(constants.MONTH)
+        self.assertFalse(lender.can_simulate_from_streams())
+
+    def test_simulate_mutated_stream_merchant(self):
+        self.data_generator.simulated_duration = Duration(constants.YEAR)
+        self.data_generator.seed = 3
+        merchants = self.factory.generate_merchants(num_merchants=2)
+        batch = merchants[0].inventories[0].batches[0]
+        batch.initiate_new_purchase_order(batch.get_purchase_order_start_date(), Dollar(10 ** 7))
+        self.assertFalse(merchants[0].matches_stream(self.data_generator.fingerprint()))
+        self.assertTrue(merchants[1].matches_stream(self.data_generator.fingerprint()))
+        lender = Lender(self.context, self.data_generator, merchants)
+        self.assertFalse(lender.can_simulate_from_streams())
+        loans = [LoanSimulation(self.context, self.data_generator, deepcopy(merchant)) for merchant in merchants]
+        lender.simulate()
+        for merchant, loan in zip(merchants, loans):
+            loan.simulate()
+            self.assertDeepAlmostEqual(lender.loans[merchant].simulation_results, loan.simulation_results)
+
+    def test_retention(self):
+        self.data_generator.simulated_duration = Duration(constants.YEAR)
+        self.context.snapshot_cycle = constants.MONTH
+        self.lender.merchants = self.merchants[:4]
+        self.lender.simulate()
+        for retention in [LoanRetention.SUMMARY, LoanRetention.RESULTS]:
+            self.context.loan_retention = retention
+            lender = Lender(self.context, self.data_generator, self.merchants[:4])
+            for merchant, loan in self.lender.loans.items():
+                lender.store_loan(merchant, LoanSimulationRecord.retain(loan, retention))
+            lender.calculate_results()
+            self.assertDeepAlmostEqual(lender.simulation_results, self.lender.simulation_results)
+            self.assertDeepAlmostEqual(lender.risk_correlation, self.lender.risk_correlation)
+            self.assertEqual(lender.risk_order_counts(), self.lender.risk_order_counts())
+            self.assertEqual(lender.lender_profit_per_risk_order(), self.lender.lender_profit_per_risk_order())
+            if retention == LoanRetention.SUMMARY:
+                self.assertDeepAlmostEqual(lender.snapshots, self.lender.snapshots)
+            else:
+                self.assertEqual(lender.snapshots, {})
+        lender = Lender(self.context, self.data_generator, self.merchants[:1])
+        lender.simulate()
+        self.assertEqual(type(lender.loans[self.merchants[0]]), LoanSimulationRecord)
+        self.assertEqual(lender.loans[self.merchants[0]].merchant, self.merchants[0])
+
     def test_generate_from_simulated_loans(self):
         self.data_generator.simulated_duration = Duration(constants.YEAR)
         factory = MerchantFactory(self.data_generator, self.context)
@@ -170,24 +285,32 @@ class TestLender(StatisticalTestCase):
         self.assertDeepAlmostEqual(
             self.lender.get_snapshots_for_day(self.context.snapshot_cycle * 2), [ONE_LSR, TWO_LSR])
 
+    def test_baseline_cache_statistics(self):
+        self.lender.loans = {merchant: MagicMock(baseline_cache_hit=hit) for merchant, hit in
+            zip(self.merchants, [True, False, None, True])}
+        statistics = self.lender.baseline_cache_statistics()
+        self.assertEqual((statistics.hits, statistics.misses), (2, 1))
+
     def test_risk_order_counts(self):
         loans = [LoanSimulation(self.context, self.data_generator, self.merchants[i]) for i in range(2)]
         for i in range(2):
             loans[i].simulation_results = LoanSimulationResults.generate_from_float(ONE)
-            loans[i].ledger.total_credit = MagicMock(return_value=ONE)
+            self.mock_method(loans[i].ledger, 'total_credit', MagicMock(return_value=ONE))
         self.lender.merchants = self.merchants[:2]
         self.lender.loans = {self.merchants[i]: loans[i] for i in range(2)}
         lender2 = deepcopy(self.lender)
         lender2.reference = self.lender
+        for loan in lender2.loans.values():
+            self.mock_method(loan.ledger, 'total_credit', MagicMock(return_value=ONE))
         self.assertEqual(lender2.risk_order_counts(), [0, 0, 2, 0, 0])
-        self.lender.loans[self.merchants[0]].ledger.total_credit = MagicMock(return_value=O)
+        self.mock_method(self.lender.loans[self.merchants[0]].ledger, 'total_credit', MagicMock(return_value=O))
         self.assertEqual(lender2.risk_order_counts(), [0, 0, 1, 0, 0])
 
     def test_lender_profit_per_risk_order(self):
         loans = [LoanSimulation(self.context, self.data_generator, self.merchants[i]) for i in range(2)]
         for i in range(2):
             loans[i].simulation_results = LoanSimulationResults.generate_from_float(ONE)
-            loans[i].ledger.total_credit = MagicMock(return_value=ONE)
+            self.mock_method(loans[i].ledger, 'total_credit', MagicMock(return_value=ONE))
         self.lender.loans = {self.merchants[i]: loans[i] for i in range(2)}
         self.assertEqual(self.lender.lender_profit_per_risk_order()[self.lender.risk_order.get_order(ONE)], ONE)
         loans[0].simulation_results.lender_profit = TWO
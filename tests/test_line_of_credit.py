@@ -88,9 +88,10 @@ class TestInvoiceFinancingSimulation(BaseTestCase):
     def test_approved_amount(self):
         batch1 = Batch.generate_simulated(self.data_generator)
         batch2 = Batch.generate_simulated(self.data_generator)
-        batch1.max_cash_needed = MagicMock(return_value=ONE)
-        batch2.max_cash_needed = MagicMock(return_value=TWO)
-        self.invoice_financing.merchant.batches_with_orders = MagicMock(return_value=[batch1, batch2])
+        self.mock_method(batch1, 'max_cash_needed', MagicMock(return_value=ONE))
+        self.mock_method(batch2, 'max_cash_needed', MagicMock(return_value=TWO))
+        self.mock_method(self.invoice_financing.merchant, 'batches_with_orders', MagicMock(
+            return_value=[batch1, batch2]))
         self.invoice_financing.projected_lender_profit = MagicMock(return_value=ONE)
         self.invoice_financing.loan_amount = MagicMock(return_value=ONE + TWO)
         self.invoice_financing.underwriting.approved = MagicMock(side_effect=[True, False])
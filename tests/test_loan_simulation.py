@@ -4,11 +4,14 @@ from random import uniform, randint
 from unittest.mock import MagicMock
 
 import dacite
+import numpy as np
 
 from common import constants
+from common.context import SimulationContext, DataGenerator
 from common.local_enum import LoanReferenceType
 from common.local_numbers import Float, Dollar, O, ONE, TWO, Duration, O_INT, Ratio, Int, Date, ONE_INT, Percent
 from finance.ledger import Loan, Repayment
+from finance.lender import LOAN_TYPES_MAPPING
 from finance.loan_simulation import LoanSimulation
 from finance.loan_simulation_results import LoanSimulationResults
 from loan_simulation_results import O_LSR
@@ -24,6 +27,30 @@ class TestLoanSimulation(BaseTestCase):
         self.merchant = Merchant.generate_simulated(self.data_generator)
         self.loan_simulation = LoanSimulation(self.context, self.data_generator, self.merchant)
 
+    def test_memoized(self):
+        calculate = MagicMock(side_effect=lambda: self.loan_simulation.current_cash)
+        with self.merchant.memoized_day_views():
+            for _ in range(2):
+                self.assertEqual(self.loan_simulation.memoized('cash', calculate), self.loan_simulation.current_cash)
+            self.assertEqual(calculate.call_count, 1)
+            self.loan_simulation.simulation_stopped = True
+            self.loan_simulation.memoized('cash', calculate)
+            self.assertEqual(calculate.call_count, 1)
+            mutations = [
+                lambda: setattr(self.loan_simulation, 'current_cash', self.loan_simulation.current_cash + ONE),
+                lambda: setattr(self.loan_simulation, 'today', self.loan_simulation.today + 1),
+                lambda: self.loan_simulation.ledger.record_cash(self.loan_simulation.today, ONE),
+                lambda: self.loan_simulation.ledger.new_loan(Loan(ONE, ONE, self.loan_simulation.today)),
+                lambda: self.loan_simulation.ledger.initiate_loan_repayment(self.loan_simulation.today, ONE),
+                self.merchant.invalidate_day_views,
+                lambda: self.loan_simulation.share_state(deepcopy(self.loan_simulation))]
+            for i, mutate in enumerate(mutations):
+                mutate()
+                self.assertEqual(self.loan_simulation.memoized('cash', calculate), self.loan_simulation.current_cash)
+                self.assertEqual(calculate.call_count, i + 2)
+        self.loan_simulation.memoized('cash', calculate)
+        self.assertEqual(calculate.call_count, len(mutations) + 2)
+
     def test_init(self):
         self.assertEqual(self.loan_simulation.ledger.outstanding_balance(), O)
         self.assertEqual(self.loan_simulation.ledger.total_credit(), O)
@@ -92,7 +119,7 @@ class TestLoanSimulation(BaseTestCase):
     def test_credit_needed(self):
         inventory_cost = uniform(1, 1000)
         self.loan_simulation.current_cash = inventory_cost
-        self.merchant.max_cash_needed = MagicMock(return_value=inventory_cost)
+        self.mock_method(self.merchant, 'max_cash_needed', MagicMock(return_value=inventory_cost))
         self.assertEqual(self.loan_simulation.credit_needed(), 0)
         self.loan_simulation.current_cash = 0
         self.assertEqual(self.loan_simulation.credit_needed(), inventory_cost)
@@ -127,6 +154,24 @@ class TestLoanSimulation(BaseTestCase):
         self.loan_simulation.underwriting.approved = MagicMock(return_value=False)
         self.assertEqual(self.loan_simulation.approved_amount(), 0)
 
+    def test_memoized_approval(self):
+        underwriting = self.loan_simulation.underwriting
+        underwriting.calculate_score = MagicMock(side_effect=underwriting.calculate_score)
+        with self.merchant.memoized_day_views():
+            approved = self.loan_simulation.approved(self.merchant)
+            self.assertEqual(self.loan_simulation.approved(self.merchant), approved)
+            self.loan_simulation.risk_context(self.merchant)
+            self.assertEqual(underwriting.calculate_score.call_count, 1)
+            self.merchant.invalidate_day_views()
+            self.loan_simulation.approved(self.merchant)
+            self.assertEqual(underwriting.calculate_score.call_count, 2)
+            self.loan_simulation.today += 1
+            self.loan_simulation.approved(self.merchant)
+            self.assertEqual(underwriting.calculate_score.call_count, 3)
+        self.loan_simulation.approved(self.merchant)
+        self.loan_simulation.approved(self.merchant)
+        self.assertEqual(underwriting.calculate_score.call_count, 5)
+
     def test_reference_conditions(self):
         self.loan_simulation.reference_loan = None
         self.context.loan_reference_type = LoanReferenceType.REVENUE_CAGR
@@ -149,7 +194,7 @@ class TestLoanSimulation(BaseTestCase):
         self.loan_simulation.secondary_approval_conditions = MagicMock(return_value=True)
         self.loan_simulation.credit_needed = MagicMock(return_value=self.context.min_loan_amount)
         self.loan_simulation.reference_conditions = MagicMock(return_value=True)
-        self.loan_simulation.merchant.is_suspended = MagicMock(return_value=False)
+        self.mock_method(self.loan_simulation.merchant, 'is_suspended', MagicMock(return_value=False))
         self.loan_simulation.projected_lender_profit = MagicMock(return_value=ONE)
         self.assertTrue(self.loan_simulation.primary_approval_conditions())
         self.loan_simulation.secondary_approval_conditions = MagicMock(return_value=False)
@@ -163,9 +208,9 @@ class TestLoanSimulation(BaseTestCase):
         self.loan_simulation.reference_conditions = MagicMock(return_value=False)
         self.assertFalse(self.loan_simulation.primary_approval_conditions())
         self.loan_simulation.reference_conditions = MagicMock(return_value=True)
-        self.loan_simulation.merchant.is_suspended = MagicMock(return_value=True)
+        self.mock_method(self.loan_simulation.merchant, 'is_suspended', MagicMock(return_value=True))
         self.assertFalse(self.loan_simulation.primary_approval_conditions())
-        self.loan_simulation.merchant.is_suspended = MagicMock(return_value=False)
+        self.mock_method(self.loan_simulation.merchant, 'is_suspended', MagicMock(return_value=False))
         self.loan_simulation.projected_lender_profit = MagicMock(return_value=Dollar(-1))
         self.assertFalse(self.loan_simulation.primary_approval_conditions())
         self.loan_simulation.projected_lender_profit = MagicMock(return_value=ONE)
@@ -217,7 +262,7 @@ class TestLoanSimulation(BaseTestCase):
         self.loan_simulation.on_bankruptcy.assert_called()
 
     def test_simulate_sales_recent_revenue(self):
-        self.merchant.revenue_per_day = MagicMock(return_value=ONE)
+        self.mock_method(self.merchant, 'revenue_per_day', MagicMock(return_value=ONE))
         self.loan_simulation.simulate_sales()
         self.assertEqual(self.loan_simulation.recent_history_revenue, ONE)
         self.loan_simulation.today += self.context.history_duration_for_amount_calculation
@@ -225,7 +270,7 @@ class TestLoanSimulation(BaseTestCase):
         self.assertEqual(self.loan_simulation.recent_history_revenue, ONE)
 
     def test_simulate_sales_last_year_revenue(self):
-        self.merchant.revenue_per_day = MagicMock(return_value=ONE)
+        self.mock_method(self.merchant, 'revenue_per_day', MagicMock(return_value=ONE))
         self.loan_simulation.simulate_sales()
         self.assertEqual(
             self.loan_simulation.marketplace_balance, self.merchant.gp_per_day(self.data_generator.start_date))
@@ -234,9 +279,23 @@ class TestLoanSimulation(BaseTestCase):
         self.loan_simulation.simulate_sales()
         self.assertEqual(self.loan_simulation.last_year_revenue, ONE)
 
+    def test_revenue_over_period(self):
+        start_date = self.data_generator.start_date
+        self.merchant.suspension_start_date = start_date + constants.MONTH
+        daily_revenue = []
+        for _ in range(constants.YEAR):
+            daily_revenue.append(self.merchant.revenue_per_day(self.loan_simulation.today))
+            self.loan_simulation.simulate_sales()
+            self.loan_simulation.today += 1
+        last_date = start_date + constants.YEAR - 1
+        self.assertTrue(
+            Float.sum(daily_revenue).is_close(self.loan_simulation.revenue_over_period(start_date, last_date)))
+        self.assertEqual(self.loan_simulation.revenue_over_period(start_date, start_date), daily_revenue[0])
+        self.assertEqual(self.loan_simulation.revenue_over_period(last_date + 1, last_date + constants.MONTH), O)
+
     def test_simulate_inventory_purchase(self):
         self.loan_simulation.current_cash = 2
-        self.merchant.inventory_cost = MagicMock(return_value=ONE)
+        self.mock_method(self.merchant, 'inventory_cost', MagicMock(return_value=ONE))
         self.loan_simulation.simulate_inventory_purchase()
         self.assertEqual(self.loan_simulation.current_cash, 2 - 1)
         self.assertDeepAlmostEqual(self.loan_simulation.ledger.cash_history, {self.data_generator.start_date: ONE})
@@ -244,7 +303,7 @@ class TestLoanSimulation(BaseTestCase):
     def test_marketplace_payout_bankruptcy(self):
         self.loan_simulation.today = self.context.marketplace_payment_cycle
         self.loan_simulation.marketplace_balance = 0
-        self.loan_simulation.merchant.has_future_revenue = MagicMock(return_value=False)
+        self.mock_method(self.loan_simulation.merchant, 'has_future_revenue', MagicMock(return_value=False))
         self.loan_simulation.on_bankruptcy = MagicMock()
         self.loan_simulation.marketplace_payout()
         self.loan_simulation.on_bankruptcy.assert_called()
@@ -285,9 +344,11 @@ class TestLoanSimulation(BaseTestCase):
     def test_should_stop_simulation(self):
         self.loan_simulation.bankruptcy_date = None
         self.loan_simulation.reference_conditions = MagicMock(return_value=True)
-        self.loan_simulation.merchant.annual_top_line = MagicMock(return_value=self.context.max_merchant_top_line + 1)
+        self.mock_method(self.loan_simulation.merchant, 'annual_top_line', MagicMock(
+            return_value=self.context.max_merchant_top_line + 1))
         self.assertTrue(self.loan_simulation.should_stop_simulation())
-        self.loan_simulation.merchant.annual_top_line = MagicMock(return_value=self.context.max_merchant_top_line - 1)
+        self.mock_method(self.loan_simulation.merchant, 'annual_top_line', MagicMock(
+            return_value=self.context.max_merchant_top_line - 1))
         self.loan_simulation.reference_conditions = MagicMock(return_value=False)
         self.assertTrue(self.loan_simulation.should_stop_simulation())
         self.loan_simulation.reference_conditions = MagicMock(return_value=True)
@@ -319,6 +380,89 @@ class TestLoanSimulation(BaseTestCase):
         self.assertDeepAlmostEqual(self.loan_simulation.ledger.repayments, loan2.ledger.repayments)
         self.assertDeepAlmostEqual(self.loan_simulation.ledger.active_loans, loan2.ledger.active_loans)
 
+    def assert_equivalent_simulations(
+            self, other_context: SimulationContext, other_data_generator: DataGenerator):
+        for data_generator in [self.data_generator, other_data_generator]:
+            data_generator.simulated_duration = Date(constants.YEAR)
+        for context in [self.context, other_context]:
+            context.snapshot_cycle = constants.MONTH
+        for loan_type in LOAN_TYPES_MAPPING.values():
+            loan = loan_type(self.context, self.data_generator, deepcopy(self.merchant))
+            other_loan = loan_type(other_context, other_data_generator, deepcopy(self.merchant))
+            loan.simulate()
+            other_loan.simulate()
+            self.assertEqual(loan.today, other_loan.today)
+            self.assertDeepAlmostEqual(list(loan.snapshots.keys()), list(other_loan.snapshots.keys()))
+            for field in fields(loan.simulation_results):
+                value = getattr(loan.simulation_results, field.name)
+                other_value = getattr(other_loan.simulation_results, field.name)
+                self.assertEqual(type(value), type(other_value))
+                self.assertTrue(
+                    Float(value).is_close(other_value, constants.FLOAT_EQUALITY_TOLERANCE),
+                    f'{loan_type.__name__}.{field.name}: {value} != {other_value}')
+
+    def test_event_driven_simulation(self):
+        event_driven_context = deepcopy(self.context)
+        event_driven_context.event_driven_simulation = True
+        self.assert_equivalent_simulations(event_driven_context, self.data_generator)
+
+    def test_skip_quiet_days(self):
+        self.data_generator.simulated_duration = Date(constants.YEAR)
+        event_driven_context = deepcopy(self.context)
+        event_driven_context.event_driven_simulation = True
+        skipped_days = 0
+        for merchant in self.factory.generate_merchants(num_merchants=4):
+            for loan_type in LOAN_TYPES_MAPPING.values():
+                loan = loan_type(self.context, self.data_generator, deepcopy(merchant))
+                event_driven_loan = loan_type(event_driven_context, self.data_generator, deepcopy(merchant))
+                event_driven_loan.simulate_day = MagicMock(wraps=event_driven_loan.simulate_day)
+                loan.simulate()
+                event_driven_loan.simulate()
+                skipped_days += loan.today - event_driven_loan.simulate_day.call_count
+                self.assertEqual(loan.today, event_driven_loan.today)
+                self.assertEqual(loan.duration_in_debt, event_driven_loan.duration_in_debt)
+                self.assertDeepAlmostEqual(loan.ledger.cash_history, event_driven_loan.ledger.cash_history)
+                for day in range(self.data_generator.start_date, loan.sales_ledger.last_date() + 1):
+                    self.assertAlmostEqual(
+                        loan.sales_ledger.revenue(day, day), event_driven_loan.sales_ledger.revenue(day, day))
+                self.assertDeepAlmostEqual(loan.simulation_results, event_driven_loan.simulation_results)
+        self.assertGreater(skipped_days, 0)
+
+    def test_native_numbers_simulation(self):
+        native_data_generator = deepcopy(self.data_generator)
+        native_data_generator.native_numbers = True
+        self.assert_equivalent_simulations(self.context, native_data_generator)
+        native_batch = Merchant.generate_simulated(native_data_generator).inventories[0].batches[0]
+        self.assertIs(type(native_batch.sales_velocity()), float)
+        self.assertIs(type(native_batch.duration_in_stock()), int)
+
+    def test_lazy_batches_simulation(self):
+        self.data_generator.lazy_batches = True
+        self.data_generator.simulated_duration = Date(constants.YEAR)
+        merchant = Merchant.generate_simulated(self.data_generator)
+        materialized_merchant = deepcopy(merchant)
+        for inventory in materialized_merchant.inventories:
+            self.assertLessEqual(len(inventory.batches), 2)
+            inventory.materialize()
+        loan = LoanSimulation(self.context, self.data_generator, merchant)
+        materialized_loan = LoanSimulation(self.context, self.data_generator, materialized_merchant)
+        loan.simulate()
+        materialized_loan.simulate()
+        self.assertEqual(loan.today, materialized_loan.today)
+        self.assertDeepAlmostEqual(loan.simulation_results, materialized_loan.simulation_results)
+
+    def test_simulate_until(self):
+        merchant = Merchant.generate_simulated(self.data_generator)
+        loan = LoanSimulation(self.context, self.data_generator, deepcopy(merchant))
+        resumed_loan = LoanSimulation(self.context, self.data_generator, deepcopy(merchant))
+        loan.simulate()
+        self.assertFalse(resumed_loan.simulate(lambda l: l.today > constants.MONTH))
+        self.assertEqual(resumed_loan.today, constants.MONTH + 1)
+        self.assertIsNone(resumed_loan.simulation_results)
+        resumed_loan.finish_simulation()
+        self.assertEqual(loan.today, resumed_loan.today)
+        self.assertDeepAlmostEqual(loan.simulation_results, resumed_loan.simulation_results)
+
     def test_simulate_bankruptcy(self):
         self.loan_simulation.simulate_day = MagicMock()
         self.loan_simulation.calculate_results = MagicMock()
@@ -359,7 +503,7 @@ class TestLoanSimulation(BaseTestCase):
         for obj in [self.loan_simulation, self.loan_simulation.ledger, self.merchant]:
             for k, v in rand_results.items():
                 if hasattr(obj, k):
-                    setattr(obj, k, MagicMock(return_value=v))
+                    self.mock_method(obj, k, MagicMock(return_value=v))
         self.loan_simulation.calculate_results()
         self.assertEqual(self.loan_simulation.simulation_results, dacite.from_dict(LoanSimulationResults, rand_results))
 
@@ -385,12 +529,12 @@ class TestLoanSimulation(BaseTestCase):
 
     def test_valuation_cagr(self):
         self.loan_simulation.today = Date(constants.YEAR)
-        self.merchant.valuation = MagicMock(side_effect=[1, 3])
+        self.mock_method(self.merchant, 'valuation', MagicMock(side_effect=[1, 3]))
         self.assertEqual(self.loan_simulation.valuation_cagr(), 2)
 
     def test_inventory_cagr(self):
         self.loan_simulation.today = Date(constants.YEAR)
-        self.merchant.inventory_value = MagicMock(side_effect=[1, 3])
+        self.mock_method(self.merchant, 'inventory_value', MagicMock(side_effect=[1, 3]))
         self.assertEqual(self.loan_simulation.inventory_cagr(), 2)
 
     def test_net_cashflow_cagr(self):
@@ -400,7 +544,7 @@ class TestLoanSimulation(BaseTestCase):
 
     def test_revenue_cagr(self):
         self.loan_simulation.today = Date(constants.YEAR)
-        self.merchant.annual_top_line = MagicMock(side_effect=[ONE, Dollar(3)])
+        self.mock_method(self.merchant, 'annual_top_line', MagicMock(side_effect=[ONE, Dollar(3)]))
         self.loan_simulation.last_year_revenue = Dollar(3)
         self.assertEqual(self.loan_simulation.revenue_cagr(), 2)
 
@@ -480,7 +624,8 @@ class TestLoanSimulation(BaseTestCase):
     def test_projected_remaining_debt_non_default(self):
         self.loan_simulation.is_default = MagicMock(return_value=False)
         self.loan_simulation.remaining_duration = MagicMock(return_value=Duration(2))
-        self.loan_simulation.merchant.annual_top_line = MagicMock(return_value=3 * Date(constants.YEAR))
+        self.mock_method(self.loan_simulation.merchant, 'annual_top_line', MagicMock(
+            return_value=3 * Date(constants.YEAR)))
         self.loan_simulation.current_repayment_rate = 4
         self.loan_simulation.add_debt(self.loan_simulation.loan_amount())
         self.assertEqual(
@@ -501,7 +646,7 @@ class TestLoanSimulation(BaseTestCase):
             self.loan_simulation.projected_remaining_debt(), self.loan_simulation.max_debt() - repaid)
 
     def test_debt_to_valuation(self):
-        self.merchant.valuation = MagicMock(return_value=Dollar(2))
+        self.mock_method(self.merchant, 'valuation', MagicMock(return_value=Dollar(2)))
         self.assertEqual(self.loan_simulation.debt_to_valuation(), 0)
         self.loan_simulation.add_debt(self.loan_simulation.loan_amount())
         self.assertEqual(self.loan_simulation.debt_to_valuation(), self.loan_simulation.max_debt() / 2)
@@ -525,9 +670,9 @@ class TestLoanSimulation(BaseTestCase):
 
     def test_lender_profit_margin(self):
         self.loan_simulation.lender_profit = MagicMock(return_value=O)
-        self.loan_simulation.ledger.total_credit = MagicMock(return_value=O)
+        self.mock_method(self.loan_simulation.ledger, 'total_credit', MagicMock(return_value=O))
         self.assertEqual(self.loan_simulation.lender_profit_margin(), O)
-        self.loan_simulation.ledger.total_credit = MagicMock(return_value=ONE)
+        self.mock_method(self.loan_simulation.ledger, 'total_credit', MagicMock(return_value=ONE))
         self.assertEqual(self.loan_simulation.lender_profit_margin(), O)
         self.loan_simulation.lender_profit = MagicMock(return_value=Dollar(-1))
         self.assertEqual(self.loan_simulation.lender_profit_margin(), O)
@@ -563,6 +708,9 @@ class TestLoanSimulation(BaseTestCase):
         self.assertEqual(self.loan_simulation.calculate_apr(Date(constants.YEAR)), self.loan_simulation.flat_fee)
         self.assertEqual(
             self.loan_simulation.calculate_apr(Date(constants.YEAR) / 2), (self.loan_simulation.flat_fee + 1) ** 2 - 1)
+        durations = np.array([constants.YEAR, constants.YEAR / 2, 1])
+        for apr, duration in zip(self.loan_simulation.calculate_apr(durations), durations):
+            self.assertAlmostEqual(apr, self.loan_simulation.calculate_apr(duration))
 
     def test_average_apr(self):
         self.loan_simulation.projected_remaining_debt = MagicMock(return_value=O)
@@ -597,6 +745,25 @@ class TestLoanSimulation(BaseTestCase):
         # noinspection PyTypeChecker
         self.assertDeepAlmostEqual(expected, self.loan_simulation.snapshots)
 
+    def test_memoized_results(self):
+        self.loan_simulation.calculate_loan_amount = MagicMock(return_value=ONE)
+        self.assertEqual(self.loan_simulation.loan_amount(), ONE)
+        self.assertEqual(self.loan_simulation.loan_amount(), ONE)
+        self.assertEqual(self.loan_simulation.calculate_loan_amount.call_count, 2)
+        with self.merchant.memoized_day_views():
+            self.loan_simulation.loan_amount()
+            self.loan_simulation.loan_amount()
+            self.assertEqual(self.loan_simulation.calculate_loan_amount.call_count, 3)
+            self.loan_simulation.current_cash += ONE
+            self.loan_simulation.loan_amount()
+            self.assertEqual(self.loan_simulation.calculate_loan_amount.call_count, 4)
+            self.loan_simulation.add_debt(ONE)
+            self.loan_simulation.loan_amount()
+            self.assertEqual(self.loan_simulation.calculate_loan_amount.call_count, 5)
+            self.loan_simulation.today += 1
+            self.loan_simulation.loan_amount()
+            self.assertEqual(self.loan_simulation.calculate_loan_amount.call_count, 6)
+
     def test_estimated_annual_revenue(self):
         self.assertEqual(
             self.merchant.annual_top_line(self.data_generator.start_date),
@@ -0,0 +1,41 @@
+from common import constants
+from common.local_enum import LoanRetention
+from common.local_numbers import Date
+from finance.loan_simulation import LoanSimulation
+from finance.loan_simulation_record import LoanSimulationRecord
+from seller.merchant import Merchant
+from tests.util_test import BaseTestCase
+
+
+class TestLoanSimulationRecord(BaseTestCase):
+    def setUp(self) -> None:
+        super(TestLoanSimulationRecord, self).setUp()
+        self.data_generator.simulated_duration = Date(constants.YEAR)
+        self.context.snapshot_cycle = constants.MONTH
+        self.loan = LoanSimulation(self.context, self.data_generator, Merchant.generate_simulated(self.data_generator))
+        self.loan.simulate()
+
+    def test_record(self):
+        record = LoanSimulationRecord(self.loan, (1, 2))
+        self.assertIsNone(record.merchant)
+        self.assertEqual(record.stream_key, (1, 2))
+        self.assertEqual(record.today, self.loan.today)
+        self.assertEqual(record.simulation_results, self.loan.simulation_results)
+        self.assertEqual(record.snapshots, self.loan.snapshots)
+        self.assertEqual(record.revenue_cagr(), self.loan.revenue_cagr())
+        self.assertEqual(record.ledger.total_credit(), self.loan.ledger.total_credit())
+        self.assertEqual(record.ledger.num_loans(), self.loan.ledger.num_loans())
+        self.assertEqual(record.ledger.outstanding_balance(), self.loan.ledger.outstanding_balance())
+        self.assertEqual(
+            record.underwriting.initial_risk_context.score_dict(),
+            self.loan.underwriting.initial_risk_context.score_dict())
+
+    def test_retain(self):
+        self.assertIs(LoanSimulationRecord.retain(self.loan, LoanRetention.FULL), self.loan)
+        summary = LoanSimulationRecord.retain(self.loan, LoanRetention.SUMMARY)
+        self.assertEqual(summary.ledger.paid_balance, self.loan.ledger.paid_balance)
+        self.assertEqual(summary.bankruptcy_date, self.loan.bankruptcy_date)
+        record = LoanSimulationRecord.retain(self.loan, LoanRetention.RESULTS)
+        self.assertEqual(record.snapshots, {})
+        self.assertEqual(record.ledger.total_credit(), self.loan.ledger.total_credit())
+        self.assertEqual(record.ledger.num_loans(), self.loan.ledger.num_loans())
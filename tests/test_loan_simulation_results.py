@@ -0,0 +1,46 @@
+from dataclasses import fields
+from random import uniform
+
+from common import constants
+from common.local_numbers import Float, O
+from common.util import weighted_average, min_max
+from finance.loan_simulation_results import LoanSimulationResults, AggregatedLoanSimulationResults, \
+    LoanSimulationResultsAccumulator, NO_WEIGHTS_FIELDS, O_LSR
+from tests.util_test import BaseTestCase
+
+
+class TestLoanSimulationResultsAccumulator(BaseTestCase):
+    def setUp(self) -> None:
+        super(TestLoanSimulationResultsAccumulator, self).setUp()
+        self.lsrs = [LoanSimulationResults.generate_from_float(Float(uniform(0, 10))) for _ in range(9)] + [O_LSR]
+
+    def test_finalize(self):
+        aggregated = AggregatedLoanSimulationResults.generate_from_list(self.lsrs, 20)
+        weights = [min_max(lsr.valuation, 1, constants.MAX_RESULTS_WEIGHT) for lsr in self.lsrs]
+        for field in fields(LoanSimulationResults):
+            values = [getattr(lsr, field.name) for lsr in self.lsrs]
+            expected = Float.mean(values) if field.name in NO_WEIGHTS_FIELDS else weighted_average(values, weights)
+            self.assertAlmostEqual(getattr(aggregated, field.name), expected)
+        self.assertEqual(aggregated.num_merchants, 9)
+        self.assertAlmostEqual(aggregated.approval_rate, 9 / 20)
+
+    def test_merge(self):
+        accumulators = [LoanSimulationResultsAccumulator() for _ in range(3)]
+        for i, lsr in enumerate(self.lsrs):
+            accumulators[i % 3].add(lsr)
+        accumulators[0].merge(accumulators[1])
+        accumulators[0].merge(accumulators[2])
+        self.assertDeepAlmostEqual(
+            accumulators[0].finalize(10), AggregatedLoanSimulationResults.generate_from_list(self.lsrs, 10))
+
+    def test_sampling_weights(self):
+        weighted = AggregatedLoanSimulationResults.generate_from_list(self.lsrs, 11, [2.0] + [1.0] * 9)
+        duplicated = AggregatedLoanSimulationResults.generate_from_list([self.lsrs[0]] + self.lsrs, 11)
+        for field in fields(LoanSimulationResults):
+            self.assertAlmostEqual(getattr(weighted, field.name), getattr(duplicated, field.name))
+        self.assertAlmostEqual(weighted.approval_rate, duplicated.approval_rate)
+
+    def test_empty(self):
+        aggregated = LoanSimulationResultsAccumulator().finalize(1)
+        for field in fields(aggregated):
+            self.assertEqual(getattr(aggregated, field.name), O)
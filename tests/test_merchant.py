@@ -1,7 +1,12 @@
+import gc
+import pickle
+import tracemalloc
+from copy import deepcopy
 from unittest.mock import MagicMock
 
 from common import constants
 from common.local_numbers import Float, Dollar, ONE, Date, Stock, O
+from finance.loan_simulation import LoanSimulation
 from seller.batch import PurchaseOrder, Batch
 from seller.inventory import Inventory
 from seller.merchant import Merchant
@@ -28,11 +33,133 @@ class TestMerchant(BaseTestCase):
         self.merchant = Merchant.generate_simulated(self.data_generator)
         self.assertIsNotNone(self.merchant.suspension_start_date)
 
+    def test_generate_from_stream(self):
+        self.data_generator.seed = 11
+        merchant1 = Merchant.generate_from_stream(self.data_generator, 3)
+        merchant2 = Merchant.generate_from_stream(self.data_generator, 3)
+        self.assertEqual(merchant1.stream_key, (3,))
+        self.assertEqual(merchant1.suspension_start_date, merchant2.suspension_start_date)
+        self.assertEqual(len(merchant1.inventories), len(merchant2.inventories))
+        for day in [self.data_generator.start_date, self.data_generator.simulated_duration]:
+            self.assertEqual(merchant1.annual_top_line(day), merchant2.annual_top_line(day))
+            self.assertEqual(merchant1.profit_margin(day), merchant2.profit_margin(day))
+        merchant3 = Merchant.generate_from_stream(self.data_generator, 4)
+        self.assertNotEqual(
+            merchant1.annual_top_line(self.data_generator.start_date),
+            merchant3.annual_top_line(self.data_generator.start_date))
+
+    def test_memory_footprint(self):
+        gc.collect()
+        tracemalloc.start()
+        merchants = [Merchant.generate_simulated(self.data_generator) for _ in range(20)]
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        num_batches = sum(len(inventory.batches) for merchant in merchants for inventory in merchant.inventories)
+        self.assertLess(allocated / num_batches, 850)
+        for obj in [merchants[0], merchants[0].inventories[0], merchants[0].inventories[0].batches[0],
+            merchants[0].inventories[0].product]:
+            self.assertFalse(hasattr(obj, '__dict__'))
+
+    def test_copy(self):
+        merchant = deepcopy(self.merchant)
+        self.assertEqual(merchant, self.merchant)
+        self.assertEqual(merchant.id, self.merchant.id)
+        batch = self.merchant.inventories[0].batches[0]
+        copied_batch = merchant.inventories[0].batches[0]
+        self.assertIsNot(copied_batch, batch)
+        self.assertIs(copied_batch.product, merchant.inventories[0].product)
+        self.assertIsNot(copied_batch.product, batch.product)
+        self.assertIs(copied_batch.data_generator, merchant.data_generator)
+        self.assertFalse(hasattr(batch, '__dict__'))
+        for day in [self.data_generator.start_date, self.data_generator.simulated_duration]:
+            self.assertEqual(merchant.annual_top_line(day), self.merchant.annual_top_line(day))
+            self.assertEqual(pickle.loads(pickle.dumps(merchant)).annual_top_line(day), merchant.annual_top_line(day))
+        merchant.reset_id()
+        self.assertNotEqual(merchant, self.merchant)
+        merchant.id = self.merchant.id
+        self.assertEqual(merchant, self.merchant)
+
+    def test_clone(self):
+        self.data_generator.lazy_batches = True
+        merchant = Merchant.generate_simulated(self.data_generator)
+        reference = deepcopy(merchant)
+        clone = merchant.clone()
+        num_batches = [len(inventory.batches) for inventory in merchant.inventories]
+        last_dates = [batch.last_date for inventory in merchant.inventories for batch in inventory.batches]
+        self.assertEqual(clone, merchant)
+        for inventory, cloned_inventory in zip(merchant.inventories, clone.inventories):
+            self.assertIs(cloned_inventory.product, inventory.product)
+            self.assertIsNot(cloned_inventory.batches, inventory.batches)
+            for batch, cloned_batch in zip(inventory.batches, cloned_inventory.batches):
+                self.assertIsNot(cloned_batch, batch)
+                self.assertIs(cloned_batch.roas, batch.roas)
+        loan = LoanSimulation(self.context, self.data_generator, clone)
+        reference_loan = LoanSimulation(self.context, self.data_generator, reference)
+        loan.simulate()
+        reference_loan.simulate()
+        self.assertDeepAlmostEqual(loan.simulation_results, reference_loan.simulation_results)
+        self.assertEqual([len(inventory.batches) for inventory in merchant.inventories], num_batches)
+        self.assertEqual(
+            [batch.last_date for inventory in merchant.inventories for batch in inventory.batches], last_dates)
+
     def test_annual_top_line(self):
         for inventory in self.merchant.inventories:
-            inventory.annual_top_line = MagicMock(return_value=ONE)
+            self.mock_method(inventory, 'annual_top_line', MagicMock(return_value=ONE))
         self.assertEqual(self.merchant.annual_top_line(self.data_generator.start_date), len(self.merchant.inventories))
 
+    def test_memoized_day_views(self):
+        day = self.data_generator.start_date
+        top_line = self.merchant.annual_top_line(day)
+        inventory = self.merchant.inventories[0]
+        self.mock_method(inventory, 'annual_top_line', MagicMock(side_effect=inventory.annual_top_line))
+        with self.merchant.memoized_day_views():
+            self.assertEqual(self.merchant.annual_top_line(day), top_line)
+            self.merchant.get_roas(day)
+            self.merchant.profit_margin(day)
+            self.assertEqual(inventory.annual_top_line.call_count, 1)
+            self.merchant.invalidate_day_views()
+            self.merchant.get_roas(day)
+            self.assertEqual(inventory.annual_top_line.call_count, 2)
+        self.assertDeepAlmostEqual(self.merchant.day_views, {})
+        self.merchant.get_roas(day)
+        self.assertEqual(inventory.annual_top_line.call_count, 3)
+
+    def test_inventory_cost_invalidates_day_views(self):
+        batch = self.merchant.inventories[0].batches[0]
+        day = batch.get_purchase_order_start_date()
+        with self.merchant.memoized_day_views():
+            self.merchant.annual_top_line(batch.last_date + 1)
+            state_version = self.merchant.state_version
+            self.merchant.inventory_cost(day, Dollar(10 ** 7))
+            self.assertGreater(self.merchant.state_version, state_version)
+            self.assertEqual(
+                self.merchant.annual_top_line(batch.last_date + 1),
+                Float.sum([inventory.annual_top_line(batch.last_date + 1) for inventory in self.merchant.inventories]))
+
+    def test_batch_changes_invalidate_day_views(self):
+        batch = self.merchant.inventories[0].batches[0]
+        day = batch.last_date + 1
+        with self.merchant.memoized_day_views():
+            top_line = self.merchant.annual_top_line(day)
+            state_version = self.merchant.state_version
+            batch.initiate_new_purchase_order(batch.get_purchase_order_start_date(), Dollar(10 ** 7))
+            self.assertGreater(self.merchant.state_version, state_version)
+            self.assertNotEqual(self.merchant.annual_top_line(day), top_line)
+            self.assertEqual(
+                self.merchant.annual_top_line(day),
+                Float.sum([inventory.annual_top_line(day) for inventory in self.merchant.inventories]))
+
+    def test_lazy_batches_change_state_version(self):
+        self.data_generator.lazy_batches = True
+        merchant = Merchant.generate_simulated(self.data_generator)
+        clone = merchant.clone()
+        state_version = merchant.state_version
+        inventory = merchant.inventories[0]
+        inventory.generate_next_batch()
+        self.assertGreater(merchant.state_version, state_version)
+        self.assertIs(inventory.batches[-1].version_counter, merchant.version_counter)
+        self.assertEqual(clone.state_version, state_version)
+
     def test_is_suspended(self):
         self.merchant.suspension_start_date = None
         self.assertFalse(self.merchant.is_suspended(self.data_generator.start_date))
@@ -48,40 +175,49 @@ class TestMerchant(BaseTestCase):
 
     def test_gp_per_day(self):
         for inventory in self.merchant.inventories:
-            inventory.gp_per_day = MagicMock(return_value=ONE)
-        self.merchant.is_suspended = MagicMock(return_value=True)
+            self.mock_method(inventory, 'gp_per_day', MagicMock(return_value=ONE))
+        self.mock_method(self.merchant, 'is_suspended', MagicMock(return_value=True))
         self.assertEqual(self.merchant.gp_per_day(self.data_generator.start_date), 0)
-        self.merchant.is_suspended = MagicMock(return_value=False)
+        self.mock_method(self.merchant, 'is_suspended', MagicMock(return_value=False))
         self.assertEqual(self.merchant.gp_per_day(self.data_generator.start_date), len(self.merchant.inventories))
 
     def test_revenue_per_day(self):
         for inventory in self.merchant.inventories:
-            inventory.revenue_per_day = MagicMock(return_value=ONE)
-        self.merchant.is_suspended = MagicMock(return_value=True)
+            self.mock_method(inventory, 'revenue_per_day', MagicMock(return_value=ONE))
+        self.mock_method(self.merchant, 'is_suspended', MagicMock(return_value=True))
         self.assertEqual(self.merchant.revenue_per_day(self.data_generator.start_date), 0)
-        self.merchant.is_suspended = MagicMock(return_value=False)
+        self.mock_method(self.merchant, 'is_suspended', MagicMock(return_value=False))
         self.assertEqual(self.merchant.revenue_per_day(self.data_generator.start_date), len(self.merchant.inventories))
 
+    def test_next_event_date(self):
+        day = self.data_generator.start_date
+        next_event_date = self.merchant.next_event_date(day)
+        self.assertGreater(next_event_date, day)
+        for batch in self.merchant.current_batches(day):
+            self.assertLessEqual(next_event_date, batch.last_date + 1)
+        self.merchant.suspension_start_date = day + 1
+        self.assertEqual(self.merchant.next_event_date(day), day + 1)
+
     def test_max_inventory_cost(self):
         for inventory in self.merchant.inventories:
-            inventory[self.data_generator.start_date].max_cash_needed = MagicMock(return_value=ONE)
+            self.mock_method(inventory[self.data_generator.start_date], 'max_cash_needed', MagicMock(return_value=ONE))
         self.assertEqual(self.merchant.max_cash_needed(self.data_generator.start_date), len(self.merchant.inventories))
 
     def test_batches_with_orders(self):
         batch1 = Batch.generate_simulated(self.data_generator)
         batch2 = Batch.generate_simulated(self.data_generator)
-        self.merchant.current_batches = MagicMock(return_value=[batch1, batch2])
-        batch1.max_cash_needed = MagicMock(return_value=O)
-        batch2.max_cash_needed = MagicMock(return_value=O)
+        self.mock_method(self.merchant, 'current_batches', MagicMock(return_value=[batch1, batch2]))
+        self.mock_method(batch1, 'max_cash_needed', MagicMock(return_value=O))
+        self.mock_method(batch2, 'max_cash_needed', MagicMock(return_value=O))
         self.assertDeepAlmostEqual(self.merchant.batches_with_orders(self.data_generator.start_date), [])
-        batch1.max_cash_needed = MagicMock(return_value=ONE)
+        self.mock_method(batch1, 'max_cash_needed', MagicMock(return_value=ONE))
         self.assertDeepAlmostEqual(self.merchant.batches_with_orders(self.data_generator.start_date), [batch1])
-        batch2.max_cash_needed = MagicMock(return_value=ONE)
-        batch1.profit_margin = MagicMock(return_value=O)
-        batch2.profit_margin = MagicMock(return_value=ONE)
+        self.mock_method(batch2, 'max_cash_needed', MagicMock(return_value=ONE))
+        self.mock_method(batch1, 'profit_margin', MagicMock(return_value=O))
+        self.mock_method(batch2, 'profit_margin', MagicMock(return_value=ONE))
         self.assertDeepAlmostEqual(self.merchant.batches_with_orders(self.data_generator.start_date), [batch2, batch1])
-        batch1.profit_margin = MagicMock(return_value=ONE)
-        batch2.profit_margin = MagicMock(return_value=O)
+        self.mock_method(batch1, 'profit_margin', MagicMock(return_value=ONE))
+        self.mock_method(batch2, 'profit_margin', MagicMock(return_value=O))
         self.assertDeepAlmostEqual(self.merchant.batches_with_orders(self.data_generator.start_date), [batch1, batch2])
 
     def test_inventory_cost(self):
@@ -92,21 +228,23 @@ class TestMerchant(BaseTestCase):
                 break
         cash = Float.sum([inventory[day].max_cash_needed(day) for inventory in self.merchant.inventories])
         max_spend = self.merchant.inventory_cost(day, cash)
-        self.merchant.committed_purchase_orders = MagicMock(return_value=ONE)
+        self.mock_method(self.merchant, 'committed_purchase_orders', MagicMock(return_value=ONE))
         self.assertLess(self.merchant.inventory_cost(day, cash), max_spend)
 
     def test_inventory_cost_multiple_PO_same_date(self):
         product = Product.generate_simulated(self.data_generator)
         batch1 = Batch.generate_simulated(self.data_generator, product)
         batch2 = Batch.generate_simulated(self.data_generator, product)
-        batch1.get_purchase_order_start_date = MagicMock(return_value=self.data_generator.start_date)
-        batch2.get_purchase_order_start_date = MagicMock(return_value=self.data_generator.start_date)
+        self.mock_method(batch1, 'get_purchase_order_start_date', MagicMock(
+            return_value=self.data_generator.start_date))
+        self.mock_method(batch2, 'get_purchase_order_start_date', MagicMock(
+            return_value=self.data_generator.start_date))
         upfront_max_cost = batch1.max_purchase_order().upfront_cost + batch2.max_purchase_order().upfront_cost
         single_max_cost = Float.max(
             batch1.max_cash_needed(self.data_generator.start_date),
             batch2.max_cash_needed(self.data_generator.start_date))
-        inventories = [Inventory(self.data_generator, product, [batch1]),
-            Inventory(self.data_generator, product, [batch2])]
+        inventories = [Inventory(product, [batch1]),
+            Inventory(product, [batch2])]
         self.merchant = Merchant(self.data_generator, inventories, None)
         self.assertLess(self.merchant.inventory_cost(self.data_generator.start_date, single_max_cost), upfront_max_cost)
 
@@ -127,14 +265,16 @@ class TestMerchant(BaseTestCase):
     def test_has_future_revenue(self):
         self.assertTrue(self.merchant.has_future_revenue(self.data_generator.start_date))
         for inventory in self.merchant.inventories:
-            inventory[self.data_generator.start_date].has_future_revenue = MagicMock(return_value=False)
+            self.mock_method(inventory[self.data_generator.start_date], 'has_future_revenue', MagicMock(
+                return_value=False))
         self.assertFalse(self.merchant.has_future_revenue(self.data_generator.start_date))
-        self.merchant.inventories[-1][self.data_generator.start_date].has_future_revenue = MagicMock(return_value=True)
+        self.mock_method(self.merchant.inventories[-1][self.data_generator.start_date], 'has_future_revenue', MagicMock(
+            return_value=True))
         self.assertTrue(self.merchant.has_future_revenue(self.data_generator.start_date))
 
     def test_valuation(self):
         for inventory in self.merchant.inventories:
-            inventory.valuation = MagicMock(return_value=ONE)
+            self.mock_method(inventory, 'valuation', MagicMock(return_value=ONE))
         net_cashflow = Dollar(0.5)
         self.assertEqual(
             self.merchant.valuation(self.data_generator.start_date, net_cashflow),
@@ -142,51 +282,52 @@ class TestMerchant(BaseTestCase):
 
     def test_inventory_value(self):
         for inventory in self.merchant.inventories:
-            inventory.current_inventory_valuation = MagicMock(return_value=ONE)
+            self.mock_method(inventory, 'current_inventory_valuation', MagicMock(return_value=ONE))
         self.assertEqual(
             self.merchant.inventory_value(self.data_generator.start_date), len(self.merchant.inventories))
 
     def test_get_organic_rate(self):
         for inventory in self.merchant.inventories:
             inventory[self.data_generator.start_date].organic_rate = 0.2
-            inventory.annual_top_line = MagicMock(return_value=ONE)
+            self.mock_method(inventory, 'annual_top_line', MagicMock(return_value=ONE))
         self.assertEqual(self.merchant.get_organic_rate(self.data_generator.start_date), 0.2)
-        self.merchant.inventories[0].annual_top_line = MagicMock(return_value=10)
+        self.mock_method(self.merchant.inventories[0], 'annual_top_line', MagicMock(return_value=10))
         self.merchant.inventories[0][self.data_generator.start_date].organic_rate = 0.5
         self.assertGreater(self.merchant.get_organic_rate(self.data_generator.start_date), 0.2)
 
     def test_get_out_of_stock(self):
         for inventory in self.merchant.inventories:
             inventory[self.data_generator.start_date].out_of_stock_rate = 0.2
-            inventory.annual_top_line = MagicMock(return_value=ONE)
+            self.mock_method(inventory, 'annual_top_line', MagicMock(return_value=ONE))
         self.assertEqual(self.merchant.get_out_of_stock_rate(self.data_generator.start_date), 0.2)
-        self.merchant.inventories[0].annual_top_line = MagicMock(return_value=10)
+        self.mock_method(self.merchant.inventories[0], 'annual_top_line', MagicMock(return_value=10))
         self.merchant.inventories[0][self.data_generator.start_date].out_of_stock_rate = 0.5
         self.assertGreater(self.merchant.get_out_of_stock_rate(self.data_generator.start_date), 0.2)
 
     def test_profit_margin(self):
         for inventory in self.merchant.inventories:
-            inventory[self.data_generator.start_date].profit_margin = MagicMock(return_value=0.1)
-            inventory.annual_top_line = MagicMock(return_value=ONE)
+            self.mock_method(inventory[self.data_generator.start_date], 'profit_margin', MagicMock(return_value=0.1))
+            self.mock_method(inventory, 'annual_top_line', MagicMock(return_value=ONE))
         self.assertEqual(self.merchant.profit_margin(self.data_generator.start_date), 0.1)
-        self.merchant.inventories[0].annual_top_line = MagicMock(return_value=10)
-        self.merchant.inventories[0][self.data_generator.start_date].profit_margin = MagicMock(return_value=0.2)
+        self.mock_method(self.merchant.inventories[0], 'annual_top_line', MagicMock(return_value=10))
+        self.mock_method(self.merchant.inventories[0][self.data_generator.start_date], 'profit_margin', MagicMock(
+            return_value=0.2))
         self.assertGreater(self.merchant.profit_margin(self.data_generator.start_date), 0.1)
 
     def test_get_inventory_turnover_ratio(self):
         for inventory in self.merchant.inventories:
             inventory[self.data_generator.start_date].inventory_turnover_ratio = 3
-            inventory.annual_top_line = MagicMock(return_value=ONE)
+            self.mock_method(inventory, 'annual_top_line', MagicMock(return_value=ONE))
         self.assertEqual(self.merchant.get_inventory_turnover_ratio(self.data_generator.start_date), 3)
-        self.merchant.inventories[0].annual_top_line = MagicMock(return_value=10)
+        self.mock_method(self.merchant.inventories[0], 'annual_top_line', MagicMock(return_value=10))
         self.merchant.inventories[0][self.data_generator.start_date].inventory_turnover_ratio = 6
         self.assertGreater(self.merchant.get_inventory_turnover_ratio(self.data_generator.start_date), 3)
 
     def test_get_roas(self):
         for inventory in self.merchant.inventories:
             inventory[self.data_generator.start_date].roas = 2.2
-            inventory.annual_top_line = MagicMock(return_value=ONE)
+            self.mock_method(inventory, 'annual_top_line', MagicMock(return_value=ONE))
         self.assertEqual(self.merchant.get_roas(self.data_generator.start_date), 2.2)
-        self.merchant.inventories[0].annual_top_line = MagicMock(return_value=10)
+        self.mock_method(self.merchant.inventories[0], 'annual_top_line', MagicMock(return_value=10))
         self.merchant.inventories[0][self.data_generator.start_date].roas = 3.5
         self.assertGreater(self.merchant.get_roas(self.data_generator.start_date), 2.2)
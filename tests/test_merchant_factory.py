@@ -1,9 +1,14 @@
+import multiprocessing
 from copy import deepcopy
 from typing import Optional, Any
 from unittest.mock import MagicMock, patch
 
+from common import constants
 from common.local_enum import LoanSimulationType, LoanReferenceType
 from common.local_numbers import Percent, Dollar, O, ONE
+from common.tqdm_parallel import LIVE_RATE
+from finance.ledger import Loan
+from finance.lender import Lender
 from finance.loan_simulation import LoanSimulation
 from finance.loan_simulation_results import O_LSR
 from seller.merchant import Merchant
@@ -33,7 +38,7 @@ class TestMerchantFactory(StatisticalTestCase):
 
     def test_generate_merchant_validator(self):
         margin = Percent(0.1)
-        self.merchant.profit_margin = MagicMock(return_value=margin)
+        self.mock_method(self.merchant, 'profit_margin', MagicMock(return_value=margin))
         field_name = 'profit_margin'
         condition_gt = Condition(field_name, min_value=margin + 0.1)
         condition_eq = Condition(field_name, min_value=margin)
@@ -110,6 +115,48 @@ class TestMerchantFactory(StatisticalTestCase):
             self.factory.generate_lsr_validator([condition_lt, condition2_lt])(self.merchant),
             [loan1, loan2])
 
+    def test_condition_decide(self):
+        loan = LoanSimulation(self.context, self.data_generator, self.merchant)
+        credit_condition = Condition('total_credit', LoanSimulationType.DEFAULT, O)
+        max_credit_condition = Condition('total_credit', LoanSimulationType.DEFAULT, max_value=Dollar(1))
+        num_loans_condition = Condition('num_loans', LoanSimulationType.DEFAULT, ONE)
+        self.assertTrue(Condition(loan_type=LoanSimulationType.DEFAULT).decide(loan))
+        self.assertIsNone(Condition('lender_profit', LoanSimulationType.DEFAULT, O).decide(loan))
+        self.assertIsNone(credit_condition.decide(loan))
+        self.assertIsNone(max_credit_condition.decide(loan))
+        loan.ledger.new_loan(Loan(Dollar(2), Dollar(2), loan.today))
+        loan.ledger.new_loan(Loan(Dollar(2), Dollar(2), loan.today))
+        self.assertIsNone(credit_condition.decide(loan))
+        loan.ledger.initiate_loan_repayment(loan.today, ONE)
+        self.assertTrue(credit_condition.decide(loan))
+        self.assertIsNone(max_credit_condition.decide(loan))
+        self.assertIsNone(num_loans_condition.decide(loan))
+        loan.ledger.initiate_loan_repayment(loan.today, Dollar(2))
+        self.assertFalse(max_credit_condition.decide(loan))
+        self.assertTrue(num_loans_condition.decide(loan))
+
+    def test_generate_lsr_validator_early_decision(self):
+        conditions = [Condition('total_credit', LoanSimulationType.DEFAULT, O),
+            Condition('lender_profit', LoanSimulationType.LINE_OF_CREDIT, O)]
+        validator = self.factory.generate_lsr_validator(conditions)
+        for _ in range(self.data_generator.num_merchants):
+            merchant = Merchant.generate_simulated(self.data_generator)
+            loans = validator(merchant)
+            expected_loans = []
+            for condition in conditions:
+                expected_loans.append(
+                    Lender.generate_loan(deepcopy(merchant), self.context, self.data_generator, condition.loan_type,
+                        None))
+                expected_loans[-1].simulate()
+            expected_accepted = all(
+                condition.is_satisfied(getattr(loan.simulation_results, condition.field_name)) for condition, loan in
+                zip(conditions, expected_loans))
+            self.assertEqual(loans is not None, expected_accepted)
+            if loans is not None:
+                for loan, expected_loan in zip(loans, expected_loans):
+                    self.assertEqual(loan.today, expected_loan.today)
+                    self.assertDeepAlmostEqual(loan.simulation_results, expected_loan.simulation_results)
+
     def test_generate_merchants(self):
         merchants_and_results = self.factory.generate_merchants(
             self.factory.generate_merchant_validator(Condition('annual_top_line', min_value=Dollar(10 ** 5))))
@@ -124,6 +171,85 @@ class TestMerchantFactory(StatisticalTestCase):
         merchants_and_results = self.factory.generate_merchants(num_merchants=num_merchants)
         self.assertEqual(len(merchants_and_results), num_merchants)
 
+    def test_generate_merchants_from_seed(self):
+        self.data_generator.seed = 5
+        validator = self.factory.generate_merchant_validator(Condition('annual_top_line', min_value=Dollar(10 ** 5)))
+        for generate in [lambda: self.factory.generate_merchants(), lambda: self.factory.generate_merchants(validator)]:
+            merchants1 = generate()
+            merchants2 = generate()
+            if isinstance(merchants1[0], tuple):
+                merchants1 = MerchantFactory.get_merchants_from_results(merchants1)
+                merchants2 = MerchantFactory.get_merchants_from_results(merchants2)
+            for merchant1, merchant2 in zip(merchants1, merchants2):
+                self.assertEqual(merchant1.stream_key, merchant2.stream_key)
+                self.assertEqual(
+                    merchant1.annual_top_line(self.data_generator.start_date),
+                    merchant2.annual_top_line(self.data_generator.start_date))
+
+    def test_generate_merchants_from_pool(self):
+        self.data_generator.seed = 5
+        self.data_generator.pooled_sampling = True
+        min_top_line = Dollar(10 ** 6)
+        validator = self.factory.generate_merchant_validator(Condition('annual_top_line', min_value=min_top_line))
+        merchants_and_results1 = self.factory.generate_merchants(validator, show_live_rate=True)
+        self.assertEqual(len(merchants_and_results1), self.data_generator.num_merchants)
+        self.assertEqual(LIVE_RATE.total % constants.POOL_CANDIDATES_PER_TASK, 0)
+        self.assertGreaterEqual(LIVE_RATE.positive, self.data_generator.num_merchants)
+        self.assertGreater(LIVE_RATE.total, LIVE_RATE.positive)
+        merchants_and_results2 = self.factory.generate_merchants(validator)
+        merchants1 = MerchantFactory.get_merchants_from_results(merchants_and_results1)
+        merchants2 = MerchantFactory.get_merchants_from_results(merchants_and_results2)
+        self.assertEqual(len(set(merchants1)), self.data_generator.num_merchants)
+        for merchant1, merchant2 in zip(merchants1, merchants2):
+            self.assertGreater(merchant1.annual_top_line(self.data_generator.start_date), min_top_line)
+            self.assertEqual(merchant1.stream_key, merchant2.stream_key)
+
+    def test_pool_batch_size(self):
+        num_workers = multiprocessing.cpu_count()
+        self.assertEqual(MerchantFactory.pool_batch_size(100, 0, 0), num_workers)
+        self.assertEqual(MerchantFactory.pool_batch_size(1, 100, 100), num_workers)
+        self.assertEqual(MerchantFactory.pool_batch_size(10 ** 6, 0, 100),
+            num_workers * constants.TASK_CHUNKS_PER_WORKER)
+        num_remaining = num_workers * constants.POOL_CANDIDATES_PER_TASK
+        self.assertEqual(MerchantFactory.pool_batch_size(num_remaining, 50, 100), 2 * num_workers)
+
+    def test_generate_pushdown_validator(self):
+        top_line = self.merchant.annual_top_line(self.data_generator.start_date)
+        conditions = [Condition('annual_top_line', min_value=top_line + 1),
+            Condition('total_credit', LoanSimulationType.DEFAULT, O)]
+        self.assertTrue(conditions[0].can_push_down())
+        self.assertFalse(conditions[1].can_push_down())
+        self.assertIsNone(self.factory.generate_pushdown_validator(conditions[1:]))
+        self.assertFalse(self.factory.generate_pushdown_validator(conditions)(self.merchant))
+        conditions[0].min_value = top_line - 1
+        self.assertTrue(self.factory.generate_pushdown_validator(conditions)(self.merchant))
+        self.assertIsNone(Merchant.generate_simulated(self.data_generator, validator=lambda merchant: False))
+
+    def test_pushdown_valuation(self):
+        loan = LoanSimulation(self.context, self.data_generator, self.merchant.clone())
+        valuation = self.merchant.valuation(self.data_generator.start_date, loan.initial_cash)
+        conditions = [Condition('valuation', min_value=valuation + 1)]
+        self.assertTrue(conditions[0].can_push_down())
+        self.assertFalse(self.factory.generate_pushdown_validator(conditions)(self.merchant))
+        conditions[0].min_value = valuation - 1
+        self.assertTrue(self.factory.generate_pushdown_validator(conditions)(self.merchant))
+        self.assertEqual(self.factory.generate_validator(conditions)(self.merchant), valuation)
+
+    def test_generate_from_conditions_pushdown(self):
+        self.data_generator.seed = 5
+        self.data_generator.num_merchants = 4
+        conditions = [Condition('annual_top_line', max_value=Dollar(10 ** 5))]
+        pushed_down = MerchantFactory.get_merchants_from_results(self.factory.generate_from_conditions(conditions))
+        not_pushed_down = MerchantFactory.get_merchants_from_results(
+            self.factory.generate_merchants(self.factory.generate_validator(conditions)))
+        for merchant1, merchant2 in zip(pushed_down, not_pushed_down):
+            self.assertEqual(merchant1.stream_key, merchant2.stream_key)
+            self.assertEqual(merchant1.suspension_start_date, merchant2.suspension_start_date)
+            self.assertLess(merchant1.annual_top_line(self.data_generator.start_date), Dollar(10 ** 5))
+            for inventory1, inventory2 in zip(merchant1.inventories, merchant2.inventories):
+                self.assertEqual(len(inventory1.batches), len(inventory2.batches))
+                self.assertGreater(inventory1.batches[-1].start_date, self.data_generator.simulated_duration)
+
     @patch('finance.lender.Lender')
     def test_generate_validator(self, lender_mock: MagicMock):
         field_name1 = 'bankruptcy_rate'
@@ -134,8 +260,8 @@ class TestMerchantFactory(StatisticalTestCase):
         margin = Percent(0.3)
         merchant1 = Merchant.generate_simulated(self.data_generator)
         merchant2 = Merchant.generate_simulated(self.data_generator)
-        merchant1.profit_margin = MagicMock(return_value=margin)
-        merchant2.profit_margin = MagicMock(return_value=margin + 0.1)
+        self.mock_method(merchant1, 'profit_margin', MagicMock(return_value=margin))
+        self.mock_method(merchant2, 'profit_margin', MagicMock(return_value=margin + 0.1))
         field_name2 = 'profit_margin'
         condition1 = Condition(field_name1, LoanSimulationType.DEFAULT, min_value=rate)
         condition2 = Condition(field_name1, LoanSimulationType.LINE_OF_CREDIT, min_value=rate)
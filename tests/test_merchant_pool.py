@@ -0,0 +1,89 @@
+import os
+import tempfile
+from unittest.mock import MagicMock
+
+from common.local_enum import LoanSimulationType, LoanRetention, LoanReferenceType
+from common.local_numbers import Dollar, O
+from simulation.merchant_factory import Condition, MerchantFactory
+from simulation.merchant_pool import MerchantPool
+from tests.util_test import BaseTestCase
+
+
+class TestMerchantPool(BaseTestCase):
+    def setUp(self) -> None:
+        super(TestMerchantPool, self).setUp()
+        self.pool_dir = tempfile.TemporaryDirectory()
+        self.data_generator.seed = 7
+        self.data_generator.num_merchants = 4
+        self.data_generator.merchant_pool_dir = self.pool_dir.name
+        self.conditions = [Condition('annual_top_line', min_value=Dollar(10 ** 5))]
+
+    def tearDown(self) -> None:
+        self.pool_dir.cleanup()
+
+    def stream_keys(self, merchants_and_results) -> list:
+        return [merchant.stream_key for merchant in MerchantFactory.get_merchants_from_results(merchants_and_results)]
+
+    def test_draw(self):
+        merchants_and_results = self.factory.generate_from_conditions(self.conditions)
+        pool = MerchantPool(self.factory, self.conditions)
+        self.assertTrue(os.path.exists(pool.filename()))
+        self.assertEqual(len(pool.entries), self.data_generator.num_merchants)
+        self.assertEqual(pool.next_merchant_index(), self.data_generator.num_merchants)
+        self.factory.generate_merchants = MagicMock()
+        pooled_merchants_and_results = self.factory.generate_from_conditions(self.conditions)
+        self.factory.generate_merchants.assert_not_called()
+        self.assertEqual(self.stream_keys(merchants_and_results), self.stream_keys(pooled_merchants_and_results))
+        for (merchant, result), (pooled_merchant, pooled_result) in zip(
+                merchants_and_results, pooled_merchants_and_results):
+            self.assertEqual(
+                merchant.annual_top_line(self.data_generator.start_date),
+                pooled_merchant.annual_top_line(self.data_generator.start_date))
+            self.assertEqual(result, pooled_result)
+
+    def test_reuse_validator_results(self):
+        merchants_and_results = self.factory.generate_from_conditions(self.conditions)
+        pool = MerchantPool(self.factory, self.conditions)
+        validator_fingerprint = pool.validator_fingerprint()
+        self.assertEqual(
+            [entry['validator_fingerprint'] for entry in pool.entries], [validator_fingerprint] * len(pool.entries))
+        pooled_merchants_and_results = pool.draw(lambda merchant: None)
+        self.assertEqual(self.stream_keys(merchants_and_results), self.stream_keys(pooled_merchants_and_results))
+        self.assertEqual([result for _, result in merchants_and_results],
+            [result for _, result in pooled_merchants_and_results])
+        self.context.forked_simulation = True
+        pool = MerchantPool(self.factory, self.conditions)
+        self.assertEqual(len(pool.entries), self.data_generator.num_merchants)
+        self.assertNotEqual(pool.validator_fingerprint(), validator_fingerprint)
+        self.factory.generate_merchants = MagicMock(return_value=[])
+        self.assertEqual(pool.draw(lambda merchant: None), [])
+        self.assertEqual(MerchantPool(self.factory, self.conditions).entries, [])
+
+    def test_top_up(self):
+        merchants_and_results = self.factory.generate_from_conditions(self.conditions)
+        self.data_generator.num_merchants = 6
+        topped_up = self.factory.generate_from_conditions(self.conditions)
+        self.assertEqual(len(topped_up), 6)
+        self.assertEqual(len(set(self.stream_keys(topped_up))), 6)
+        self.assertEqual(len(MerchantPool(self.factory, self.conditions).entries), 6)
+        self.data_generator.num_merchants = 4
+        self.assertEqual(
+            self.stream_keys(self.factory.generate_from_conditions(self.conditions)),
+            self.stream_keys(merchants_and_results))
+
+    def test_key(self):
+        key = MerchantPool(self.factory, self.conditions).key()
+        self.assertEqual(key, MerchantPool(self.factory, list(self.conditions)).key())
+        self.assertNotEqual(key, MerchantPool(
+            self.factory, [Condition('total_credit', LoanSimulationType.DEFAULT, O)]).key())
+        self.data_generator.num_merchants *= 2
+        self.assertEqual(key, MerchantPool(self.factory, self.conditions).key())
+        self.context.loan_retention = LoanRetention.SUMMARY
+        self.context.forked_simulation = True
+        self.context.baseline_cache = True
+        self.assertEqual(key, MerchantPool(self.factory, self.conditions).key())
+        self.context.loan_reference_type = LoanReferenceType.TOTAL_INTEREST
+        self.assertNotEqual(key, MerchantPool(self.factory, self.conditions).key())
+        self.context.loan_reference_type = None
+        self.data_generator.initial_cash_ratio *= 2
+        self.assertNotEqual(key, MerchantPool(self.factory, self.conditions).key())
@@ -1,8 +1,10 @@
+import pickle
+from copy import deepcopy
 from unittest import TestCase
 
 from common import constants
 from common.local_numbers import Float, TWO, human_format, ONE, Int, human_format_duration, Duration, \
-    calculate_decimal_figures
+    calculate_decimal_figures, float_equals
 from tests.util_test import BaseTestCase
 
 
@@ -58,6 +60,15 @@ class TestFloat(BaseTestCase):
         self.assertTrue(type(Float.min([])), Float)
         self.assertTrue(type(Float.sum([1, 2])), Float)
 
+    def test_copy(self):
+        for number in [Float(1.5), Int(2), Duration(3)]:
+            self.assertIs(deepcopy(number), number)
+            unpickled = pickle.loads(pickle.dumps(number))
+            self.assertIs(type(unpickled), type(number))
+            self.assertEqual(unpickled, number)
+            with self.assertRaises(AttributeError):
+                number.value = 1
+
     def test_average(self):
         self.assertEqual(Float.mean([1, 2, 3]), Float(2))
 
@@ -70,6 +81,12 @@ class TestFloat(BaseTestCase):
         self.assertFalse(Float(10).is_close(10 * ((1 + constants.FLOAT_CLOSE_TOLERANCE) ** 2)))
         self.assertFalse(Float(0).is_close(0 + constants.FLOAT_CLOSE_TOLERANCE + 0.01))
 
+    def test_float_equals(self):
+        self.assertTrue(float_equals(1.0, 1.000000001))
+        self.assertTrue(float_equals(0.0, constants.FLOAT_EQUALITY_TOLERANCE))
+        self.assertFalse(float_equals(0.0, constants.FLOAT_EQUALITY_TOLERANCE * 2))
+        self.assertEqual(float_equals(1.0, 1.000000001), ONE == Float(1.000000001))
+
     def test_from_human_format(self):
         self.assertEqual(Float.from_human_format('1M'), 10 ** 6)
         self.assertEqual(Float.from_human_format('1000T'), 10 ** 15)
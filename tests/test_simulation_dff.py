@@ -113,11 +113,11 @@ class TestLoanSimulationDiff(BaseTestCase):
             expected_values = [attribute_func(Date(day)) for day in
                 range(self.data_generator.start_date, self.loan1.today + 1)]
             expected_values[-1] -= ONE
-            setattr(self.loan2.merchant, attribute, MagicMock(side_effect=expected_values))
+            self.mock_method(self.loan2.merchant, attribute, MagicMock(side_effect=expected_values))
             self.lsd.merchant_attribute_diff(attribute, self.loan1.today, self.loan2.today)
             self.assertDeepAlmostEqual(
                 self.lsd.diff, {'merchant': {attribute: {self.loan1.today: ONE}}})
-            setattr(self.loan2.merchant, attribute, attribute_func)
+            self.mock_method(self.loan2.merchant, attribute, attribute_func)
             self.lsd.merchant_attribute_diff(attribute, self.loan1.today, self.loan2.today)
             self.assertDeepAlmostEqual(self.lsd.diff, {'merchant': {}})
 
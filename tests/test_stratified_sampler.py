@@ -0,0 +1,116 @@
+import numpy as np
+
+from common import constants
+from common.local_numbers import Dollar, Duration
+from seller.merchant import Merchant
+from simulation.merchant_factory import Condition, MerchantFactory
+from simulation.stratified_sampler import StratifiedSampler
+from tests.util_test import BaseTestCase
+
+
+class TestStratifiedSampler(BaseTestCase):
+    def setUp(self) -> None:
+        super(TestStratifiedSampler, self).setUp()
+        self.data_generator.seed = 11
+        self.data_generator.calibration_sample_size = 40
+        self.sampler = StratifiedSampler(self.data_generator)
+
+    def test_calibrate(self):
+        self.sampler.calibrate(lambda merchant: merchant.num_products() >= 5, partial=True)
+        self.assertTrue(self.sampler.is_calibrated())
+        self.assertEqual(sum(self.sampler.tried.values()), self.data_generator.calibration_sample_size)
+        self.assertEqual(self.sampler.strata, sorted(self.sampler.num_products_distribution().keys()))
+        probabilities = dict(zip(self.sampler.strata, np.diff(self.sampler.cumulative_probabilities, prepend=0)))
+        self.assertGreater(sum([probabilities[num_products] for num_products in self.sampler.strata if
+            num_products >= 5]), 0.9)
+        self.assertLess(self.sampler.acceptance_rate(), 1)
+        self.assertEqual(self.sampler.choose_stratum(3, 0), self.sampler.choose_stratum(3, 0))
+        self.assertIn(self.sampler.choose_stratum(3, 0), self.sampler.strata)
+        for num_products, probability in probabilities.items():
+            self.assertAlmostEqual(self.sampler.sampling_weight(num_products) * probability,
+                self.sampler.num_products_distribution()[num_products])
+
+    def test_calibrate_top_line_range(self):
+        self.sampler.set_top_line_range(10 ** 6, None)
+        self.sampler.calibrate(lambda merchant: merchant.annual_top_line(self.data_generator.start_date) > 10 ** 6)
+        self.assertTrue(self.sampler.is_calibrated())
+        self.assertEqual(len(self.sampler.product_top_lines), sum(
+            [num_products * tried for num_products, tried in self.sampler.tried.items()]))
+        self.assertGreater(self.sampler.stratum_acceptance_rate(max(self.sampler.strata)), 0)
+        self.assertGreater(
+            self.sampler.stratum_acceptance_rate(max(self.sampler.strata)), self.sampler.stratum_acceptance_rate(1))
+
+    def test_num_products_distribution(self):
+        num_products_distribution = self.sampler.num_products_distribution()
+        self.assertAlmostEqual(sum(num_products_distribution.values()), 1)
+        self.assertEqual(min(num_products_distribution.keys()), 1)
+        self.assertLessEqual(max(num_products_distribution.keys()), self.data_generator.max_num_products)
+        counts = {}
+        with self.data_generator.random_stream(constants.CALIBRATION_STREAM_KEY):
+            for _ in range(constants.CALIBRATION_BOOTSTRAP_SIZE):
+                num_products = int(Merchant.generate_num_products(self.data_generator))
+                counts[num_products] = counts.get(num_products, 0) + 1
+        for num_products, mass in num_products_distribution.items():
+            self.assertAlmostEqual(counts.get(num_products, 0) / constants.CALIBRATION_BOOTSTRAP_SIZE, mass, delta=0.01)
+
+    def test_stratified_matches_rejection_sampling(self):
+        self.data_generator.simulated_duration = Duration(constants.MONTH)
+        num_merchants = 1000
+
+        def validator(merchant: Merchant) -> bool:
+            return merchant.annual_top_line(self.data_generator.start_date) > 2 * 10 ** 5 and \
+                   merchant.num_products() <= 10
+
+        rejection_sampled = []
+        attempt = 0
+        while len(rejection_sampled) < num_merchants:
+            merchant = Merchant.generate_from_stream(self.data_generator, 0, attempt, validator=validator)
+            attempt += 1
+            if merchant is not None:
+                rejection_sampled.append(int(merchant.num_products()))
+        self.sampler.set_top_line_range(2 * 10 ** 5, None)
+        self.sampler.calibrate(validator, partial=True)
+        self.assertTrue(set(self.sampler.strata).issuperset(set(rejection_sampled)))
+        factory = MerchantFactory(self.data_generator, self.context)
+        stratified = [factory.merchant_generation_iteration(
+            lambda _: True, merchant_index=i, pushdown_validator=validator, sampler=self.sampler)[0] for i in
+            range(num_merchants)]
+        num_products = np.array([int(merchant.num_products()) for merchant in stratified])
+        sampling_weights = np.array([merchant.sampling_weight for merchant in stratified])
+        sampling_weights /= sampling_weights.sum()
+        self.assertLessEqual(num_products.max(), 10)
+        strata = set(rejection_sampled) | set(num_products)
+        total_variation = sum([abs(rejection_sampled.count(stratum) / num_merchants - sampling_weights[
+            num_products == stratum].sum()) for stratum in strata]) / 2
+        unweighted_total_variation = sum([abs(rejection_sampled.count(stratum) - np.sum(
+            num_products == stratum)) for stratum in strata]) / (2 * num_merchants)
+        self.assertLess(total_variation, 0.1)
+        self.assertLess(total_variation, unweighted_total_variation)
+        self.assertAlmostEqual(np.mean(rejection_sampled), np.average(num_products, weights=sampling_weights),
+            delta=0.5)
+
+    def test_max_merchant_attempts(self):
+        self.data_generator.max_merchant_attempts = 5
+        factory = MerchantFactory(self.data_generator, self.context)
+        with self.assertRaises(RuntimeError):
+            factory.merchant_generation_iteration(lambda _: False)
+
+    def test_not_calibrated(self):
+        self.sampler.calibrate(lambda merchant: False)
+        self.assertFalse(self.sampler.is_calibrated())
+
+    def test_generate_stratified_merchants(self):
+        self.data_generator.stratified_sampling = True
+        self.data_generator.num_merchants = 4
+        factory = MerchantFactory(self.data_generator, self.context)
+        merchants = MerchantFactory.get_merchants_from_results(
+            factory.generate_from_conditions([Condition('annual_top_line', min_value=Dollar(10 ** 6))]))
+        for merchant in merchants:
+            self.assertIsNotNone(merchant.num_products_stratum)
+            self.assertEqual(merchant.num_products(), merchant.num_products_stratum)
+            self.assertGreater(merchant.annual_top_line(self.data_generator.start_date), Dollar(10 ** 6))
+            regenerated = Merchant.generate_from_stream(
+                self.data_generator, *merchant.stream_key, num_products_stratum=merchant.num_products_stratum)
+            self.assertEqual(
+                regenerated.annual_top_line(self.data_generator.start_date),
+                merchant.annual_top_line(self.data_generator.start_date))
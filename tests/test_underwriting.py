@@ -1,16 +1,40 @@
 from copy import deepcopy
 from random import random
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
-from common.context import DataGenerator, SimulationContext, RiskContext
-from common.local_numbers import ONE, TWO, Float
-from common.util import weighted_average
+import numpy as np
+
+from common import constants
+from common.context import DataGenerator, SimulationContext, RiskContext, RiskConfiguration
+from common.local_numbers import ONE, TWO, Float, O, Percent, Ratio, Date
+from common.util import weighted_average, min_max
 from finance.risk_entity import RiskEntity
-from finance.underwriting import Underwriting
+from finance.underwriting import Underwriting, CompiledScorer, COMPILED_SCORERS
 from seller.merchant import Merchant
 from statistical_tests.statistical_util import statistical_test_bool, StatisticalTestCase
 
 
+def benchmark_comparison(benchmark: Float, value: Float, higher_is_better: bool, sensitivity: Ratio) -> Percent:
+    assert benchmark > O
+    if higher_is_better:
+        if value <= O:
+            return O
+        ratio = value / benchmark
+    else:
+        if value <= O:
+            return ONE
+        ratio = benchmark / value
+    ratio = sensitivity * (ratio - 0.5) + 0.5
+    return min_max(ratio, O, ONE)
+
+
+def benchmark_score(context: SimulationContext, entity: RiskEntity, predictor: str, day: Date) -> Percent:
+    configuration: RiskConfiguration = getattr(context.risk_context, predictor)
+    benchmark = getattr(context, Underwriting.benchmark_variable_name(predictor))
+    value = getattr(entity, Underwriting.risk_entity_method_name(predictor))(day)
+    return benchmark_comparison(benchmark, value, configuration.higher_is_better, configuration.sensitivity)
+
+
 class TestUnderwriting(StatisticalTestCase):
     def setUp(self) -> None:
         super(TestUnderwriting, self).setUp()
@@ -23,7 +47,7 @@ class TestUnderwriting(StatisticalTestCase):
         return self.merchant.inventories[0].batches[0]
 
     def mock_entity_value(self, entity: RiskEntity, value: Float, predictor: str):
-        setattr(entity, Underwriting.risk_entity_method_name(predictor), MagicMock(return_value=value))
+        self.mock_method(entity, Underwriting.risk_entity_method_name(predictor), MagicMock(return_value=value))
 
     def test_init(self):
         for _, configuration in vars(self.underwriting.initial_risk_context).items():
@@ -31,31 +55,81 @@ class TestUnderwriting(StatisticalTestCase):
 
     def test_calculate_score(self):
         scores = [random() for _ in self.context.risk_context.to_dict().keys()]
-        self.underwriting.benchmark_score = MagicMock(side_effect=scores)
+        self.underwriting.predictor_scores = MagicMock(return_value=np.array(scores))
         risk_context = self.underwriting.calculate_score(self.merchant, self.data_generator.start_date)
         self.assertDeepAlmostEqual([c.score for c in vars(risk_context).values()], scores)
-        self.underwriting.benchmark_score = MagicMock(side_effect=scores)
         risk_context = self.underwriting.calculate_score(self.first_batch(), self.data_generator.start_date)
         self.assertDeepAlmostEqual([c.score for c in vars(risk_context).values()], scores)
 
+    def test_predictor_scores(self):
+        day = self.data_generator.start_date
+        for entity in [self.merchant, self.first_batch()]:
+            for predictor in self.context.risk_context.to_dict().keys():
+                self.mock_entity_value(entity, Float(random() * 2), predictor)
+            underwriting = Underwriting(self.context, self.data_generator, entity)
+            self.assertDeepAlmostEqual(
+                [Float(score) for score in underwriting.predictor_scores(entity, day)],
+                [benchmark_score(self.context, entity, p, day) for p in underwriting.scorer.predictors])
+            self.assertIs(underwriting.predictor_accessors(entity), underwriting.predictor_accessors(entity))
+
+    def test_scorer_cache(self):
+        self.assertIs(self.underwriting.scorer, Underwriting(self.context, self.data_generator, self.merchant).scorer)
+        context = deepcopy(self.context)
+        context.risk_context.roas.threshold = Float(0.5)
+        scorer = Underwriting(context, self.data_generator, self.merchant).scorer
+        self.assertIsNot(self.underwriting.scorer, scorer)
+        self.assertAlmostEqual(scorer.thresholds[scorer.predictors.index('roas')], 0.5)
+        self.assertIs(scorer, CompiledScorer.from_context(deepcopy(context)))
+
+    def test_scorer_cache_size(self):
+        for i in range(constants.COMPILED_SCORERS_CACHE_SIZE + 1):
+            context = deepcopy(self.context)
+            context.min_risk_score = Float(i / 100)
+            CompiledScorer.from_context(context)
+            CompiledScorer.from_context(self.context)
+        self.assertEqual(len(COMPILED_SCORERS), constants.COMPILED_SCORERS_CACHE_SIZE)
+        self.assertIs(self.underwriting.scorer, CompiledScorer.from_context(self.context))
+
+    def test_compiled_scorer(self):
+        scorer = self.underwriting.scorer
+        days = [self.data_generator.start_date + i * constants.MONTH for i in range(6)]
+        entities = [self.merchant if i % 2 == 0 else self.first_batch() for i in range(len(days))]
+        scores, aggregated_scores, approved = scorer.score_entities(entities, days)
+        self.assertEqual(scores.shape, (len(days), len(scorer.predictors)))
+        for i, (entity, day) in enumerate(zip(entities, days)):
+            self.assertDeepAlmostEqual(
+                [Float(score) for score in scores[i]],
+                [benchmark_score(self.context, entity, p, day) for p in scorer.predictors])
+            risk_context = self.underwriting.calculate_score(entity, day)
+            self.assertEqual(Float(aggregated_scores[i]), self.underwriting.aggregated_score(risk_context))
+            self.assertEqual(approved[i], self.underwriting.approved(entity, day))
+
+    def test_compiled_scorer_edge_values(self):
+        scorer = self.underwriting.scorer
+        values = np.zeros((1, len(scorer.predictors)))
+        expected = np.where(scorer.higher_is_better, 0, 1)
+        self.assertDeepAlmostEqual(list(scorer.score(values)[0]), list(expected))
+        self.assertFalse(scorer.approved(scorer.score(values))[0])
+        self.assertTrue(scorer.approved(scorer.score(scorer.benchmarks))[()])
+
     def test_benchmark_comparison(self):
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, ONE, True, ONE), ONE)
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, ONE + 0.1, True, ONE), ONE)
+        self.assertEqual(benchmark_comparison(ONE, ONE, True, ONE), ONE)
+        self.assertEqual(benchmark_comparison(ONE, ONE + 0.1, True, ONE), ONE)
 
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, ONE, False, ONE), ONE)
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, ONE - 0.1, False, ONE), ONE)
+        self.assertEqual(benchmark_comparison(ONE, ONE, False, ONE), ONE)
+        self.assertEqual(benchmark_comparison(ONE, ONE - 0.1, False, ONE), ONE)
 
-        self.assertEqual(self.underwriting.benchmark_comparison(TWO, ONE, True, ONE), ONE / 2)
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, TWO, False, ONE), ONE / 2)
+        self.assertEqual(benchmark_comparison(TWO, ONE, True, ONE), ONE / 2)
+        self.assertEqual(benchmark_comparison(ONE, TWO, False, ONE), ONE / 2)
 
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, ONE, True, TWO), ONE)
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, ONE, False, TWO), ONE)
+        self.assertEqual(benchmark_comparison(ONE, ONE, True, TWO), ONE)
+        self.assertEqual(benchmark_comparison(ONE, ONE, False, TWO), ONE)
 
-        self.assertEqual(self.underwriting.benchmark_comparison(TWO, ONE, True, TWO), ONE / 2)
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, TWO, False, TWO), ONE / 2)
+        self.assertEqual(benchmark_comparison(TWO, ONE, True, TWO), ONE / 2)
+        self.assertEqual(benchmark_comparison(ONE, TWO, False, TWO), ONE / 2)
 
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE * 3, ONE, True, TWO), ONE / 6)
-        self.assertEqual(self.underwriting.benchmark_comparison(ONE, ONE * 3, False, TWO), ONE / 6)
+        self.assertEqual(benchmark_comparison(ONE * 3, ONE, True, TWO), ONE / 6)
+        self.assertEqual(benchmark_comparison(ONE, ONE * 3, False, TWO), ONE / 6)
 
     def test_benchmark_score(self):
         for predictor, configuration in vars(self.context.risk_context).items():
@@ -63,16 +137,15 @@ class TestUnderwriting(StatisticalTestCase):
             self.mock_entity_value(self.merchant, benchmark, predictor)
             self.mock_entity_value(self.first_batch(), benchmark, predictor)
             self.assertEqual(
-                self.underwriting.benchmark_score(self.merchant, predictor, self.data_generator.start_date), ONE)
+                benchmark_score(self.context, self.merchant, predictor, self.data_generator.start_date), ONE)
             if hasattr(self.data_generator, f'{predictor}_median'):
                 median = getattr(self.data_generator, f'{predictor}_median')
                 self.mock_entity_value(self.merchant, median, predictor)
                 self.mock_entity_value(self.first_batch(), median, predictor)
                 self.assertLess(
-                    self.underwriting.benchmark_score(self.merchant, predictor, self.data_generator.start_date), ONE)
+                    benchmark_score(self.context, self.merchant, predictor, self.data_generator.start_date), ONE)
                 self.assertLess(
-                    self.underwriting.benchmark_score(self.first_batch(), predictor, self.data_generator.start_date),
-                    ONE)
+                    benchmark_score(self.context, self.first_batch(), predictor, self.data_generator.start_date), ONE)
 
     def test_aggregated_score(self):
         scores = [random() for _ in range(len(list(vars(self.context.risk_context))))]
@@ -88,7 +161,8 @@ class TestUnderwriting(StatisticalTestCase):
         for predictor in vars(risk_context).keys():
             risk_configuration = getattr(risk_context, predictor)
             risk_configuration.score = ONE
-        self.underwriting.calculate_score = MagicMock(return_value=risk_context)
+        self.underwriting.predictor_scores = MagicMock(
+            side_effect=lambda *args: self.underwriting.scorer.risk_context_scores(risk_context))
         self.assertTrue(self.underwriting.approved(self.merchant, self.data_generator.start_date))
         self.assertTrue(self.underwriting.approved(self.first_batch(), self.data_generator.start_date))
         for configuration in vars(risk_context).values():
@@ -96,9 +170,20 @@ class TestUnderwriting(StatisticalTestCase):
             self.assertFalse(self.underwriting.approved(self.merchant, self.data_generator.start_date))
             self.assertFalse(self.underwriting.approved(self.first_batch(), self.data_generator.start_date))
             configuration.score = 1
-        self.underwriting.aggregated_score = MagicMock(return_value=self.context.min_risk_score - 0.01)
-        self.assertFalse(self.underwriting.approved(self.merchant, self.data_generator.start_date))
-        self.assertFalse(self.underwriting.approved(self.first_batch(), self.data_generator.start_date))
+        with patch.object(
+                CompiledScorer, 'aggregated_score', return_value=np.array(self.context.min_risk_score - 0.01)):
+            self.assertFalse(self.underwriting.approved(self.merchant, self.data_generator.start_date))
+            self.assertFalse(self.underwriting.approved(self.first_batch(), self.data_generator.start_date))
+
+    def test_approved_risk_context(self):
+        risk_context = RiskContext()
+        for configuration in vars(risk_context).values():
+            configuration.score = ONE
+        self.underwriting.predictor_scores = MagicMock()
+        self.assertTrue(self.underwriting.approved(self.merchant, self.data_generator.start_date, risk_context))
+        getattr(risk_context, self.underwriting.scorer.predictors[0]).score = O
+        self.assertFalse(self.underwriting.approved(self.merchant, self.data_generator.start_date, risk_context))
+        self.underwriting.predictor_scores.assert_not_called()
 
     def test_risk_factors(self):
         def test_factor(data_generator: DataGenerator, context: SimulationContext, *args, **kwargs):
@@ -113,8 +198,9 @@ class TestUnderwriting(StatisticalTestCase):
             merchant1 = Merchant.generate_simulated(data_generator)
             merchant2 = deepcopy(merchant1)
             benchmark = getattr(context, f'{_predictor}_benchmark')
-            setattr(merchant1, Underwriting.risk_entity_method_name(_predictor), return_benchmark)
-            setattr(merchant2, Underwriting.risk_entity_method_name(_predictor), return_benchmark_multiplied)
+            method_name = Underwriting.risk_entity_method_name(_predictor)
+            self.mock_method(merchant1, method_name, MagicMock(side_effect=return_benchmark))
+            self.mock_method(merchant2, method_name, MagicMock(side_effect=return_benchmark_multiplied))
             underwriting1 = Underwriting(context, data_generator, merchant1)
             underwriting2 = Underwriting(context, data_generator, merchant2)
             is_true.append(
@@ -1,5 +1,7 @@
 from random import uniform
 
+import numpy as np
+
 from common import constants
 from common.local_numbers import Float, O, ONE, TWO, Int, Duration
 from common.util import calculate_cagr, min_max, weighted_average, inverse_cagr
@@ -24,6 +26,7 @@ class TestUtil(BaseTestCase):
         self.assertTrue(type(min_max(Int(3), 2, 3)), Int)
         self.assertTrue(type(min_max(Float(3), 2, 3)), Float)
         self.assertTrue(type(min_max(Duration(3), 2, 3)), Duration)
+        self.assertEqual(list(min_max(np.array([1, 2.5, 4]), 2, 3)), [2, 2.5, 3])
 
     def test_weighted_average(self):
         self.assertEqual(weighted_average([1, 1], [2, 2]), 1)
@@ -36,4 +39,8 @@ class TestUtil(BaseTestCase):
         self.assertEqual(inverse_cagr(cagr, constants.YEAR / 2), (1 + cagr) ** 0.5 - 1)
         self.assertEqual(inverse_cagr(O, constants.YEAR), -ONE)
         self.assertEqual(inverse_cagr(-ONE, constants.YEAR), -ONE)
+        durations = np.array([constants.YEAR, constants.YEAR / 2])
+        for rate, duration in zip(inverse_cagr(cagr, durations), durations):
+            self.assertAlmostEqual(rate, inverse_cagr(cagr, duration))
+        self.assertEqual(list(inverse_cagr(O, durations)), [-1, -1])
 
@@ -1,7 +1,9 @@
+import inspect
 import logging
 import sys
-from typing import TypeVar
+from typing import Any, Dict, Tuple, TypeVar
 from unittest import TestCase
+from unittest.mock import patch
 
 import numpy
 from numpy.compat import long
@@ -12,6 +14,17 @@ from simulation.merchant_factory import MerchantFactory
 T = TypeVar('T')
 
 
+class InstanceMocks:
+    def __init__(self, original: Any):
+        self.original = original
+        self.mocks: Dict[int, Tuple[Any, Any]] = {}
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        if instance is not None and id(instance) in self.mocks:
+            return self.mocks[id(instance)][1]
+        return self.original.__get__(instance, owner)
+
+
 class BaseTestCase(TestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -29,6 +42,17 @@ class BaseTestCase(TestCase):
         self.context = SimulationContext.generate_context()
         self.factory = MerchantFactory(self.data_generator, self.context)
 
+    def mock_method(self, obj: Any, name: str, mock: Any) -> Any:
+        cls = type(obj)
+        instance_mocks = cls.__dict__.get(name)
+        if not isinstance(instance_mocks, InstanceMocks):
+            instance_mocks = InstanceMocks(inspect.getattr_static(cls, name))
+            patcher = patch.object(cls, name, instance_mocks)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        instance_mocks.mocks[id(obj)] = (obj, mock)
+        return mock
+
     # noinspection PyUnresolvedReferences
     def assertDeepAlmostEqual(self, expected: T, actual: T, *args, **kwargs):
         """